@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import numpy as np
+from PyQt5 import QtCore
+from bboxee import schema
+from bboxee.label_map import read_label_map
+from bboxee.progress import ProgressThrottle
+from bboxee.annotator import tiling
+from bboxee.annotator.frame_cache import decode
+from bboxee.annotator.burst import BurstTracker
+from bboxee.annotator.postprocess import Postprocessor
+
+
+class BaseAnnotator(QtCore.QThread):
+    """Threaded worker to keep gui from freezing while annotating images.
+
+    Backends implement load_model() and detect(), the image loop and the
+    conversion of detections to annotations are shared.
+
+    progress is throttled, it carries the count and name of the latest
+    image and a dictionary of every entry produced since the last report.
+    """
+
+    progress = QtCore.pyqtSignal(int, str, dict)
+    finished = QtCore.pyqtSignal(dict)
+    model_loaded = QtCore.pyqtSignal()
+
+    def __init__(self, label_map):
+        """Class init function."""
+        QtCore.QThread.__init__(self)
+        self.stop = False
+        self.image_list = []
+        self.threshold = 0.95
+        self.starting_image = 0
+        self.image_directory = ''
+        self.data = None
+        self.label_map = self.build_label_map(label_map)
+        # Tiled inference is disabled when tile_size is 0
+        self.tile_size = 0
+        self.tile_overlap = 0.2
+        self.tile_batch = 4
+        # Fixed batch dimension of the model input, 0 when it is dynamic
+        self.batch_limit = 0
+        self.nms_threshold = 0.5
+        # Optional suppression and per image cap on untiled detections
+        self.postprocess_nms = 0.0
+        self.top_k = 0
+        self.postprocessor = Postprocessor(self.label_map)
+        # Reuse detections across near identical burst frames
+        self.skip_bursts = False
+        self.burst = BurstTracker()
+        # Optional check that skips the detector on likely empty frames
+        self.prefilter = None
+        # Optional disk cache of decoded frames shared between runs
+        self.frame_cache = None
+        # Width and height of a fixed size model input, None when the
+        # model takes frames at any size
+        self.input_size = None
+        self.throttle = ProgressThrottle()
+        self.pending = {}
+        self.last_report = (0, '')
+
+    def build_label_map(self, file_name):
+        return read_label_map(file_name)
+
+    def build_entry(self, boxes, scores, classes):
+        """Convert detections above the threshold to an annotation file entry."""
+        return self.postprocessor.entry(boxes, scores, classes)
+
+    def detect(self, batch):
+        """Run the model on a batch of images.
+
+        Args:
+            batch (np.array): [N, H, W, 3] uint8 images
+
+        Returns:
+            tuple: boxes [N, K, 4] normalized ymin, xmin, ymax, xmax,
+                scores [N, K] and classes [N, K]
+        """
+        raise NotImplementedError
+
+    def detect_image(self, image_np):
+        """Run the model on a single image, tiling it if enabled."""
+        height, width = image_np.shape[0:2]
+        if self.tile_size > 0 and max(height, width) > self.tile_size:
+            tile_batch = self.tile_batch
+            if self.batch_limit > 0:
+                tile_batch = min(tile_batch, self.batch_limit)
+            return tiling.detect_tiled(self.detect,
+                                       image_np,
+                                       self.tile_size,
+                                       self.tile_overlap,
+                                       tile_batch,
+                                       self.nms_threshold,
+                                       min_score=self.threshold)
+        # Expand dimensions since the model expects images
+        # to have shape: [1, None, None, 3]
+        boxes, scores, classes = self.detect(np.expand_dims(image_np, axis=0))
+        return boxes[0], scores[0], classes[0]
+
+    def frame_size(self):
+        """Size frames are decoded at, None for full resolution."""
+        if self.tile_size > 0:
+            return None
+        return self.input_size
+
+    def load_image(self, file_name):
+        """Decode an image, or read it from the frame cache if enabled.
+
+        Frames are reduced to the input size of a fixed size model either
+        way, so the cache never changes the detections.
+        """
+        if self.frame_cache is not None:
+            return self.frame_cache.load(file_name, self.frame_size())
+        return decode(file_name, self.frame_size())
+
+    def load_model(self):
+        """Load the model, called from the worker thread."""
+        raise NotImplementedError
+
+    def release_model(self):
+        """Release resources held between images of a run."""
+        pass
+
+    def run(self):
+        """The starting point for the thread."""
+        self.stop = False
+        self.data = schema.annotation_file()
+        self.data['analysts'].append('Machine Generated')
+        self.postprocessor.threshold = self.threshold
+        self.postprocessor.nms_threshold = self.postprocess_nms
+        self.postprocessor.top_k = self.top_k
+        self.burst.reset()
+        self.burst.skipped = 0
+        self.throttle.reset()
+        self.pending = {}
+        self.last_report = (0, '')
+        if self.prefilter is not None:
+            self.prefilter.reset()
+            self.data['prefiltered'] = []
+        self.load_model()
+        self.model_loaded.emit()
+        for count, img in enumerate(self.image_list):
+            if count >= self.starting_image:
+                if self.stop:
+                    break
+                file_name = os.path.join(self.image_directory, img)
+                if os.path.exists(file_name):
+                    if self.prefilter is not None and self.prefilter.is_empty(file_name):
+                        self.data['prefiltered'].append(img)
+                        self.report(count + 1, img, schema.annotation_file_entry())
+                        continue
+                    entry = None
+                    if self.skip_bursts:
+                        entry = self.burst.match(file_name)
+                    if entry is None:
+                        image_np = self.load_image(file_name)
+                        boxes, scores, classes = self.detect_image(image_np)
+                        entry = self.build_entry(boxes, scores, classes)
+                        if self.skip_bursts:
+                            self.burst.remember(entry)
+                    if len(entry['annotations']) > 0:
+                        self.data['images'][img] = entry
+                    self.report(count + 1, img, entry)
+        self.report(0, '', None, flush=True)
+        self.release_model()
+        self.finished.emit(self.data)
+
+    def report(self, count, image, entry, flush=False):
+        """Queue an entry and emit progress when the throttle allows.
+
+        Args:
+            count (int): Position of the image in the image list
+            image (str): Image name
+            entry (dict): Annotation file entry, None when flushing
+            flush (bool): Emit whatever is pending now
+        """
+        if entry is not None:
+            self.pending[image] = entry
+            self.last_report = (count, image)
+        if len(self.pending) > 0 and self.throttle.ready(flush):
+            count, image = self.last_report
+            self.progress.emit(count, image, self.pending)
+            self.pending = {}
+
+    def stop_annotation(self):
+        self.stop = True
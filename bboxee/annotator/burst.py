@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import copy
+import datetime
+from PIL import Image
+
+HASH_SIZE = 8
+# Exif DateTimeOriginal lives in the Exif sub IFD, DateTime in IFD0
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 36867
+DATE_TIME = 306
+
+
+def capture_time(image):
+    """Capture time of an open image from its EXIF data, None if missing."""
+    try:
+        exif = image.getexif()
+        stamp = exif.get_ifd(EXIF_IFD).get(DATE_TIME_ORIGINAL) or exif.get(DATE_TIME)
+        if stamp is None:
+            return None
+        return datetime.datetime.strptime(stamp.strip('\x00 '), '%Y:%m:%d %H:%M:%S')
+    except (AttributeError, KeyError, ValueError, TypeError):
+        return None
+
+
+def difference_hash(image, size=HASH_SIZE):
+    """Perceptual difference hash of an open image as an integer."""
+    gray = image.convert('L').resize((size + 1, size), Image.BILINEAR)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def signature(file_name):
+    """Capture time and difference hash of an image.
+
+    JPEG images are decoded at reduced scale, so this is much cheaper
+    than loading the frame for inference.
+    """
+    image = Image.open(file_name)
+    stamp = capture_time(image)
+    image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+    value = difference_hash(image)
+    image.close()
+    return stamp, value
+
+
+class BurstTracker(object):
+    """Carry detections from a representative frame to near duplicates.
+
+    Consecutive frames belong to the same burst while their capture times
+    are within max_gap seconds and their difference hash stays within
+    max_distance bits of the frame the model was run on. Frames without
+    EXIF time are grouped on the hash alone.
+    """
+
+    def __init__(self, max_gap=2.0, max_distance=6):
+        """Class init function.
+
+        Args:
+            max_gap (float): Seconds between frames of the same burst
+            max_distance (int): Hamming distance between similar frames
+        """
+        self.max_gap = max_gap
+        self.max_distance = max_distance
+        self.skipped = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the current burst."""
+        self.representative = None
+        self.entry = None
+        self.last_time = None
+        self.current = None
+
+    def match(self, file_name):
+        """Return a copy of the representative entry if file_name is in the
+        current burst, otherwise None.
+
+        The signature of file_name is kept so remember() can make it the
+        new representative.
+        """
+        stamp, value = signature(file_name)
+        self.current = (stamp, value)
+        previous_time = self.last_time
+        self.last_time = stamp
+        if self.representative is None:
+            return None
+        if stamp is not None and previous_time is not None:
+            if abs((stamp - previous_time).total_seconds()) > self.max_gap:
+                return None
+        if bin(value ^ self.representative).count('1') > self.max_distance:
+            return None
+        self.skipped += 1
+        return copy.deepcopy(self.entry)
+
+    def remember(self, entry):
+        """Make the last matched frame the representative of a new burst."""
+        if self.current is not None:
+            self.representative = self.current[1]
+            self.entry = copy.deepcopy(entry)
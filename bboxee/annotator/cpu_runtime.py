@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import numpy as np
+from PIL import Image
+from bboxee.annotator.base import BaseAnnotator
+
+try:
+    import onnxruntime
+except ModuleNotFoundError:
+    onnxruntime = None
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ModuleNotFoundError:
+    try:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    except ModuleNotFoundError:
+        Interpreter = None
+
+
+class Annotator(BaseAnnotator):
+    """Annotate images on the CPU with an exported ONNX or TFLite detector.
+
+    The model is expected to follow the TensorFlow Object Detection API
+    output convention: normalized ymin, xmin, ymax, xmax boxes, scores and
+    class numbers. TFLite detection models number classes from zero, so
+    class_offset defaults to 1 for them to line up with the label map.
+    """
+
+    def __init__(self, model_file, label_map, threads=0):
+        """Class init function.
+
+        Args:
+            model_file (str): Path to a .onnx or .tflite model
+            label_map (str): Path to the label map
+            threads (int): Intra op threads, 0 lets the runtime decide
+        """
+        BaseAnnotator.__init__(self, label_map)
+        self.model_file = model_file
+        self.threads = threads
+        self.runtime = os.path.splitext(model_file)[1].lower()
+        if self.runtime == '.onnx' and onnxruntime is None:
+            raise ModuleNotFoundError('onnxruntime')
+        if self.runtime == '.tflite' and Interpreter is None:
+            raise ModuleNotFoundError('tflite_runtime')
+        if self.runtime not in ('.onnx', '.tflite'):
+            raise ValueError('Unsupported model format: {}'.format(self.runtime))
+        self.class_offset = 1 if self.runtime == '.tflite' else 0
+        self.session = None
+        self.channels_first = False
+        self.interpreter = None
+
+    def detect(self, batch):
+        results = []
+        for image_np in batch:
+            if self.runtime == '.onnx':
+                results.append(self.detect_onnx(image_np))
+            else:
+                results.append(self.detect_tflite(image_np))
+        # Pad to a common number of detections so the batch stacks
+        count = max([len(r[1]) for r in results])
+        boxes = np.zeros((len(results), count, 4), dtype=np.float32)
+        scores = np.zeros((len(results), count), dtype=np.float32)
+        classes = np.zeros((len(results), count), dtype=np.float32)
+        for index, (b, s, c) in enumerate(results):
+            boxes[index, 0:len(s)] = b
+            scores[index, 0:len(s)] = s
+            classes[index, 0:len(s)] = c + self.class_offset
+        return boxes, scores, classes
+
+    def detect_onnx(self, image_np):
+        model_input = self.session.get_inputs()[0]
+        if isinstance(self.input_size, tuple) and image_np.shape[1::-1] != self.input_size:
+            # Static input shape, boxes are normalized so a plain resize
+            # does not change them
+            image_np = np.asarray(Image.fromarray(image_np).resize(self.input_size, Image.BILINEAR))
+        if self.channels_first:
+            image_np = np.transpose(image_np, (2, 0, 1))
+        if 'float' in model_input.type:
+            image_np = image_np.astype(np.float32)
+        outputs = self.session.run(None, {model_input.name: np.expand_dims(image_np, axis=0)})
+        named = dict(zip([o.name for o in self.session.get_outputs()], outputs))
+        return (named['detection_boxes'][0],
+                named['detection_scores'][0],
+                named['detection_classes'][0])
+
+    def detect_tflite(self, image_np):
+        details = self.interpreter.get_input_details()[0]
+        height, width = details['shape'][1:3]
+        image = Image.fromarray(image_np).resize((width, height), Image.BILINEAR)
+        model_input = np.expand_dims(np.asarray(image), axis=0)
+        if details['dtype'] == np.float32:
+            # Float models expect pixels scaled to [-1, 1]
+            model_input = (model_input.astype(np.float32) - 127.5) / 127.5
+        self.interpreter.set_tensor(details['index'], model_input.astype(details['dtype']))
+        self.interpreter.invoke()
+        boxes = scores = classes = None
+        vectors = []
+        for output in self.interpreter.get_output_details():
+            value = self.interpreter.get_tensor(output['index'])[0]
+            if value.ndim == 2 and value.shape[-1] == 4:
+                boxes = value
+            elif 'score' in output['name']:
+                scores = value
+            elif 'class' in output['name']:
+                classes = value
+            elif value.ndim == 1 and value.shape[0] > 1:
+                vectors.append(value)
+        # Exported graphs often lose the output names, class numbers are
+        # whole numbers and scores are not
+        for value in vectors:
+            if classes is None and np.all(np.equal(np.mod(value, 1), 0)):
+                classes = value
+            elif scores is None:
+                scores = value
+        return boxes, scores, classes
+
+    def load_model(self):
+        if self.runtime == '.onnx' and self.session is None:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+            self.session = onnxruntime.InferenceSession(self.model_file,
+                                                        sess_options=options,
+                                                        providers=['CPUExecutionProvider'])
+            shape = self.session.get_inputs()[0].shape
+            # NCHW exports have the three color channels second
+            self.channels_first = len(shape) == 4 and shape[1] == 3
+            height, width = shape[2:4] if self.channels_first else shape[1:3]
+            if isinstance(height, int) and isinstance(width, int):
+                self.input_size = (width, height)
+        elif self.runtime == '.tflite' and self.interpreter is None:
+            self.interpreter = Interpreter(model_path=self.model_file,
+                                           num_threads=self.threads if self.threads > 0 else None)
+            self.interpreter.allocate_tensors()
+            height, width = self.interpreter.get_input_details()[0]['shape'][1:3]
+            self.input_size = (int(width), int(height))
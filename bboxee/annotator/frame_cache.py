@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import hashlib
+import threading
+import numpy as np
+from PIL import Image
+from PyQt5 import QtCore
+
+MAX_BYTES = 4 * 1024 ** 3
+
+
+def frame_cache_directory():
+    """Persistent directory used to store decoded frames."""
+    location = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.GenericCacheLocation)
+    directory = os.path.join(location, 'bboxee', 'frames')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def file_hash(file_name):
+    """Content hash of a file, reading it is far cheaper than decoding it."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_name, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def decode(file_name, size=None):
+    """Decode an image to a uint8 frame.
+
+    Args:
+        file_name (str): Image to load
+        size (tuple or int): Width and height to resize to, or the
+            length the longer side is reduced to, None for full size
+    """
+    image = Image.open(file_name)
+    if isinstance(size, int):
+        # Let the JPEG decoder skip detail that is thrown away
+        image.draft('RGB', (size, size))
+        image.thumbnail((size, size), Image.BILINEAR)
+    elif size is not None:
+        image = image.resize(size, Image.BILINEAR)
+    frame = np.array(image)
+    image.close()
+    return frame
+
+
+class FrameCache(object):
+    """Size bounded disk cache of decoded uint8 frames.
+
+    Frames are stored as .npy files keyed by the content hash of the
+    image and the target size and are read back memory mapped, so a
+    repeated run feeds the model without decoding the JPEG again.
+    Annotators pass the size their model works at, so a cached frame is
+    the same frame an uncached run decodes. The least recently
+    used frames are removed once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory=None, max_bytes=MAX_BYTES):
+        """Class init function.
+
+        Args:
+            directory (str): Cache directory, defaults to the user cache
+            max_bytes (int): Size the cache is trimmed back to
+        """
+        self.directory = directory or frame_cache_directory()
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.size = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                self.size += entry.stat().st_size
+
+    def path(self, key, size):
+        if size is None:
+            return os.path.join(self.directory, '{}.npy'.format(key))
+        if isinstance(size, int):
+            return os.path.join(self.directory, '{}_max{}.npy'.format(key, size))
+        return os.path.join(self.directory, '{}_{}x{}.npy'.format(key, size[0], size[1]))
+
+    def evict(self):
+        """Remove the least recently used frames until under max_bytes."""
+        entries = [e for e in os.scandir(self.directory) if e.name.endswith('.npy')]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Still memory mapped on Windows, a later eviction removes it
+                continue
+            self.size -= size
+
+    def load(self, file_name, size=None):
+        """Return the decoded frame, from the cache when possible.
+
+        Args:
+            file_name (str): Image to load
+            size (tuple or int): Width and height to resize to, or the
+                length the longer side is reduced to, None for full size
+
+        Returns:
+            np.array: [H, W, C] uint8 frame, memory mapped on a cache hit
+        """
+        path = self.path(file_hash(file_name), size)
+        if os.path.exists(path):
+            try:
+                frame = np.load(path, mmap_mode='r')
+                # Touch the entry so eviction is least recently used
+                os.utime(path)
+                # Plain array view on the mapping, memmap does not pickle cleanly
+                return np.asarray(frame)
+            except (OSError, ValueError):
+                pass
+        frame = decode(file_name, size)
+        self.store(path, frame)
+        return frame
+
+    def store(self, path, frame):
+        temp_name = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(temp_name, 'wb') as file:
+            np.save(file, frame)
+        os.replace(temp_name, path)
+        with self.lock:
+            self.size += os.path.getsize(path)
+            if self.size > self.max_bytes:
+                self.evict()
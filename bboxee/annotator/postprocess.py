@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import numpy as np
+from bboxee import schema
+from bboxee.label_map import lookup_table, lookup
+from bboxee.annotator.tiling import non_max_suppression
+
+
+class Postprocessor(object):
+    """Convert raw detections into annotation file entries.
+
+    Thresholding, class lookup and the optional suppression and top k
+    cap are done on whole arrays; only the surviving detections are
+    turned into annotation dictionaries.
+    """
+
+    def __init__(self, label_map, threshold=0.95, nms_threshold=0.0, top_k=0):
+        """Class init function.
+
+        Args:
+            label_map (dict): class number to label
+            threshold (float): Minimum score kept
+            nms_threshold (float): IoU for class aware suppression, 0 disables
+            top_k (int): Maximum detections kept per image, 0 disables
+        """
+        self.threshold = threshold
+        self.nms_threshold = nms_threshold
+        self.top_k = top_k
+        self.set_label_map(label_map)
+
+    def set_label_map(self, label_map):
+        """Precompute the class number to label lookup array."""
+        self.label_map = label_map
+        self.labels = lookup_table(label_map)
+
+    def select(self, boxes, scores, classes):
+        """Return the detections that survive thresholding, suppression and the cap.
+
+        Args:
+            boxes (np.array): [K, 4] normalized ymin, xmin, ymax, xmax
+            scores (np.array): [K] detection scores
+            classes (np.array): [K] class numbers
+
+        Returns:
+            tuple: boxes, scores and labels in the original detection order
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+        classes = np.asarray(classes).reshape(-1)
+        keep = np.flatnonzero(scores >= self.threshold)
+        if self.nms_threshold > 0.0 and len(keep) > 1:
+            keep = keep[non_max_suppression(boxes[keep], scores[keep], classes[keep], self.nms_threshold)]
+            keep.sort()
+        if self.top_k > 0 and len(keep) > self.top_k:
+            best = np.argsort(-scores[keep], kind='stable')[0:self.top_k]
+            keep = np.sort(keep[best])
+        return boxes[keep], scores[keep], lookup(self.labels, classes[keep])
+
+    def entry(self, boxes, scores, classes):
+        """Build an annotation file entry from raw detections."""
+        entry = schema.annotation_file_entry()
+        boxes, scores, labels = self.select(boxes, scores, classes)
+        for bbox, score, label in zip(boxes.tolist(), scores.tolist(), labels):
+            annotation = schema.annotation()
+            annotation['created_by'] = 'machine'
+            annotation['confidence'] = score
+            annotation['bbox']['xmin'] = bbox[1]
+            annotation['bbox']['xmax'] = bbox[3]
+            annotation['bbox']['ymin'] = bbox[0]
+            annotation['bbox']['ymax'] = bbox[2]
+            annotation['label'] = label
+            entry['annotations'].append(annotation)
+        return entry
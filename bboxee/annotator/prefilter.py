@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import collections
+import numpy as np
+from PIL import Image
+
+
+class Prefilter(object):
+    """Base class for cheap checks that flag likely empty frames.
+
+    The annotator calls is_empty() for each image in folder order and
+    skips the detector when it returns True.
+    """
+
+    name = 'none'
+
+    def reset(self):
+        """Forget any state carried between frames."""
+        pass
+
+    def is_empty(self, file_name):
+        """Return True if the image most likely contains nothing to detect."""
+        return False
+
+
+class BackgroundPrefilter(Prefilter):
+    """Background subtraction against the preceding frames of the folder.
+
+    The background is the per pixel median of the last few downscaled
+    grayscale frames that were flagged as empty. A frame whose pixels
+    barely differ from that background, after removing the change in
+    overall brightness, is flagged as empty. Frames with foreground are
+    kept out of the background, so an animal that stands still is not
+    absorbed into it.
+    """
+
+    name = 'background'
+
+    def __init__(self, history=5, size=(64, 48), pixel_threshold=25, min_fraction=0.003):
+        """Class init function.
+
+        Args:
+            history (int): Number of preceding empty frames in the background
+            size (tuple): Width and height frames are reduced to
+            pixel_threshold (int): Gray level change counted as foreground
+            min_fraction (float): Foreground fraction needed to run the detector
+        """
+        self.history = history
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.min_fraction = min_fraction
+        self.frames = collections.deque(maxlen=history)
+
+    def reset(self):
+        self.frames.clear()
+
+    def thumbnail(self, file_name):
+        """Reduced grayscale copy of the image with the mean removed."""
+        image = Image.open(file_name)
+        image.draft('L', (self.size[0] * 2, self.size[1] * 2))
+        frame = np.asarray(image.convert('L').resize(self.size, Image.BILINEAR), dtype=np.float32)
+        image.close()
+        return frame - frame.mean()
+
+    def is_empty(self, file_name):
+        frame = self.thumbnail(file_name)
+        # A background needs at least a couple of frames to be meaningful
+        if len(self.frames) < 2:
+            self.frames.append(frame)
+            return False
+        background = np.median(np.stack(self.frames), axis=0)
+        foreground = np.abs(frame - background) > self.pixel_threshold
+        empty = foreground.mean() < self.min_fraction
+        if empty:
+            self.frames.append(frame)
+        return bool(empty)
+
+
+PREFILTERS = {BackgroundPrefilter.name: BackgroundPrefilter}
+
+
+def create(name):
+    """Create a prefilter by name, None for 'none' or an empty name."""
+    if name in ('', 'none', None):
+        return None
+    return PREFILTERS[name]()
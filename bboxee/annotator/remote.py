@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+from bboxee.annotator.base import BaseAnnotator
+from bboxee.model_server import ModelClient, ADDRESS
+
+
+class Annotator(BaseAnnotator):
+    """Client mode annotator that runs detections on the model server.
+
+    The model stays loaded in the server between runs and is shared with
+    other clients; thresholding, tiling and post-processing still happen
+    locally.
+    """
+
+    def __init__(self, backend, args, label_map, address=ADDRESS):
+        """Class init function.
+
+        Args:
+            backend (str): Annotator module name, e.g. tensorflow_v2_saved
+            args (tuple): Arguments for the backend Annotator
+            label_map (str): Path to the label map
+            address (tuple): Host and port of the model server
+        """
+        BaseAnnotator.__init__(self, label_map)
+        self.backend = backend
+        self.args = tuple(args)
+        self.key = None
+        self.client = ModelClient(address)
+
+    def detect(self, batch):
+        return self.client.detect(self.key, batch)
+
+    def load_model(self):
+        if self.key is None:
+            self.key = self.client.load(self.backend, self.args)
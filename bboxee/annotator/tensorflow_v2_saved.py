@@ -22,117 +22,33 @@
 # along with this software.  If not, see <http://www.gnu.org/licenses/>.
 #
 # --------------------------------------------------------------------------
-import os
-import json
-from PIL import Image
-from PyQt5 import QtCore
-from bboxee import schema
 import tensorflow as tf
-import numpy as np
+from bboxee.annotator.base import BaseAnnotator
 
 
-class Annotator(QtCore.QThread):
-    """Threaded worker to keep gui from freezing while annotating images."""
-
-    progress = QtCore.pyqtSignal(int, str, dict)
-    finished = QtCore.pyqtSignal(dict)
-    model_loaded = QtCore.pyqtSignal()
+class Annotator(BaseAnnotator):
+    """Annotate images with a TensorFlow 2 saved model."""
 
     def __init__(self, model_dir, label_map):
         """Class init function."""
-        QtCore.QThread.__init__(self)
-        self.stop = False
-        self.image_list = []
-        self.threshold = 0.95
-        self.starting_image = 0
-        self.image_directory = ''
-        self.data = None
+        BaseAnnotator.__init__(self, label_map)
         self.model = None
         self.model_dir = model_dir
-        self.label_map = self.build_label_map(label_map)
-
-    def build_label_map(self, file_name):
-        # see if we can use this to eliminated the need for
-        # label_map_util dependency
-        a = open(file_name, 'r')
-        string = a.read()
-        a.close()
-        lines = string.split("\n")
-        parsed = ''
-        comma = ''
-        for line in lines:
-            if line == '':
-                pass
-            elif line.find('item') != -1:
-                parsed += '{'
-            elif line.find('}') != -1:
-                comma = ''
-                parsed += '},'
-            else:
-                parts = line.replace('\\', '').replace('\'', '"').split(':')
-                parsed += '{} "{}":{}'.format(comma, parts[0].lstrip(), parts[1])
-                comma = ','
 
-        string = "[{}]".format(parsed[0:-1])
-        j = json.loads(string)
-        label_map = {}
-        for entry in j:
-            if 'display_name' in entry:
-                label_map[entry['id']] = entry['display_name']
-            else:
-                label_map[entry['id']] = entry['name']
-        return label_map
+    def detect(self, batch):
+        dets = self.model(batch)
+        scores = dets['detection_scores'].numpy()
+        boxes = dets['detection_boxes'].numpy()
+        classes = dets['detection_classes'].numpy()
+        return boxes, scores, classes
 
-    def run(self):
-        """The starting point for the thread."""
-        self.stop = False
-        self.data = schema.annotation_file()
-        self.data['analysts'].append('Machine Generated')
+    def load_model(self):
         if self.model is None:
             self.model = tf.saved_model.load(self.model_dir)
-        self.model_loaded.emit()
-        for count, img in enumerate(self.image_list):
-            if count >= self.starting_image:
-                if self.stop:
-                    break
-                file_name = os.path.join(self.image_directory, img)
-                if os.path.exists(file_name):
-                    image = Image.open(file_name)
-                    # the array based representation of the image will be
-                    # used later in order to prepare the result image with
-                    # boxes and labels on it.
-                    image_np = np.array(image)
-                    # Expand dimensions since the model expects images
-                    # to have shape: [1, None, None, 3]
-                    image_np_expanded = np.expand_dims(image_np, axis=0)
-                    # Actual detection.
-                    dets = self.model(image_np_expanded)
-                    entry = schema.annotation_file_entry()
-                    scores = dets['detection_scores'][0].numpy()
-                    boxes = dets['detection_boxes'][0].numpy()
-                    classes = dets['detection_classes'][0].numpy()
-                    for index, score in enumerate(scores):
-                        if score >= self.threshold:
-                            annotation = schema.annotation()
-                            annotation['created_by'] = 'machine'
-                            annotation['confidence'] = float(score)
-                            bbox = boxes[index]
-                            annotation['bbox']['xmin'] = float(bbox[1])
-                            annotation['bbox']['xmax'] = float(bbox[3])
-                            annotation['bbox']['ymin'] = float(bbox[0])
-                            annotation['bbox']['ymax'] = float(bbox[2])
-                            class_number = int(classes[index])
-                            if class_number in self.label_map:
-                                label = self.label_map[class_number]
-                            else:
-                                label = 'unknown'
-                            annotation['label'] = label
-                            entry['annotations'].append(annotation)
-                    if len(entry['annotations']) > 0:
-                        self.data['images'][img] = entry
-                    image.close()
-                    self.progress.emit(count + 1, img, entry)
-        self.finished.emit(self.data)
-
-    def stop_annotation(self):
-        self.stop = True
+            signature = getattr(self.model, 'signatures', {}).get('serving_default')
+            if signature is not None:
+                # Exports with a [1, None, None, 3] input take one image at a time
+                args, kwargs = signature.structured_input_signature
+                specs = list(kwargs.values()) or list(args)
+                if len(specs) > 0 and specs[0].shape.rank:
+                    self.batch_limit = specs[0].shape[0] or 0
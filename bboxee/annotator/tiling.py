@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import numpy as np
+from bboxee.store import iou_matrix
+
+
+def non_max_suppression(boxes, scores, classes, iou_threshold=0.5):
+    """Class aware non maximum suppression.
+
+    Boxes of different classes are shifted apart so a single pass of
+    greedy suppression handles all classes. The pairwise overlaps are
+    computed at once and suppression is resolved on the whole matrix.
+
+    Args:
+        boxes (np.array): [N, 4] normalized ymin, xmin, ymax, xmax
+        scores (np.array): [N] detection scores
+        classes (np.array): [N] class numbers
+        iou_threshold (float): Overlap above which the lower score is dropped
+
+    Returns:
+        np.array: Indices of the boxes to keep, highest score first
+    """
+    if len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(-scores, kind='stable')
+    offsets = (classes[order].astype(np.float64) * 2.0)[:, None]
+    shifted = boxes[order].astype(np.float64) + offsets
+    # overlaps[i, j]: box i scores higher than box j and overlaps it
+    overlaps = np.triu(iou_matrix(shifted, shifted) > iou_threshold, k=1)
+    # A box is kept when no kept box above it overlaps it. Starting from
+    # all boxes kept, each pass settles at least one more box of every
+    # chain of overlaps, so this reaches the greedy result.
+    keep = np.ones(len(order), dtype=bool)
+    while True:
+        settled = ~np.any(overlaps & keep[:, None], axis=0)
+        if np.array_equal(settled, keep):
+            break
+        keep = settled
+    return order[keep]
+
+
+def tile_origins(length, tile_size, overlap):
+    """Start offsets of overlapping tiles covering one image dimension.
+
+    Args:
+        length (int): Image width or height
+        tile_size (int): Tile width or height
+        overlap (float): Fraction of a tile shared with its neighbour
+
+    Returns:
+        list: Tile start offsets, the last tile ends at the image edge
+    """
+    if length <= tile_size:
+        return [0]
+    stride = max(1, int(tile_size * (1.0 - overlap)))
+    origins = list(range(0, length - tile_size, stride))
+    origins.append(length - tile_size)
+    return origins
+
+
+def detect_tiled(detect, image_np, tile_size, overlap=0.2, batch_size=4, iou_threshold=0.5, full_frame=True,
+                 min_score=0.0):
+    """Run a detector over overlapping tiles and merge the results.
+
+    Args:
+        detect (function): Takes a [N, H, W, 3] batch and returns boxes,
+            scores and classes with a leading batch dimension
+        image_np (np.array): [H, W, 3] image
+        tile_size (int): Tile width and height in pixels
+        overlap (float): Fraction of overlap between neighbouring tiles
+        batch_size (int): Number of tiles passed to the detector at once
+        iou_threshold (float): IoU used to merge duplicate boxes
+        full_frame (bool): Also run the detector on the full frame so
+            large objects cut by tile edges are still found
+        min_score (float): Lower scores are dropped before merging, they
+            can only suppress boxes that score lower still
+
+    Returns:
+        tuple: boxes [K, 4], scores [K], classes [K] in normalized full
+            frame coordinates sorted by score
+    """
+    height, width = image_np.shape[0:2]
+    tile_height = min(tile_size, height)
+    tile_width = min(tile_size, width)
+    windows = [(y, x) for y in tile_origins(height, tile_height, overlap)
+               for x in tile_origins(width, tile_width, overlap)]
+    scale = np.array([tile_height, tile_width, tile_height, tile_width], dtype=np.float64)
+    size = np.array([height, width, height, width], dtype=np.float64)
+
+    all_boxes = []
+    all_scores = []
+    all_classes = []
+    for start in range(0, len(windows), batch_size):
+        chunk = windows[start:start + batch_size]
+        batch = np.stack([image_np[y:y + tile_height, x:x + tile_width] for y, x in chunk])
+        boxes, scores, classes = detect(batch)
+        for index, (y, x) in enumerate(chunk):
+            offset = np.array([y, x, y, x], dtype=np.float64)
+            all_boxes.append((boxes[index] * scale + offset) / size)
+            all_scores.append(scores[index])
+            all_classes.append(classes[index])
+    if full_frame:
+        boxes, scores, classes = detect(np.expand_dims(image_np, axis=0))
+        all_boxes.append(boxes[0].astype(np.float64))
+        all_scores.append(scores[0])
+        all_classes.append(classes[0])
+
+    boxes = np.concatenate(all_boxes)
+    scores = np.concatenate(all_scores)
+    classes = np.concatenate(all_classes)
+    # Drop padding entries and boxes below the threshold before suppression
+    valid = (scores > 0.0) & (scores >= min_score)
+    boxes = boxes[valid]
+    scores = scores[valid]
+    classes = classes[valid]
+    keep = non_max_suppression(boxes, scores, classes, iou_threshold)
+    return boxes[keep], scores[keep], classes[keep]
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import sys
+import json
+import uuid
+import struct
+import threading
+from collections.abc import MutableMapping
+import numpy as np
+
+MAGIC = b'BBXB'
+VERSION = 1
+EXTENSION = '.bbxb'
+# magic, version, reserved, generation, index offset, index length
+HEADER = struct.Struct('<4sHH16sQQ')
+# Separator between image names in the index, can not appear in a file name
+NAME_SEPARATOR = '\0'
+
+
+def companion_name(bbx_file):
+    """Return the name of the binary companion of an annotation file."""
+    return os.path.splitext(bbx_file)[0] + EXTENSION
+
+
+def source_stamp(bbx_file):
+    """Return the size and modification time recorded for a JSON file."""
+    stat = os.stat(bbx_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def is_fresh(bbx_file):
+    """Does the annotation file have a companion written from its current contents?"""
+    file_name = companion_name(bbx_file)
+    if not os.path.exists(file_name):
+        return False
+    try:
+        meta = read_index(file_name)[0]
+        return meta['source'] == source_stamp(bbx_file)
+    except (OSError, ValueError, KeyError, struct.error):
+        return False
+
+
+def write(data, file_name, source=None):
+    """Write annotation data in the binary format.
+
+    The file is a fixed header, one compact JSON blob per image entry,
+    the mask and an index. The index holds the top level keys, the
+    offset and length of every entry and the label of every box, so
+    files can be opened and summarized without reading the entries.
+
+    Args:
+        data (dict): annotation file from schema.annotation_file()
+        file_name (str): destination, written atomically
+        source (str): JSON file the data came from, used to detect a stale companion
+    """
+    images = data['images']
+    labels = {}
+    names = []
+    offsets = []
+    lengths = []
+    counts = []
+    codes = []
+    tmp_name = file_name + '.tmp'
+    file = open(tmp_name, 'wb')
+    try:
+        generation = uuid.uuid4().bytes
+        file.write(HEADER.pack(MAGIC, VERSION, 0, generation, 0, 0))
+        for name in images:
+            if isinstance(images, LazyImages) and name not in images.loaded:
+                blob = images.raw(name).encode('utf-8')
+                image_labels = images.box_labels(name)
+            else:
+                entry = images[name]
+                blob = json.dumps(entry).encode('utf-8')
+                image_labels = [a['label'] for a in entry['annotations']]
+            names.append(name)
+            offsets.append(file.tell())
+            lengths.append(len(blob))
+            counts.append(len(image_labels))
+            codes.extend(labels.setdefault(label, len(labels)) for label in image_labels)
+            file.write(blob)
+        mask = json.dumps(data.get('mask')).encode('utf-8')
+        mask_offset = file.tell()
+        file.write(mask)
+
+        meta = {'keys': list(data.keys()),
+                'values': {k: v for k, v in data.items() if k not in ('images', 'mask')},
+                'labels': list(labels),
+                'mask': [mask_offset, len(mask)],
+                'source': source_stamp(source) if source is not None else None}
+        meta = json.dumps(meta).encode('utf-8')
+        name_blob = NAME_SEPARATOR.join(names).encode('utf-8')
+        index_offset = file.tell()
+        file.write(struct.pack('<I', len(meta)))
+        file.write(meta)
+        file.write(struct.pack('<I', len(names)))
+        file.write(np.asarray(offsets, dtype='<u8').tobytes())
+        file.write(np.asarray(lengths, dtype='<u4').tobytes())
+        file.write(np.asarray(counts, dtype='<u4').tobytes())
+        file.write(np.asarray(codes, dtype='<u4').tobytes())
+        file.write(struct.pack('<Q', len(name_blob)))
+        file.write(name_blob)
+        index_length = file.tell() - index_offset
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, 0, generation, index_offset, index_length))
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+        os.replace(tmp_name, file_name)
+    finally:
+        # Leave no partial file behind when writing failed
+        file.close()
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+
+def read_header(file):
+    """Read and check the fixed header of an open binary file.
+
+    Returns:
+        tuple: generation, index offset and index length
+    """
+    magic, version, _, generation, index_offset, index_length = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('Not a binary annotation file')
+    if version > VERSION:
+        raise ValueError('Unsupported binary annotation file version {}'.format(version))
+    return (generation, index_offset, index_length)
+
+
+def read_index(file_name):
+    """Read the index of a binary annotation file.
+
+    Returns:
+        tuple: meta dict, image names, offsets, lengths, label counts and label codes
+    """
+    file = open(file_name, 'rb')
+    generation, index_offset, index_length = read_header(file)
+    file.seek(index_offset)
+    buffer = file.read(index_length)
+    file.close()
+    position = 0
+    size = struct.unpack_from('<I', buffer, position)[0]
+    position += 4
+    meta = json.loads(buffer[position:position + size].decode('utf-8'))
+    meta['generation'] = generation
+    position += size
+    images = struct.unpack_from('<I', buffer, position)[0]
+    position += 4
+    offsets = np.frombuffer(buffer, dtype='<u8', count=images, offset=position)
+    position += offsets.nbytes
+    lengths = np.frombuffer(buffer, dtype='<u4', count=images, offset=position)
+    position += lengths.nbytes
+    counts = np.frombuffer(buffer, dtype='<u4', count=images, offset=position)
+    position += counts.nbytes
+    codes = np.frombuffer(buffer, dtype='<u4', count=int(counts.sum()), offset=position)
+    position += codes.nbytes
+    size = struct.unpack_from('<Q', buffer, position)[0]
+    position += 8
+    names = buffer[position:position + size].decode('utf-8')
+    names = names.split(NAME_SEPARATOR) if images > 0 else []
+    return (meta, names, offsets, lengths, counts, codes)
+
+
+def read(file_name):
+    """Open a binary annotation file.
+
+    Only the index and the mask are read; image entries are fetched
+    when they are first accessed.
+
+    Returns:
+        dict: annotation file whose 'images' value is a LazyImages
+    """
+    images = LazyImages(file_name)
+    meta = images.meta
+    data = {}
+    for key in meta['keys']:
+        if key == 'images':
+            data[key] = images
+        elif key == 'mask':
+            data[key] = json.loads(images.read_blob(*meta['mask']))
+        else:
+            data[key] = meta['values'][key]
+    return data
+
+
+def load(bbx_file):
+    """Load an annotation file, through its companion when it is fresh.
+
+    A stale companion is rewritten from the JSON file.
+    """
+    file_name = companion_name(bbx_file)
+    if is_fresh(bbx_file):
+        return read(file_name)
+    file = open(bbx_file, 'r')
+    data = json.load(file)
+    file.close()
+    if os.path.exists(file_name):
+        try:
+            write(data, file_name, bbx_file)
+        except OSError:
+            pass
+    return data
+
+
+def dumps(data):
+    """Serialize annotation data to the same text as json.dumps().
+
+    Entries of a LazyImages that were never loaded are copied from the
+    binary file without being parsed.
+    """
+    images = data.get('images')
+    if not isinstance(images, LazyImages):
+        return json.dumps(data)
+    parts = []
+    for key in data:
+        if key == 'images':
+            value = images.dumps()
+        else:
+            value = json.dumps(data[key])
+        parts.append(json.dumps(key) + ': ' + value)
+    return '{' + ', '.join(parts) + '}'
+
+
+def to_json(file_name, bbx_file):
+    """Convert a binary annotation file back to JSON."""
+    text = dumps(read(file_name))
+    file = open(bbx_file, 'w')
+    file.write(text)
+    file.close()
+
+
+class LazyImages(MutableMapping):
+    """The 'images' block of a binary annotation file, read on demand.
+
+    Entries are parsed the first time they are accessed and kept, so
+    changes made to them persist like they would in a dict. If the file
+    is rewritten while open, the index is reloaded before reading.
+    """
+
+    def __init__(self, file_name):
+        """Class init function."""
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.loaded = {}
+        self.load_index()
+        self.order = dict.fromkeys(self.names)
+
+    def __delitem__(self, name):
+        del self.order[name]
+        self.loaded.pop(name, None)
+
+    def __getitem__(self, name):
+        if name in self.loaded:
+            return self.loaded[name]
+        if name not in self.order:
+            raise KeyError(name)
+        entry = json.loads(self.raw(name))
+        self.loaded[name] = entry
+        return entry
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, name):
+        return name in self.order
+
+    def __setitem__(self, name, entry):
+        self.loaded[name] = entry
+        self.order.setdefault(name, None)
+
+    def box_labels(self, name):
+        """Return the label of every box of an image without loading it."""
+        if name in self.loaded:
+            return [a['label'] for a in self.loaded[name]['annotations']]
+        if name not in self.order:
+            raise KeyError(name)
+        position = self.positions[name]
+        start = int(self.starts[position])
+        codes = self.codes[start:start + int(self.counts[position])]
+        return [self.labels[code] for code in codes]
+
+    def dumps(self):
+        """Serialize to the same text as json.dumps() of the plain dict."""
+        parts = []
+        for name in self.order:
+            if name in self.loaded:
+                value = json.dumps(self.loaded[name])
+            else:
+                value = self.raw(name)
+            parts.append(json.dumps(name) + ': ' + value)
+        return '{' + ', '.join(parts) + '}'
+
+    def load_index(self):
+        """(Re)read the index of the binary file."""
+        meta, names, offsets, lengths, counts, codes = read_index(self.file_name)
+        self.meta = meta
+        self.generation = meta['generation']
+        self.labels = meta['labels']
+        self.names = names
+        self.positions = {name: position for position, name in enumerate(names)}
+        self.offsets = offsets
+        self.lengths = lengths
+        self.counts = counts
+        self.codes = codes
+        self.starts = np.cumsum(counts) - counts
+
+    def raw(self, name):
+        """Return the JSON text of an entry as stored in the file."""
+        with self.lock:
+            while True:
+                if name not in self.positions:
+                    raise KeyError(name)
+                position = self.positions[name]
+                blob = self.read_blob(self.offsets[position], self.lengths[position])
+                if blob is not None:
+                    return blob
+                # The file was rewritten, entries moved
+                self.load_index()
+
+    def read_blob(self, offset, length):
+        """Read a block of the file, None if the file has been rewritten."""
+        file = open(self.file_name, 'rb')
+        try:
+            if read_header(file)[0] != self.generation:
+                return None
+            file.seek(int(offset))
+            return file.read(int(length)).decode('utf-8')
+        finally:
+            file.close()
+
+
+def main(args):
+    if len(args) < 2 or args[0] not in ('binary', 'json'):
+        print('usage: python -m bboxee.binary_bbx binary|json FILE [FILE ...]')
+        return 1
+    for file_name in args[1:]:
+        if args[0] == 'binary':
+            data = load(file_name)
+            write(data, companion_name(file_name), file_name)
+            print('{} -> {}'.format(file_name, companion_name(file_name)))
+        else:
+            bbx_file = os.path.splitext(file_name)[0] + '.bbx'
+            to_json(file_name, bbx_file)
+            print('{} -> {}'.format(file_name, bbx_file))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+from PyQt5 import QtCore
+
+IMAGE_FORMATS = ('.jpg', '.jpeg', '.png')
+
+# directory -> (mtime, sorted image list)
+LISTING_CACHE = {}
+
+
+def cached_listing(directory):
+    """Return the cached image list for a directory if it is still current.
+
+    Args:
+        directory (str): Directory to look up
+
+    Returns:
+        list: Sorted image file names or None
+    """
+    key = os.path.abspath(directory)
+    if key in LISTING_CACHE:
+        mtime, images = LISTING_CACHE[key]
+        try:
+            if os.stat(key).st_mtime_ns == mtime:
+                return list(images)
+        except OSError:
+            pass
+        del LISTING_CACHE[key]
+    return None
+
+
+def is_image(file_name):
+    return os.path.splitext(file_name)[1].lower() in IMAGE_FORMATS
+
+
+def list_images(directory):
+    """Sorted list of the image files in a directory, cached by mtime."""
+    images = cached_listing(directory)
+    if images is None:
+        mtime = os.stat(directory).st_mtime_ns
+        images = sorted(scan_images(directory))
+        store_listing(directory, mtime, images)
+    return images
+
+
+def scan_images(directory):
+    """Yield image file names in directory order using os.scandir."""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if is_image(entry.name) and entry.is_file():
+                yield entry.name
+
+
+def store_listing(directory, mtime, images):
+    LISTING_CACHE[os.path.abspath(directory)] = (mtime, list(images))
+
+
+class ImageScanner(QtCore.QThread):
+    """Threaded worker that streams the image files found in a directory."""
+
+    found = QtCore.pyqtSignal(str, list)
+    finished = QtCore.pyqtSignal(str, list)
+
+    def __init__(self, batch_size=500):
+        """Class init function.
+
+        Args:
+            batch_size (int): Number of file names sent per found signal
+        """
+        QtCore.QThread.__init__(self)
+        self.directory = ''
+        self.batch_size = batch_size
+        self.stop = False
+
+    def run(self):
+        """The starting point for the thread."""
+        self.stop = False
+        directory = self.directory
+        images = cached_listing(directory)
+        if images is None:
+            mtime = os.stat(directory).st_mtime_ns
+            images = []
+            batch = []
+            for name in scan_images(directory):
+                if self.stop:
+                    return
+                batch.append(name)
+                # Send the first image right away so it can be displayed
+                if len(batch) >= self.batch_size or not images:
+                    self.found.emit(directory, batch)
+                    images += batch
+                    batch = []
+            if batch:
+                self.found.emit(directory, batch)
+                images += batch
+            images.sort()
+            store_listing(directory, mtime, images)
+        self.finished.emit(directory, images)
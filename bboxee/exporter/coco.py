@@ -30,6 +30,7 @@ import numpy as np
 from shutil import copyfile
 from PIL import Image
 from PyQt5 import QtCore
+from bboxee.progress import ProgressThrottle
 
 
 class Exporter(QtCore.QThread):
@@ -64,6 +65,7 @@ class Exporter(QtCore.QThread):
         self.label_map = label_map
         self.train_size = int((1.0 - validation_split) * len(self.images))
         self.stop = False
+        self.throttle = ProgressThrottle()
 
         self.masks = masks
         self.strip_metadata = strip_metadata
@@ -190,7 +192,8 @@ class Exporter(QtCore.QThread):
                     annotation['iscrowd'] = 0
                     current['annotations'].append(annotation)
 
-                self.progress.emit(count + 1)
+                if self.throttle.ready(count + 1 == len(self.images)):
+                    self.progress.emit(count + 1)
         train['licenses'] = licenses
         val['licenses'] = licenses
 
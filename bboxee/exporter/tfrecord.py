@@ -31,6 +31,7 @@ import numpy as np
 import tensorflow as tf
 from PIL import Image
 from PyQt5 import QtCore
+from bboxee.progress import ProgressThrottle
 
 
 def int64_feature(value):
@@ -85,6 +86,7 @@ class Exporter(QtCore.QThread):
         self.train_size = int((1.0 - validation_split) * len(self.images))
         self.shards = shards
         self.stop = False
+        self.throttle = ProgressThrottle()
 
         self.masks = masks
         self.strip_metadata = strip_metadata
@@ -213,7 +215,8 @@ class Exporter(QtCore.QThread):
                     train_writer[index].write(tf_example.SerializeToString())
                 else:
                     validation_writer[index].write(tf_example.SerializeToString())
-                self.progress.emit(count + 1)
+                if self.throttle.ready(count + 1 == len(self.images)):
+                    self.progress.emit(count + 1)
         for i in range(self.shards):
             train_writer[i].close()
             validation_writer[i].close()
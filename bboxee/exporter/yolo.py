@@ -29,6 +29,7 @@ import numpy as np
 from shutil import copyfile
 from PIL import Image
 from PyQt5 import QtCore
+from bboxee.progress import ProgressThrottle
 
 
 class Exporter(QtCore.QThread):
@@ -62,6 +63,7 @@ class Exporter(QtCore.QThread):
         self.label_map = label_map
         self.train_size = int((1.0 - validation_split) * len(self.images))
         self.stop = False
+        self.throttle = ProgressThrottle()
 
         self.masks = masks
         self.strip_metadata = strip_metadata
@@ -154,7 +156,8 @@ class Exporter(QtCore.QThread):
 
                 # TODO: Really need to export the license information for each file
 
-                self.progress.emit(count + 1)
+                if self.throttle.ready(count + 1 == len(self.images)):
+                    self.progress.emit(count + 1)
 
         nl = ""
         file = open(os.path.join(self.directory, 'names.txt'), 'w')
@@ -24,13 +24,17 @@
 # --------------------------------------------------------------------------
 import os
 import sys
-import glob
 import json
 import numpy as np
 from PIL import Image
 from tabulate import tabulate
 from PyQt5 import QtCore, QtGui, QtWidgets, uic
 from bboxee.gui import SelectModelDialog
+from bboxee import discovery
+from bboxee import project_db
+from bboxee.annotator import prefilter
+from bboxee.annotator.frame_cache import FrameCache
+from bboxee.store import AnnotationStore, bbox_array, iou_matrix
 from functools import reduce
 
 if getattr(sys, 'frozen', False):
@@ -55,6 +59,7 @@ class AccuracyWidget(QtWidgets.QWidget, WIDGET):
         self.labels = []
         self.annotator = None
         self.label_map = None
+        self.frame_cache = None
 
         self.pb_select_bbx.clicked.connect(self.load_from_file)
         self.pb_select_model.clicked.connect(self.select_model)
@@ -135,17 +140,22 @@ class AccuracyWidget(QtWidgets.QWidget, WIDGET):
 
         self.annotator.threshold = self.dsb_threshold.value()
         self.annotator.image_directory = self.directory
+        if self.cb_prefilter.isChecked():
+            self.annotator.prefilter = prefilter.BackgroundPrefilter()
+        else:
+            self.annotator.prefilter = None
+        if self.cb_frame_cache.isChecked():
+            if self.frame_cache is None:
+                self.frame_cache = FrameCache()
+            self.annotator.frame_cache = self.frame_cache
+        else:
+            self.annotator.frame_cache = None
 
         if self.cb_annotated_only.isChecked():
             image_list = [x for x in self.reference_data['images']]
             image_list = sorted(image_list)
         else:
-            files = glob.glob(os.path.join(self.directory, '*'))
-            image_format = [".jpg", ".jpeg", ".png"]
-            f = (lambda x: os.path.splitext(x)[1].lower() in image_format)
-            image_list = list(filter(f, files))
-            image_list = [os.path.basename(x) for x in image_list]
-            image_list = sorted(image_list)
+            image_list = discovery.list_images(self.directory)
 
         self.annotator.image_list = image_list
         self.image_list = image_list
@@ -169,6 +179,8 @@ class AccuracyWidget(QtWidgets.QWidget, WIDGET):
 
         summary = self.summarize(predicted_data, self.reference_data)
         self.report(summary)
+        if 'prefiltered' in predicted_data:
+            self.report_prefilter(predicted_data['prefiltered'], self.reference_data)
 
         self.tw_results.setRowCount(len(summary.keys()))
         for row, image in enumerate(summary):
@@ -215,9 +227,9 @@ class AccuracyWidget(QtWidgets.QWidget, WIDGET):
         """(Slot) Load existing annotation data from file."""
         file_name = QtWidgets.QFileDialog.getOpenFileName(self, 'Load Annotations', self.directory, 'BBoxEE (*.bbx)')
         if file_name[0] != '':
-            file = open(file_name[0], 'r')
-            self.reference_data = json.load(file)
-            file.close()
+            self.reference_data = project_db.load(file_name[0])
+            images = self.reference_data['images']
+            self.reference_data['images'] = AnnotationStore().add_images(images)
             self.directory = os.path.split(file_name[0])[0]
             self.pb_select_model.setEnabled(True)
 
@@ -321,6 +333,31 @@ class AccuracyWidget(QtWidgets.QWidget, WIDGET):
         self.tb_summary.append('False Negative [ {} ]'.format(false_negatives))
         self.tb_summary.append(tabulate(false_negative_labels, ['Label', 'Count']))
 
+    def report_prefilter(self, prefiltered, reference):
+        """Precision and recall of the empty frame prefilter against the
+        reference annotations."""
+        empty = set()
+        for image in self.image_list:
+            annotations = []
+            if image in reference['images']:
+                annotations = reference['images'][image]['annotations']
+            # Images with only the special negative label are empty too
+            if len([a for a in annotations if a['label'].lower() != 'negative']) == 0:
+                empty.add(image)
+        skipped = set(prefiltered)
+        correct = len(skipped & empty)
+        precision = correct / len(skipped) if len(skipped) > 0 else 0.0
+        recall = correct / len(empty) if len(empty) > 0 else 0.0
+        self.tb_summary.append('')
+        self.tb_summary.append('')
+        self.tb_summary.append('Empty Frame Prefilter [ {} skipped ]'.format(len(skipped)))
+        rows = [['Empty frames skipped', correct],
+                ['Frames with objects skipped', len(skipped) - correct],
+                ['Empty frames run through model', len(empty) - correct],
+                ['Precision', '{:0.6f}'.format(precision)],
+                ['Recall', '{:0.6f}'.format(recall)]]
+        self.tb_summary.append(tabulate(rows))
+
     def remap_label(self, label):
         if self.label_map is not None and label in self.label_map:
             return self.label_map[label]
@@ -428,10 +465,7 @@ class AccuracyWidget(QtWidgets.QWidget, WIDGET):
                 summary[image]['predicted'] = pred
                 summary[image]['reference'] = ref
 
-                matrix = np.zeros((len(pred), len(ref)))
-                for pi, p in enumerate(pred):
-                    for ri, r in enumerate(ref):
-                        matrix[pi, ri] = AccuracyWidget.IoU(p, r)
+                matrix = iou_matrix(bbox_array(pred), bbox_array(ref))
 
                 p_to_r, r_to_p = AccuracyWidget.find_matchs(matrix)
 
@@ -443,7 +477,7 @@ class AccuracyWidget(QtWidgets.QWidget, WIDGET):
                         labels.append((pl, rl))
                         self.save_label(pl)
                         self.save_label(rl)
-                        IoUs.append(AccuracyWidget.IoU(pred[pi], ref[p]))
+                        IoUs.append(matrix[pi, p])
                     else:
                         label = self.remap_label(pred[pi]['label'])
                         false_positive_labels.append(label)
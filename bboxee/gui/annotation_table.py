@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+LABEL = 0
+CONFIDENCE = 1
+DIMENSIONS = 2
+TRUNCATED = 3
+OCCLUDED = 4
+DIFFICULT = 5
+DELETE = 6
+
+FLAGS = {TRUNCATED: 'truncated', OCCLUDED: 'occluded', DIFFICULT: 'difficult'}
+
+
+class AnnotationTableModel(QtCore.QAbstractTableModel):
+    """Table model exposing the annotations of the current image.
+
+    The model holds a reference to the annotation list stored in the
+    annotation file so edits made through the table are applied in place.
+    """
+
+    edited = QtCore.pyqtSignal(int, str)
+
+    headers = ['Label', 'Confidence', 'Dimensions', 'T', 'O', 'D', '']
+    tool_tips = {TRUNCATED: 'Truncated', OCCLUDED: 'Occluded', DIFFICULT: 'Difficult'}
+
+    def __init__(self, parent=None):
+        """Class init function."""
+        QtCore.QAbstractTableModel.__init__(self, parent)
+        self.annotations = []
+        self.image_size = (0, 0)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        annotation = self.annotations[index.row()]
+        column = index.column()
+        if column == LABEL:
+            if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+                return annotation['label']
+        elif column == CONFIDENCE:
+            if 'confidence' in annotation:
+                if role == QtCore.Qt.DisplayRole:
+                    return '{:0.2f}'.format(annotation['confidence'])
+                if role == QtCore.Qt.EditRole:
+                    return str(annotation['confidence'])
+        elif column == DIMENSIONS:
+            if role == QtCore.Qt.DisplayRole:
+                bbox = annotation['bbox']
+                width = int((bbox['xmax'] - bbox['xmin']) * self.image_size[0])
+                height = int((bbox['ymax'] - bbox['ymin']) * self.image_size[1])
+                return "{:d} x {:d}".format(width, height)
+        elif column in FLAGS:
+            if role == QtCore.Qt.CheckStateRole:
+                if annotation[FLAGS[column]] == 'Y':
+                    return QtCore.Qt.Checked
+                return QtCore.Qt.Unchecked
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        column = index.column()
+        flags = QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+        if column in (LABEL, CONFIDENCE):
+            flags |= QtCore.Qt.ItemIsEditable
+        elif column in FLAGS:
+            flags |= QtCore.Qt.ItemIsUserCheckable
+        return flags
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal:
+            if role == QtCore.Qt.DisplayRole:
+                return self.headers[section]
+            if role == QtCore.Qt.ToolTipRole:
+                return self.tool_tips.get(section)
+            return None
+        return QtCore.QAbstractTableModel.headerData(self, section, orientation, role)
+
+    def refresh_row(self, row):
+        """Notify views that the annotation in a row has changed."""
+        if 0 <= row < len(self.annotations):
+            self.dataChanged.emit(self.index(row, 0), self.index(row, DELETE))
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.annotations)
+
+    def set_annotations(self, annotations, image_size=None):
+        """Point the model at a new annotation list.
+
+        Args:
+            annotations (list): Annotation blocks or None to clear the table
+            image_size (tuple): Image (width, height) used for dimensions
+        """
+        self.beginResetModel()
+        self.annotations = annotations if annotations is not None else []
+        if image_size is not None:
+            self.image_size = image_size
+        self.endResetModel()
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid():
+            return False
+        row = index.row()
+        column = index.column()
+        annotation = self.annotations[row]
+        if column == LABEL and role == QtCore.Qt.EditRole:
+            if annotation['label'] == value:
+                return False
+            annotation['label'] = value
+            annotation['updated_by'] = 'human'
+            annotation['confidence'] = 1.0
+            self.refresh_row(row)
+            self.edited.emit(row, 'label')
+            return True
+        if column == CONFIDENCE and role == QtCore.Qt.EditRole:
+            try:
+                annotation['confidence'] = float(value)
+            except ValueError:
+                annotation['confidence'] = 0.0
+            self.refresh_row(row)
+            self.edited.emit(row, 'confidence')
+            return True
+        if column in FLAGS and role == QtCore.Qt.CheckStateRole:
+            checked = value == QtCore.Qt.Checked
+            annotation[FLAGS[column]] = "Y" if checked else "N"
+            self.dataChanged.emit(index, index)
+            self.edited.emit(row, FLAGS[column])
+            return True
+        return False
+
+
+class LabelDelegate(QtWidgets.QStyledItemDelegate):
+    """Paint the label as plain text and only create a combobox on demand."""
+
+    def __init__(self, parent=None):
+        """Class init function."""
+        QtWidgets.QStyledItemDelegate.__init__(self, parent)
+        self.labels = []
+
+    def commit(self):
+        """(SLOT) Push combobox changes to the model immediately."""
+        self.commitData.emit(self.sender())
+
+    def createEditor(self, parent, option, index):
+        combo = QtWidgets.QComboBox(parent)
+        combo.addItems(self.labels)
+        combo.currentIndexChanged.connect(self.commit)
+        return combo
+
+    def setEditorData(self, editor, index):
+        text = index.data(QtCore.Qt.EditRole)
+        position = editor.findText(text, QtCore.Qt.MatchFixedString)
+        editor.blockSignals(True)
+        editor.setCurrentIndex(position if position >= 0 else 0)
+        editor.blockSignals(False)
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), QtCore.Qt.EditRole)
+
+
+class DeleteDelegate(QtWidgets.QStyledItemDelegate):
+    """Paint a delete icon and report clicks instead of embedding a button."""
+
+    clicked = QtCore.pyqtSignal(int)
+
+    def __init__(self, icon_size=24, parent=None):
+        """Class init function."""
+        QtWidgets.QStyledItemDelegate.__init__(self, parent)
+        self.icon = QtGui.QIcon(':/icons/delete.svg')
+        self.icon_size = icon_size
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QtCore.QEvent.MouseButtonRelease and option.rect.contains(event.pos()):
+            self.clicked.emit(index.row())
+            return True
+        return False
+
+    def paint(self, painter, option, index):
+        QtWidgets.QStyledItemDelegate.paint(self, painter, option, index)
+        rect = QtCore.QRect(0, 0, self.icon_size, self.icon_size)
+        rect.moveCenter(option.rect.center())
+        self.icon.paint(painter, rect)
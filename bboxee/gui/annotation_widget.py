@@ -24,20 +24,29 @@
 # --------------------------------------------------------------------------
 import os
 import sys
-import glob
 import json
 import numpy as np
 from PIL import Image
 from PyQt5 import QtCore, QtGui, QtWidgets, uic
 from bboxee import schema
+from bboxee import discovery
+from bboxee import binary_bbx
+from bboxee.image_index import ImageIndex, box_labels
+from bboxee.annotator import prefilter
+from bboxee.annotator.frame_cache import FrameCache
+from bboxee.journal import Journal, Compactor, untitled_name
 from bboxee.gui import SelectModelDialog
 from bboxee.gui import AnalystDialog
+from bboxee.gui.annotation_table import AnnotationTableModel, LabelDelegate, DeleteDelegate
+from bboxee.gui.annotation_table import LABEL, DELETE
 
 if getattr(sys, 'frozen', False):
     bundle_dir = sys._MEIPASS
 else:
     bundle_dir = os.path.dirname(__file__)
 WIDGET, _ = uic.loadUiType(os.path.join(bundle_dir, 'annotation_widget.ui'))
+# Milliseconds between automatic saves of the annotation file
+AUTOSAVE_INTERVAL = 60000
 # TODO: Break this class / widget up into multiple widgets / components.
 
 
@@ -55,20 +64,39 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
         self.current_image = 1
         self.image_list = []
         self.original_image_list = []
+        self.listing_complete = True
+        self.filter_label = ''
         self.mask = None
         self.data = None
         self.labels = None
         self.last_label = 'N/A'
         self.dirty = False
         self.qt_image = None
+        self.bbx_file = None
+        self.journal = None
+        self.image_index = ImageIndex()
+
+        self.scanner = discovery.ImageScanner()
+        self.scanner.found.connect(self.images_found)
+        self.scanner.finished.connect(self.image_scan_complete)
+
+        self.compactor = Compactor()
+        self.compactor.failed.connect(self.compaction_failed)
+        self.compactor.finished.connect(self.compaction_finished)
+        self.compact_pending = False
+        self.autosave_timer = QtCore.QTimer(self)
+        self.autosave_timer.setInterval(AUTOSAVE_INTERVAL)
+        self.autosave_timer.timeout.connect(self.autosave)
+        self.autosave_timer.start()
 
         self.annotator = None
+        self.frame_cache = None
         self.model_selector = SelectModelDialog(self)
         self.model_selector.selected.connect(self.annotator_selected)
 
         self.graphicsView.created.connect(self.bbox_created)
-        self.graphicsView.resized.connect(self.update_bbox)
-        self.graphicsView.moved.connect(self.update_bbox)
+        self.graphicsView.resized.connect(self.bbox_resized)
+        self.graphicsView.moved.connect(self.bbox_moved)
         self.graphicsView.select_bbox.connect(self.select_bbox)
         self.graphicsView.delete_event.connect(self.delete_selected_row)
 
@@ -134,20 +162,35 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
         self.pb_annotater.clicked.connect(self.select_annotator)
         self.pb_annotate.clicked.connect(self.annotate)
         self.pb_save.clicked.connect(self.save)
+        self.pb_save_as.clicked.connect(self.save_as)
         self.pb_mask.clicked.connect(self.select_mask)
         self.lineEditCurrentImage.editingFinished.connect(self.jump_to_image)
-        self.tw_labels.selectionModel().selectionChanged.connect(self.selection_changed)
-        self.tw_labels.cellChanged.connect(self.cell_changed)
+        self.thumbnails.image_selected.connect(self.thumbnail_selected)
         self.checkBoxDisplayAnnotationData.clicked.connect(self.display_bboxes)
 
         self.verticalSliderMidPoint.valueChanged.connect(self.graphicsView.set_mid_point)
 
-        (self.tw_labels.
+        # Annotation table, cells are painted by delegates and the label
+        # combobox is only created for the selected row
+        self.table_model = AnnotationTableModel(self)
+        self.table_model.edited.connect(self.annotation_edited)
+        self.label_delegate = LabelDelegate(self)
+        self.delete_delegate = DeleteDelegate(24, self)
+        self.delete_delegate.clicked.connect(self.delete_click_handler)
+        self.label_editor = None
+        self.tv_labels.setModel(self.table_model)
+        self.tv_labels.setItemDelegateForColumn(LABEL, self.label_delegate)
+        self.tv_labels.setItemDelegateForColumn(DELETE, self.delete_delegate)
+        self.tv_labels.setEditTriggers(QtWidgets.QAbstractItemView.DoubleClicked |
+                                       QtWidgets.QAbstractItemView.EditKeyPressed)
+        self.tv_labels.selectionModel().selectionChanged.connect(self.selection_changed)
+
+        (self.tv_labels.
          setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows))
-        (self.tw_labels.
+        (self.tv_labels.
          setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection))
-        self.tw_labels.verticalHeader().sectionClicked.connect(self.set_sticky)
-        table_header = self.tw_labels.horizontalHeader()
+        self.tv_labels.verticalHeader().sectionClicked.connect(self.set_sticky)
+        table_header = self.tv_labels.horizontalHeader()
         table_header.setStretchLastSection(False)
         table_header.ResizeMode = QtWidgets.QHeaderView.Interactive
         table_header.resizeSection(0, 150)
@@ -253,15 +296,23 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
         self.scut_previous_annotated_image.setContext(QtCore.Qt.WidgetWithChildrenShortcut)
         self.scut_previous_annotated_image.activated.connect(self.previous_annotated_image)
 
+        # Save as
+        self.scut_save_as = QtWidgets.QShortcut(
+            QtGui.QKeySequence(QtCore.Qt.CTRL + QtCore.Qt.SHIFT + QtCore.Qt.Key_S), self)
+        self.scut_save_as.setContext(QtCore.Qt.WidgetWithChildrenShortcut)
+        self.scut_save_as.activated.connect(self.save_as)
+
     def add_analyst(self, name):
         if self.data is not None:
             last_index = len(self.data['analysts']) - 1
             if name not in self.data['analysts']:
                 self.data['analysts'].append(name)
+                self.log_file_edit('analysts')
                 self.set_dirty(True)
             # Ignore add request of name is the same as the last entry
             elif self.data['analysts'][last_index] != name:
                 self.data['analysts'].append(name)
+                self.log_file_edit('analysts')
                 self.set_dirty(True)
             self.display_analysts()
 
@@ -272,6 +323,14 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
     def annotate(self):
         """(SLOT) Start the automated annotator."""
         if self.dirty_data_check():
+            if not self.listing_complete:
+                # The full image list is needed, the signals queued by the
+                # scanner are only delivered after this slot returns
+                self.scanner.wait()
+                images = discovery.cached_listing(self.image_directory)
+                if images is None:
+                    images = discovery.list_images(self.image_directory)
+                self.image_scan_complete(self.image_directory, images)
             self.checkBoxDisplayAnnotationData.setChecked(True)
             self.license.setDisabled(True)
             self.analysts.setDisabled(True)
@@ -287,6 +346,22 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
             self.annotator.threshold = self.doubleSpinBoxThreshold.value()
             self.annotator.image_directory = self.image_directory
             self.annotator.image_list = self.image_list
+            if self.cb_tiled.isChecked():
+                self.annotator.tile_size = self.sb_tile_size.value()
+            else:
+                self.annotator.tile_size = 0
+            self.annotator.tile_overlap = self.dsb_tile_overlap.value()
+            self.annotator.skip_bursts = self.cb_skip_bursts.isChecked()
+            if self.cb_prefilter.isChecked():
+                self.annotator.prefilter = prefilter.BackgroundPrefilter()
+            else:
+                self.annotator.prefilter = None
+            if self.cb_frame_cache.isChecked():
+                if self.frame_cache is None:
+                    self.frame_cache = FrameCache()
+                self.annotator.frame_cache = self.frame_cache
+            else:
+                self.annotator.frame_cache = None
             if self.cb_start_and_merge.isChecked():
                 self.annotator.starting_image = self.current_image - 1
             else:
@@ -297,7 +372,10 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
         """(SLOT) Automatic annotation complete, reenable gui and
         reset current image to 1."""
         if not self.cb_start_and_merge.isChecked():
+            if self.journal is not None:
+                self.log_replace(data)
             self.data = data
+            self.image_index.build(self.original_image_list, self.data['images'])
         self.display_analysts()
         self.license.setEnabled(True)
         self.analysts.setEnabled(True)
@@ -310,14 +388,26 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
         self.current_image = 0
         self.next_image()
 
-    def annotation_progress(self, progress, image, annotations):
-        """(SLOT) Show progress and current detections (annotations) as
-        they are processed."""
-        if progress - 1 != self.current_image:
-            self.current_image = progress - 1
+    def annotation_edited(self, row, field):
+        """(Slot) Update display and state after an edit in the table."""
+        if field == 'label':
+            self.last_label = self.table_model.annotations[row]['label']
+        if field in ('label', 'confidence'):
+            self.display_bboxes()
+        self.log_edit(field, row)
+        self.set_dirty(True)
+
+    def annotation_progress(self, progress, image, entries):
+        """(SLOT) Show progress and store the detections (entries) of every
+        image processed since the last report; the latest image is only
+        rendered when live preview is on."""
         self.progressBar.setValue(progress)
-        self.data['images'][image] = annotations
-        self.next_image()
+        for name in entries:
+            self.data['images'][name] = entries[name]
+            self.log_edit('annotate', image=name)
+        if self.cb_live_preview.isChecked():
+            self.current_image = progress - 1
+            self.next_image()
 
     def annotation_started(self):
         self.progressBar.setFormat("%p%")
@@ -339,8 +429,16 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
                     rec['attribution'] = license['attribution']
                     rec['license'] = license['license']
                     rec['license_url'] = license['license_url']
+                    self.log_edit('license', image=image)
                     self.set_dirty(True)
 
+    def autosave(self):
+        """(Slot) Periodically retry writing saved edits that are not in
+        the annotation file yet, e.g., after a failed compaction."""
+        if (not self.dirty and self.bbx_file is not None and
+                not self.compactor.isRunning() and self.journal.pending()):
+            self.compact()
+
     def bbox_created(self, rect, image_size, meta=None):
         """(Slot) save the newly created bbox and display it."""
         if rect.width() > 0 and rect.height() > 0:
@@ -364,77 +462,105 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
             else:
                 metadata['label'] = self.last_label
             rec['annotations'].append(metadata)
+            self.log_edit('create', len(rec['annotations']) - 1)
             self.display_annotation_data()
-            self.selected_row = self.tw_labels.rowCount() - 1
-            self.tw_labels.selectRow(self.selected_row)
+            self.selected_row = self.table_model.rowCount() - 1
+            self.tv_labels.selectRow(self.selected_row)
 
             self.license.request()
         self.display_bboxes()
 
-    def cell_changed(self, row, column):
-        """(Slot) Update annotation data on change."""
-        header = self.tw_labels.horizontalHeaderItem(column).text().lower()
-        rec = self.data['images'][self.current_file_name]
-        if header == 'label':
-            text = self.tw_labels.cellWidget(row, column).currentText()
-            self.last_label = text
-            rec['annotations'][row]['updated_by'] = 'human'
-            rec['annotations'][row]['confidence'] = 1.0
-            rec['annotations'][row][header] = text
-            self.tw_labels.item(row, 1).setText('1.0')
-            self.display_bboxes()
-        elif header == 'confidence':
-            if self.tw_labels.cellWidget(row, column) is not None:
-                value = self.tw_labels.cellWidget(row, column).text()
-                try:
-                    rec['annotations'][row][header] = float(value)
-                except ValueError:
-                    rec['annotations'][row][header] = 0.0
-                self.display_bboxes()
-        elif header in ('o', 't', 'd'):
-            checked = self.tw_labels.item(row, column).checkState() == QtCore.Qt.Checked
-            text = "Y" if checked else "N"
-            mapping = {'o': 'occluded', 't': 'truncated', 'd': 'difficult'}
-            header = mapping[header]
-            rec['annotations'][row][header] = text
-        else:
-            return
-        self.set_dirty(True)
+    def bbox_moved(self, rect):
+        """(Slot) Store the new position of the active bbox."""
+        self.update_bbox(rect, 'move')
+
+    def bbox_resized(self, rect):
+        """(Slot) Store the new size of the active bbox."""
+        self.update_bbox(rect, 'resize')
 
     def clear_annotations(self):
         """(SLOT) Clear all annotations for the current image."""
-        self.tw_labels.selectionModel().blockSignals(True)
-        self.tw_labels.setRowCount(0)
-        self.tw_labels.selectionModel().blockSignals(False)
-        self.tw_labels.clearSelection()
+        self.tv_labels.selectionModel().blockSignals(True)
+        self.close_label_editor()
+        self.table_model.set_annotations(None)
+        self.tv_labels.selectionModel().blockSignals(False)
+        self.tv_labels.clearSelection()
         if self.data is not None and self.current_file_name in self.data['images']:
             del self.data['images'][self.current_file_name]
+            self.log_edit('clear')
         self.graphicsView.sticky_bbox = False
         self.graphicsView.selected_bbox = None
         self.graphicsView.setFocus()
         self.display_bboxes()
         self.set_dirty(True)
 
-    def delete_click_handler(self):
-        """(SLOT) Handle delete button click."""
-        # Get button that was clicked
-        button = self.sender()
-        # Find location in table
-        row = self.tw_labels.indexAt(button.pos()).row()
+    def compact(self):
+        """Write the full annotation file atomically in a background thread.
+
+        Only called when all journaled edits are saved. Edits made while
+        the file is being written go to a new journal segment and are kept
+        until the next compaction.
+        """
+        self.compactor.wait()
+        self.journal.rotate()
+        self.compactor.jobs = [(self.bbx_file, self.journal, self.bbx_file)]
+        self.compactor.start()
+
+    def compaction_finished(self):
+        """(Slot) Write edits saved while the previous compaction ran."""
+        if self.compact_pending:
+            self.compact_pending = False
+            # Unsaved edits must not reach the file, the next save compacts
+            if not self.dirty and self.bbx_file is not None and self.journal.pending():
+                self.compact()
+
+    def compaction_failed(self, message):
+        """(Slot) Report a failed background write, the edits stay in the journal."""
+        QtWidgets.QMessageBox.warning(self.parent(),
+                                      'ERROR',
+                                      'Unable to write annotation file: {}'.format(message),
+                                      QtWidgets.QMessageBox.Ok)
+
+    def close_label_editor(self):
+        """Close the label combobox if one is open."""
+        if self.label_editor is not None:
+            if self.label_editor.isValid():
+                self.tv_labels.closePersistentEditor(QtCore.QModelIndex(self.label_editor))
+            self.label_editor = None
+
+    def close_project(self):
+        """Drop unsaved edits and write saved edits into the annotation
+        file before another project is opened or the application closes."""
+        self.compactor.wait()
+        self.compact_pending = False
+        if self.journal is not None:
+            if self.dirty:
+                self.journal.truncate_unsaved()
+            if self.bbx_file is not None and self.journal.pending():
+                self.compact()
+                self.compactor.wait()
+            self.journal.close()
+
+    def delete_click_handler(self, row):
+        """(SLOT) Handle delete icon click."""
         # Select row and call delete
-        self.tw_labels.selectRow(row)
+        self.tv_labels.selectRow(row)
         self.delete_selected_row()
 
     def delete_row(self, row, column=None):
         """Delete row from table and associated metadata."""
-        self.tw_labels.selectionModel().blockSignals(True)
-        self.tw_labels.removeRow(row)
-        del self.data['images'][self.current_file_name]['annotations'][row]
-        if self.tw_labels.rowCount() == 0:
+        self.tv_labels.selectionModel().blockSignals(True)
+        self.close_label_editor()
+        rec = self.data['images'][self.current_file_name]
+        self.table_model.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del rec['annotations'][row]
+        self.table_model.endRemoveRows()
+        if self.table_model.rowCount() == 0:
             del self.data['images'][self.current_file_name]
             self.graphicsView.setFocus()
-        self.tw_labels.selectionModel().blockSignals(False)
-        self.tw_labels.clearSelection()
+        self.log_edit('delete', row)
+        self.tv_labels.selectionModel().blockSignals(False)
+        self.tv_labels.clearSelection()
         self.display_bboxes()
         self.set_dirty(True)
 
@@ -443,7 +569,7 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
             return
 
         self.delete_row(self.selected_row)
-        self.tw_labels.clearSelection()
+        self.tv_labels.clearSelection()
         self.graphicsView.sticky_bbox = False
         self.graphicsView.selected_bbox = None
 
@@ -478,64 +604,14 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
 
     def display_annotation_data(self):
         """Display annotation data in table."""
-        self.tw_labels.selectionModel().blockSignals(True)
-        self.tw_labels.setRowCount(0)
-        self.tw_labels.blockSignals(True)
-        image_size = self.graphicsView.image_size
+        self.tv_labels.selectionModel().blockSignals(True)
+        self.label_editor = None
+        annotations = None
         if self.table_frame.isEnabled() and self.current_file_name in self.data['images']:
-            rec = self.data['images'][self.current_file_name]
-            rows = len(rec['annotations'])
-            self.tw_labels.setRowCount(rows)
-            for row, annotation in enumerate(rec['annotations']):
-
-                text = annotation['label']
-                combo = QtWidgets.QComboBox()
-                combo.addItems(self.labels)
-                index = combo.findText(text, QtCore.Qt.MatchFixedString)
-                if index >= 0:
-                    combo.setCurrentIndex(index)
-                else:
-                    combo.setCurrentIndex(0)
-
-                combo.currentIndexChanged.connect(self.label_change_handler)
-                self.tw_labels.setCellWidget(row, 0, combo)
-
-                conf = ''
-                if 'confidence' in annotation:
-                    conf = '{:0.2f}'.format(annotation['confidence'])
-                item = QtWidgets.QTableWidgetItem(conf)
-                self.tw_labels.setItem(row, 1, item)
-
-                width = int((annotation['bbox']['xmax'] - annotation['bbox']['xmin']) * image_size[0])
-                height = int((annotation['bbox']['ymax'] - annotation['bbox']['ymin']) * image_size[1])
-                item = QtWidgets.QTableWidgetItem("{:d} x {:d}".format(width, height))
-                item.setFlags(QtCore.Qt.ItemIsSelectable)
-                self.tw_labels.setItem(row, 2, item)
-
-                item = QtWidgets.QTableWidgetItem()
-                item.setFlags(QtCore.Qt.ItemIsUserCheckable | QtCore.Qt.ItemIsEnabled)
-                item.setCheckState(QtCore.Qt.Checked if annotation['truncated'] == "Y" else QtCore.Qt.Unchecked)
-                self.tw_labels.setItem(row, 3, item)
-
-                item = QtWidgets.QTableWidgetItem()
-                item.setFlags(QtCore.Qt.ItemIsUserCheckable | QtCore.Qt.ItemIsEnabled)
-                item.setCheckState(QtCore.Qt.Checked if annotation['occluded'] == "Y" else QtCore.Qt.Unchecked)
-                self.tw_labels.setItem(row, 4, item)
-
-                item = QtWidgets.QTableWidgetItem()
-                item.setFlags(QtCore.Qt.ItemIsUserCheckable | QtCore.Qt.ItemIsEnabled)
-                item.setCheckState(QtCore.Qt.Checked if annotation['difficult'] == "Y" else QtCore.Qt.Unchecked)
-                self.tw_labels.setItem(row, 5, item)
-
-                delete = QtWidgets.QPushButton()
-                delete.setIconSize(QtCore.QSize(24, 24))
-                delete.setIcon(QtGui.QIcon(':/icons/delete.svg'))
-                delete.clicked.connect(self.delete_click_handler)
-                self.tw_labels.setCellWidget(row, 6, delete)
-
-        self.tw_labels.blockSignals(False)
-        self.tw_labels.selectionModel().blockSignals(False)
-        self.tw_labels.selectRow(self.selected_row)
+            annotations = self.data['images'][self.current_file_name]['annotations']
+        self.table_model.set_annotations(annotations, self.graphicsView.image_size)
+        self.tv_labels.selectionModel().blockSignals(False)
+        self.tv_labels.selectRow(self.selected_row)
 
     def display_bboxes(self):
         """Display bboxes in graphics scene."""
@@ -597,24 +673,57 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
         self.pb_next_ann.setEnabled(True)
         self.pb_clear.setEnabled(True)
 
+    def apply_filter(self):
+        """Restrict the image list to the images with the filter label."""
+        if self.filter_label == '':
+            self.image_list = self.original_image_list
+        else:
+            positions = self.image_index.images_with_label(self.filter_label)
+            self.image_list = [self.original_image_list[p] for p in positions]
+
     def filter(self):
         if len(self.image_list) > 0:
-            label = QtWidgets.QInputDialog.getText(self, 'Filter images list for ...', 'Label')[0]
-            if label == '':
-                self.image_list = self.original_image_list
-            else:
-                self.image_list = []
-                for image in self.data['images']:
-                    ann = self.data['images'][image]['annotations']
-                    for a in ann:
-                        if a['label'] == label:
-                            self.image_list.append(image)
+            self.filter_label = QtWidgets.QInputDialog.getText(self, 'Filter images list for ...', 'Label')[0]
+            self.apply_filter()
             self.load_first_image()
 
     def filter_reset(self):
-        self.image_list = self.original_image_list
+        self.filter_label = ''
+        self.apply_filter()
         self.load_first_image()
 
+    def image_scan_complete(self, directory, images):
+        """(Slot) Replace the streamed list with the sorted image list."""
+        if directory != self.image_directory or self.listing_complete:
+            return
+        self.listing_complete = True
+        self.original_image_list = images
+        self.image_index.build(self.original_image_list, self.data['images'])
+        self.apply_filter()
+        self.labelImages.setText('of ' + str(len(self.image_list)))
+        if self.current_file_name in self.image_list:
+            self.current_image = self.image_list.index(self.current_file_name) + 1
+            self.lineEditCurrentImage.setText(str(self.current_image))
+            self.thumbnails.set_images(self.image_directory, self.image_list)
+            self.thumbnails.set_current(self.current_image - 1)
+        else:
+            self.load_first_image()
+
+    def images_found(self, directory, images):
+        """(Slot) Show images as they are found, starting with the first."""
+        if directory != self.image_directory or self.listing_complete:
+            return
+        first = len(self.original_image_list) == 0
+        self.original_image_list += images
+        if self.image_list is not self.original_image_list:
+            # A filter is active, the list is rebuilt when the scan completes
+            return
+        self.labelImages.setText('of ' + str(len(self.image_list)) + '...')
+        if first:
+            self.load_first_image()
+        else:
+            self.thumbnails.append_images(images)
+
     def jump_to_image(self):
         """(Slot) Just to a specific image when when line edit changes."""
         try:
@@ -627,15 +736,6 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
         except ValueError:
             self.lineEditCurrentImage.setText(str(self.current_image))
 
-    def label_change_handler(self):
-        """(SLOT) Handle index change from lable combobox."""
-        # Get combobox that changed
-        cbox = self.sender()
-        # Find location in table
-        row = self.tw_labels.indexAt(cbox.pos()).row()
-        # Select row and call delete
-        self.cell_changed(row, 0)
-
     def load_config(self, directory):
         dir_name = directory
         file_name = os.path.join(dir_name, 'bboxee_config.json')
@@ -681,6 +781,7 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
         self.current_image = 1
         self.labelImages.setText('of ' + str(len(self.image_list)))
         self.lineEditCurrentImage.setText('1')
+        self.thumbnails.set_images(self.image_directory, self.image_list)
         self.graphicsView.pixmap = None  # Force resize
         self.load_image()
 
@@ -693,15 +794,18 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
                                               'Select Directory',
                                               self.image_directory))
             if directory != '':
+                self.close_project()
                 self.load_config(directory)
                 self.image_directory = directory
                 self.data = schema.annotation_file()
+                self.open_journal(None)
                 self.populate_labels()
                 self.mask = None
                 self.load_image_list()
                 self.pb_mask.setEnabled(True)
+                self.pb_save_as.setEnabled(True)
                 self.pb_annotater.setEnabled(True)
-                self.set_dirty(False)
+                self.set_dirty(self.recover_journal())
                 self.label_image_directory.setText(self.image_directory)
 
     def load_from_file(self):
@@ -714,11 +818,11 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
                                          self.image_directory,
                                          'BBoxEE (*.bbx)'))
             if file_name[0] != '':
-                file = open(file_name[0], 'r')
-                self.data = json.load(file)
-                file.close()
+                self.close_project()
+                self.data = binary_bbx.load(file_name[0])
                 self.image_directory = os.path.split(file_name[0])[0]
                 self.load_config(self.image_directory)
+                self.open_journal(file_name[0])
 
                 self.populate_labels()
                 if self.data['mask'] is not None:
@@ -728,9 +832,10 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
                     self.mask = None
                 self.display_analysts()
                 self.load_image_list()
-                self.set_dirty(False)
+                self.set_dirty(self.recover_journal())
                 self.pb_annotater.setEnabled(True)
                 self.pb_mask.setEnabled(True)
+                self.pb_save_as.setEnabled(True)
                 self.label_image_directory.setText(self.image_directory)
 
     def load_image(self):
@@ -756,24 +861,79 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
             self.display_annotation_data()
             self.graphicsView.setFocus()
             self.display_license()
+            self.thumbnails.set_current(self.current_image - 1)
 
     def load_image_list(self):
-        """Glob the image files and save to image list."""
+        """Find the image files and save to image list.
+
+        A cached listing is used if the directory has not changed,
+        otherwise the directory is scanned in a background thread.
+        """
         if self.image_directory != '':
-            self.original_image_list = []
-            self.image_list = []
+            if self.scanner.isRunning():
+                self.scanner.stop = True
+                self.scanner.wait()
             self.image_directory += os.path.sep
-            files = glob.glob(self.image_directory + '*')
-            image_format = [".jpg", ".jpeg", ".png"]
-            f = (lambda x: os.path.splitext(x)[1].lower() in image_format)
-            self.image_list = list(filter(f, files))
-            self.image_list = [os.path.basename(x) for x in self.image_list]
-            self.image_list = sorted(self.image_list)
-            self.original_image_list = self.image_list
-            self.load_first_image()
+            self.current_file_name = ''
+            self.filter_label = ''
+            images = discovery.cached_listing(self.image_directory)
+            if images is None:
+                self.original_image_list = []
+                self.image_list = self.original_image_list
+                self.image_index.build(self.original_image_list, self.data['images'])
+                self.listing_complete = False
+                self.load_first_image()
+                self.scanner.directory = self.image_directory
+                self.scanner.start()
+            else:
+                self.listing_complete = True
+                self.original_image_list = images
+                self.image_list = self.original_image_list
+                self.image_index.build(self.original_image_list, self.data['images'])
+                self.load_first_image()
+
+    def log_edit(self, op, row=None, image=None):
+        """Record the current state of an image entry in the journal and
+        keep the image index up to date."""
+        image = self.current_file_name if image is None else image
+        entry = self.data['images'].get(image)
+        if op in ('create', 'delete', 'clear', 'label', 'annotate'):
+            self.image_index.update(image, entry)
+        if self.journal is not None:
+            self.journal.append(op, image, entry, row)
+
+    def log_file_edit(self, key):
+        """Record a change to a top level key in the journal."""
+        if self.journal is not None:
+            self.journal.append_file(key, self.data[key])
+
+    def log_replace(self, data):
+        """Record the differences between the current annotations and the
+        annotations that replace them.
+
+        Entries of the new data were journaled as they were reported by
+        the annotator, so only removed images and top level keys remain.
+        """
+        for image in self.data['images']:
+            if image not in data['images']:
+                self.journal.append('annotate', image, None)
+        for key in self.data:
+            if key not in data:
+                self.journal.append_drop(key)
+        for key in data:
+            if key != 'images' and (key not in self.data or self.data[key] != data[key]):
+                self.journal.append_file(key, data[key])
 
     def next_annotated_image(self):
         """(Slot) Jump to the next image that has been annotated."""
+        if self.image_list is self.original_image_list:
+            position = self.image_index.next_annotated(self.current_image - 1)
+            if position is not None:
+                self.current_image = position + 1
+            self.lineEditCurrentImage.setText(str(self.current_image))
+            self.load_image()
+            return
+        # Filtered lists are short, walk them
         index = self.current_image
         while index < len(self.image_list):
             image_name = self.image_list[index]
@@ -793,23 +953,44 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
             self.load_image()
 
     def next_row(self):
-        if self.tw_labels.rowCount() != 0:
-            self.tw_labels.selectRow((self.selected_row + 1) % self.tw_labels.rowCount())
+        if self.table_model.rowCount() != 0:
+            self.tv_labels.selectRow((self.selected_row + 1) % self.table_model.rowCount())
             self.graphicsView.sticky_bbox = True
         else:
             self.graphicsView.sticky_bbox = False
 
+    def open_journal(self, bbx_file):
+        """Attach a journal to the annotation file being edited.
+
+        Args:
+            bbx_file (str): Annotation file or None if not saved yet
+        """
+        if self.journal is not None:
+            self.journal.close()
+        self.bbx_file = bbx_file
+        if bbx_file is None:
+            bbx_file = untitled_name(self.image_directory)
+        self.journal = Journal(bbx_file)
+
     def populate_labels(self):
         if self.labels is None:
             label_set = set()
-            for image_name, annotations in self.data['images'].items():
-                for annotation in annotations['annotations']:
-                    label_set.add(annotation['label'])
+            for image_name in self.data['images']:
+                label_set.update(box_labels(self.data['images'], image_name))
 
             self.labels = ['N/A'] + list(label_set)
+        self.label_delegate.labels = self.labels
 
     def previous_annotated_image(self):
         """(Slot) Jump to the previous image that has been annotated."""
+        if self.image_list is self.original_image_list:
+            position = self.image_index.previous_annotated(self.current_image - 1)
+            if position is not None:
+                self.current_image = position + 1
+            self.lineEditCurrentImage.setText(str(self.current_image))
+            self.load_image()
+            return
+        # Filtered lists are short, walk them
         index = self.current_image - 2
         while index >= 0:
             image_name = self.image_list[index]
@@ -829,28 +1010,98 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
             self.load_image()
 
     def prev_row(self):
-        self.tw_labels.selectRow((self.selected_row - 1) % self.tw_labels.rowCount())
+        if self.table_model.rowCount() == 0:
+            return
+        self.tv_labels.selectRow((self.selected_row - 1) % self.table_model.rowCount())
         self.graphicsView.sticky_bbox = True
 
+    def recover_journal(self):
+        """Replay saved edits that have not been compacted yet and offer
+        to replay edits that were not saved before a crash.
+
+        Returns:
+            bool: True if unsaved edits were recovered
+        """
+        if not self.journal.pending():
+            return False
+        recovered = False
+        if self.journal.unsaved() > 0:
+            response = QtWidgets.QMessageBox.question(self,
+                                                      'Recover Annotations',
+                                                      'Unsaved edits from a previous session were found.\n'
+                                                      'Do you want to recover them?')
+            if response == QtWidgets.QMessageBox.Yes:
+                recovered = True
+            else:
+                self.journal.truncate_unsaved()
+        if self.journal.replay(self.data) > 0:
+            if self.data['mask'] is not None:
+                tmp = np.array(self.data['mask'], dtype='uint8')
+                self.mask = np.dstack((tmp, tmp, tmp))
+            self.image_index.build(self.original_image_list, self.data['images'])
+            self.display_analysts()
+            self.load_image()
+        return recovered
+
     def resizeEvent(self, event):
         """Overload resizeEvent to fit image in graphics view."""
         self.graphicsView.resize()
 
     def save(self):
-        """(Slot) Save the annotations to disk."""
+        """(Slot) Save the annotations to disk.
+
+        The edits are already in the journal, saving marks them as kept
+        and rewrites the annotation file in the background.
+        """
+        if self.bbx_file is None:
+            return self.save_as()
+        self.journal.mark_saved()
+        self.set_dirty(False)
+        if self.compactor.isRunning():
+            # Picked up when the running compaction finishes
+            self.compact_pending = True
+        else:
+            self.compact()
+        return True
+
+    def save_as(self):
+        """(Slot) Save the annotations to a new file."""
+        if self.data is None:
+            return False
         saved = False
+        if self.bbx_file is None:
+            default_name = self.image_directory + 'untitled.bbx'
+        else:
+            default_name = self.bbx_file
         file_name = (QtWidgets.
                      QFileDialog.
                      getSaveFileName(self,
                                      'Save Annotations',
-                                     self.image_directory + 'untitled.bbx',
+                                     default_name,
                                      'BBoxEE (*.bbx)'))
         if file_name[0] != '':
             if os.path.samefile(self.image_directory,
                                 os.path.split(file_name[0])[0]):
-                file = open(file_name[0], 'w')
-                json.dump(self.data, file, indent=4)
-                file.close()
+                if self.bbx_file is not None and os.path.abspath(file_name[0]) == os.path.abspath(self.bbx_file):
+                    return self.save()
+                self.compactor.wait()
+                # All edits, saved or not, become the saved state of the new
+                # file; the old file keeps what was saved to it
+                old_file = self.bbx_file
+                old_journal = self.journal
+                self.open_journal(file_name[0])
+                old_journal.copy_to(self.journal)
+                self.journal.mark_saved()
+                self.journal.rotate()
+                jobs = [(old_file, self.journal, self.bbx_file)]
+                if old_file is None:
+                    old_journal.clear()
+                else:
+                    old_journal.truncate_unsaved()
+                    if old_journal.pending():
+                        jobs.append((old_file, old_journal, old_file))
+                self.compactor.jobs = jobs
+                self.compactor.start()
                 self.set_dirty(False)
                 saved = True
             else:
@@ -892,11 +1143,13 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
                         distance = line.length()
 
             if found:
-                self.tw_labels.selectRow(current_index)
+                self.tv_labels.selectRow(current_index)
                 # Set focus to combobox to allow keyboard entry shortcuts
-                self.tw_labels.cellWidget(current_index, 0).setFocus()
+                editor = self.tv_labels.indexWidget(self.table_model.index(current_index, LABEL))
+                if editor is not None:
+                    editor.setFocus()
             else:
-                self.tw_labels.clearSelection()
+                self.tv_labels.clearSelection()
                 # Clear the focus from previous combobox
                 self.graphicsView.setFocus()
 
@@ -920,6 +1173,8 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
                 mask = mask.reshape(mask.shape[:-1])
                 self.data['mask'] = mask.tolist()
                 self.data['mask_name'] = os.path.split(file[0])[1]
+                self.log_file_edit('mask')
+                self.log_file_edit('mask_name')
                 self.set_dirty(True)
             else:
                 print('TODO: Display Message')
@@ -928,8 +1183,12 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
 
     def selection_changed(self, selected, deselected):
         """(Slot) Listen for selection and deselection of rows."""
+        self.close_label_editor()
         if selected.indexes():
             self.selected_row = selected.indexes()[0].row()
+            index = self.table_model.index(self.selected_row, LABEL)
+            self.tv_labels.openPersistentEditor(index)
+            self.label_editor = QtCore.QPersistentModelIndex(index)
         else:
             self.selected_row = -1
             self.graphicsView.selected_bbox = None
@@ -967,6 +1226,12 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
                 message += "{}: {}\n".format(label, summary[label])
             QtWidgets.QMessageBox.information(self, 'Annotation Summary', message)
 
+    def thumbnail_selected(self, row):
+        """(Slot) Load the image picked in the thumbnail strip."""
+        self.current_image = row + 1
+        self.lineEditCurrentImage.setText(str(self.current_image))
+        self.load_image()
+
     def update_annotation(self, annotation_data):
         """(Slot) Update annotation table widget."""
         if self.selected_row >= 0:
@@ -976,10 +1241,10 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
             for key in annotation_data.keys():
                 ann[key] = annotation_data[key]
                 ann['updated_by'] = 'human'
-            self.display_annotation_data()
+            self.table_model.refresh_row(self.selected_row)
 
-    def update_bbox(self, rect):
-        """(Slot) Store the new geometry for the active bbox."""
+    def update_bbox(self, rect, op='move'):
+        """Store the new geometry for the active bbox."""
         if rect.width() > 1.0 and rect.height() > 1.0:
             self.set_dirty(True)
             rec = self.data['images'][self.current_file_name]
@@ -991,6 +1256,7 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
             ann['bbox']['ymin'] = rect.top() / self.graphicsView.image_size[1]
             ann['bbox']['ymax'] = rect.bottom() / self.graphicsView.image_size[1]
             self.update_annotation(ann)
+            self.log_edit(op, self.selected_row)
 
     def update_license(self, license):
         if self.data is not None and self.current_file_name in self.data['images']:
@@ -998,3 +1264,4 @@ class AnnotationWidget(QtWidgets.QWidget, WIDGET):
             rec['attribution'] = license['attribution']
             rec['license'] = license['license']
             rec['license_url'] = license['license_url']
+            self.log_edit('license')
@@ -26,9 +26,15 @@ import os
 import sys
 import glob
 import json
+import numpy as np
 from PyQt5 import QtCore, QtWidgets, QtGui, uic
 from bboxee.gui import CocoDialog
 from bboxee import schema
+from bboxee import binary_bbx
+from bboxee.store import AnnotationStore, FLAGS
+from bboxee.project_db import ProjectDatabase
+from bboxee.label_index import LabelIndex
+from bboxee.progress import ProgressThrottle
 
 if getattr(sys, 'frozen', False):
     bundle_dir = sys._MEIPASS
@@ -36,78 +42,93 @@ else:
     bundle_dir = os.path.dirname(__file__)
 EXPORT, _ = uic.loadUiType(os.path.join(bundle_dir, 'export_widget.ui'))
 
+# Files listed in the search summary, every image is in the details
+SEARCH_FILES_SHOWN = 20
+# Every combination of the truncated, occluded and difficult flag bits
+EXCLUSION_COMBINATIONS = 8
+
 
 class Globber(QtCore.QThread):
     """Threaded worker to keep gui from freezing while search
        for and pre-processing annotation files."""
 
     progress = QtCore.pyqtSignal(int)
-    finished = QtCore.pyqtSignal(dict, dict)
+    finished = QtCore.pyqtSignal(dict, dict, object)
     init_progress = QtCore.pyqtSignal(int, str)
 
     def __init__(self):
         """Class init function."""
         QtCore.QThread.__init__(self)
         self.directory = ''
+        self.use_database = False
+        self.throttle = ProgressThrottle()
+
+    def report_sync(self, count, total):
+        """Report progress of the project database sync."""
+        if count == 1:
+            self.init_progress.emit(total, 'Syncing %p%')
+        if self.throttle.ready(count == total):
+            self.progress.emit(count)
 
     def run(self):
         """The starting point for the thread."""
         self.init_progress.emit(0, 'Scanning...')
-        file_list = glob.glob(self.directory + os.path.sep + '**/*.bbx',
-                              recursive=True)
+        database = None
+        if self.use_database:
+            # Only files changed since the last sync are read from disk
+            database = ProjectDatabase(self.directory)
+            database.sync(self.report_sync)
+            file_list = database.files()
+            load = database.read_file
+        else:
+            file_list = glob.glob(self.directory + os.path.sep + '**/*.bbx',
+                                  recursive=True)
+            load = binary_bbx.load
         self.init_progress.emit(len(file_list), 'Parsing %p%')
         data = {}
         masks = {}
+        # One columnar store holds the annotations of every file
+        store = AnnotationStore()
+        # Store image index to (bbx file, image name) for the label index
+        locations = {}
         for p, bbx_file in enumerate(file_list):
             # Read labels from original annotaiton file and summarize by file.
-            file = open(bbx_file, 'r')
-            contents = json.load(file)
-            file.close()
+            contents = load(bbx_file)
 
             data[bbx_file] = {'summary': '',
                               'labels': {},
                               'images': {},
                               'mask_name': ''}
-            summary = {}
             # Store mask and set name in data object
             if contents['mask_name'] != '':
                 if contents['mask_name'] not in masks:
                     masks[contents['mask_name']] = contents['mask']
             data[bbx_file]['mask_name'] = contents['mask_name']
-            # Loop through all of the images and summarize
-            for entry in contents['images']:
-                data[bbx_file]['images'][entry] = contents['images'][entry]
-                labels = {}
-                exclusions = {}
-
-                annotations = contents['images'][entry]['annotations']
-                for annotation in annotations:
-                    if annotation['label'] not in labels:
-                        labels[annotation['label']] = 1
-                    else:
-                        labels[annotation['label']] += 1
-
-                    if annotation['label'] not in summary:
-                        summary[annotation['label']] = 1
-                    else:
-                        summary[annotation['label']] += 1
-
-                    if annotation['truncated'] == "Y":
-                        exclusions['truncated'] = True
-                    if annotation['occluded'] == "Y":
-                        exclusions['occluded'] = True
-                    if annotation['difficult'] == "Y":
-                        exclusions['difficult'] = True
-                tmp = contents['images'][entry]
-                tmp['exclusions'] = exclusions
-                tmp['labels'] = labels
+            images = store.add_images(contents['images'])
+            data[bbx_file]['images'] = images
+            for name, index in images.indexes.items():
+                locations[index] = (bbx_file, name)
+            summary = store.label_counts(images.rows())
             string = ''
             data[bbx_file]['labels'] = summary
             for label in summary:
                 string += label + ': ' + str(summary[label]) + "\n"
             data[bbx_file]['summary'] = string
-            self.progress.emit(p + 1)
-        self.finished.emit(data, masks)
+            if self.throttle.ready(p + 1 == len(file_list)):
+                self.progress.emit(p + 1)
+        if database is not None:
+            database.close()
+        # Label counts of every file for each combination of exclusion
+        # flags, so toggling an exclusion only sums precomputed rows
+        files = list(data)
+        indexes = [data[f]['images'].image_indexes() for f in files]
+        groups = np.repeat(np.arange(len(files)), [len(i) for i in indexes])
+        indexes = np.concatenate(indexes) if len(files) > 0 else np.zeros(0, dtype=np.int64)
+        counts = np.stack([store.group_label_counts(indexes, groups, len(files), mask)
+                           for mask in range(EXCLUSION_COMBINATIONS)])
+        for number, bbx_file in enumerate(files):
+            data[bbx_file]['exclusion_counts'] = counts[:, number]
+        self.finished.emit(data, masks, LabelIndex(store, locations))
 
 
 class ExportWidget(QtWidgets.QWidget, EXPORT):
@@ -121,6 +142,7 @@ class ExportWidget(QtWidgets.QWidget, EXPORT):
         self.masks = {}
         self.label_map = {}
         self.exporter = None
+        self.label_index = None
 
         self.globber = Globber()
         self.globber.finished.connect(self.display)
@@ -176,7 +198,7 @@ class ExportWidget(QtWidgets.QWidget, EXPORT):
         else:
             self.spinBoxShards.setEnabled(False)
 
-    def display(self, data, masks):
+    def display(self, data, masks, label_index):
         """(Slot) Display annotation files in table with summary count
         by label."""
         self.tw_files.setRowCount(len(data))
@@ -195,35 +217,11 @@ class ExportWidget(QtWidgets.QWidget, EXPORT):
         self.progressBar.setRange(0, 1)
         self.base_data = data
         self.masks = masks
+        self.label_index = label_index
 
     def exclude_changed(self):
-        labels = {}
-        cbt = self.cb_truncated.isChecked()
-        cbo = self.cb_occluded.isChecked()
-        cbd = self.cb_difficult.isChecked()
-        for index in self.tw_files.selectionModel().selectedRows():
-            bbx_file = self.tw_files.item(index.row(), 0).text()
-            for label in self.base_data[bbx_file]['labels']:
-                if label not in labels:
-                    labels[label] = self.base_data[bbx_file]['labels'][label]
-                else:
-                    labels[label] += self.base_data[bbx_file]['labels'][label]
-            # If something is checked find and subtract from total
-            if cbt or cbo or cbd:
-                for image in self.base_data[bbx_file]['images']:
-                    entry = self.base_data[bbx_file]['images'][image]
-                    match = False
-                    if cbt and 'truncated' in entry['exclusions']:
-                        match = True
-                    if cbo and 'occluded' in entry['exclusions']:
-                        match = True
-                    if cbd and 'difficult' in entry['exclusions']:
-                        match = True
-                    if match:
-                        for label in entry['labels']:
-                            labels[label] -= entry['labels'][label]
-
-        self.update_remap_table(labels)
+        """(Slot) Update label counts for the checked exclusions."""
+        self.update_remap_table(self.selected_label_counts())
 
     def export(self, images):
         export_to = self.comboBoxFormat.currentText()
@@ -271,9 +269,7 @@ class ExportWidget(QtWidgets.QWidget, EXPORT):
 
     def export_preflight(self):
         """(Slot) Prepare data and select exporter."""
-        cbt = self.cb_truncated.isChecked()
-        cbo = self.cb_occluded.isChecked()
-        cbd = self.cb_difficult.isChecked()
+        mask = self.exclusion_mask()
         images = []
 
         # Build an excluded label list
@@ -286,21 +282,19 @@ class ExportWidget(QtWidgets.QWidget, EXPORT):
             bbx_file = self.tw_files.item(index.row(), 0).text()
             img_list = self.base_data[bbx_file]['images']
 
+            # Flag images with excluded boxes or labels in bulk
+            store = img_list.store
+            indexes = img_list.image_indexes()
+            skip = (store.image_flags(indexes) & mask) != 0
+            if len(excludes) > 0:
+                labels = store.labels(store.rows(indexes))
+                skip |= store.image_any(indexes, np.isin(labels, excludes))
+
             # Loop through images in annotation file
             directory = os.path.split(bbx_file)[0]
-            for img_name in img_list:
-                process = True
+            for img_name, excluded in zip(img_list, skip):
+                process = not excluded
                 entry = img_list[img_name]
-                if cbt or cbo or cbd:
-                    if cbt and 'truncated' in entry['exclusions']:
-                        process = False
-                    if cbo and 'occluded' in entry['exclusions']:
-                        process = False
-                    if cbd and 'difficult' in entry['exclusions']:
-                        process = False
-                for label in excludes:
-                    if label in entry['labels']:
-                        process = False
                 if process:
                     image = schema.package_entry()
                     image['directory'] = directory
@@ -317,6 +311,17 @@ class ExportWidget(QtWidgets.QWidget, EXPORT):
                     images.append(image)
         self.export(images)
 
+    def exclusion_mask(self):
+        """Return the store flag bits of the checked exclusions."""
+        mask = 0
+        if self.cb_truncated.isChecked():
+            mask |= FLAGS['truncated']
+        if self.cb_occluded.isChecked():
+            mask |= FLAGS['occluded']
+        if self.cb_difficult.isChecked():
+            mask |= FLAGS['difficult']
+        return mask
+
     def exported(self, train_size, val_size):
         """(Slot) Enable buttons when packaging is completed."""
         message = "Training images: {}\nValidation images: {} ".format(train_size, val_size)
@@ -338,6 +343,7 @@ class ExportWidget(QtWidgets.QWidget, EXPORT):
             self.pb_export.setEnabled(False)
             self.progressBar.setRange(0, 0)
             self.globber.directory = directory
+            self.globber.use_database = self.cb_project_db.isChecked()
             self.globber.start()
 
     def load_label_map(self):
@@ -367,28 +373,60 @@ class ExportWidget(QtWidgets.QWidget, EXPORT):
             self.selection_changed()
 
     def search(self):
-        if len(self.base_data.keys()) > 0:
-            label = QtWidgets.QInputDialog.getText(self, 'Search for ...', 'Label')[0]
-            message = ''
-            if label != '':
-                for bbx_file in self.base_data:
-                    labels = self.base_data[bbx_file]['labels']
-                    if label in labels:
-                        message += "{}\n".format(bbx_file)
-                if message == '':
-                    message = 'No bbx files were found containing the label: {}'.format(label)
-                QtWidgets.QMessageBox.information(self, 'Matching BBX Files', message)
-
-    def selection_changed(self):
-        labels = {}
+        """(Slot) Find the images matching a boolean label query."""
+        if self.label_index is None:
+            return
+        query = QtWidgets.QInputDialog.getText(self,
+                                               'Search for ...',
+                                               'Labels, e.g., Bobcat AND NOT Human, confidence < 0.5')[0]
+        if query == '':
+            return
+        try:
+            matches = self.label_index.search(query)
+        except ValueError as error:
+            QtWidgets.QMessageBox.warning(self, 'Search', 'Invalid query: {}'.format(error))
+            return
+        if len(matches) == 0:
+            message = 'No images were found matching: {}'.format(query)
+            QtWidgets.QMessageBox.information(self, 'Matching Images', message)
+            return
+        files = {}
+        for bbx_file, image in matches:
+            files.setdefault(bbx_file, []).append(image)
+        message = ''
+        for bbx_file in list(files)[:SEARCH_FILES_SHOWN]:
+            message += "{} ({} images)\n".format(bbx_file, len(files[bbx_file]))
+        if len(files) > SEARCH_FILES_SHOWN:
+            message += 'and {} more files\n'.format(len(files) - SEARCH_FILES_SHOWN)
+        msg_box = QtWidgets.QMessageBox(self)
+        msg_box.setWindowTitle('Matching Images')
+        msg_box.setText('{} images in {} files match: {}'.format(len(matches), len(files), query))
+        msg_box.setInformativeText(message)
+        msg_box.setDetailedText('\n'.join(os.path.join(os.path.split(f)[0], i) for f, i in matches))
+        msg_box.setStandardButtons(QtWidgets.QMessageBox.Ok)
+        msg_box.exec()
+
+    def selected_label_counts(self):
+        """Label counts of the selected files without the excluded images.
+
+        Labels of the selection keep a row even when all of their boxes
+        are excluded.
+        """
+        mask = self.exclusion_mask()
+        total = None
         for index in self.tw_files.selectionModel().selectedRows():
             bbx_file = self.tw_files.item(index.row(), 0).text()
-            for label in self.base_data[bbx_file]['labels']:
-                if label not in labels:
-                    labels[label] = self.base_data[bbx_file]['labels'][label]
-                else:
-                    labels[label] += self.base_data[bbx_file]['labels'][label]
-        self.update_remap_table(labels)
+            counts = self.base_data[bbx_file]['exclusion_counts'][[0, mask]]
+            total = counts if total is None else total + counts
+        labels = {}
+        if total is not None:
+            names = self.label_index.store.categories[0]
+            for code in np.flatnonzero(total[0]):
+                labels[names[code]] = int(total[1, code])
+        return labels
+
+    def selection_changed(self):
+        self.update_remap_table(self.selected_label_counts())
 
     def update_label_map(self, row, column):
         """(Slot) Update label map when cell in table changes."""
@@ -44,6 +44,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def closeEvent(self, event):
         if self.annotation_widget.dirty_data_check():
+            self.annotation_widget.close_project()
             event.accept()
         else:
             event.ignore()
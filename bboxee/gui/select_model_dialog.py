@@ -24,6 +24,7 @@
 # --------------------------------------------------------------------------
 import os
 import sys
+import importlib
 from PyQt5 import QtCore, QtWidgets, QtGui, uic
 
 if getattr(sys, 'frozen', False):
@@ -56,6 +57,27 @@ class SelectModelDialog(QtWidgets.QDialog, DIALOG):
         self.model = None
         self.pushButtonLabelMapV2.clicked.connect(self.get_label_map_2)
 
+        self.pushButtonCPU.clicked.connect(self.cpu_runtime_selected)
+        self.pushButtonCPUModel.clicked.connect(self.get_cpu_model)
+        self.pushButtonLabelMapCPU.clicked.connect(self.get_label_map_cpu)
+
+    def create_annotator(self, backend, args):
+        """Create a local annotator or a client for the model server.
+
+        Args:
+            backend (str): Annotator module name in bboxee.annotator
+            args (tuple): Backend arguments, the label map is always second
+        """
+        if self.checkBoxModelServer.isChecked():
+            from bboxee.annotator.remote import Annotator
+            return Annotator(backend, args, args[1])
+        module = importlib.import_module('bboxee.annotator.{}'.format(backend))
+        return module.Annotator(*args)
+
+    def server_not_found(self):
+        message = 'Model server not found, start it with: python -m bboxee.model_server'
+        QtWidgets.QMessageBox.critical(self, 'Model Server', message)
+
     def set_label(self, label, text):
         qfm = QtGui.QFontMetrics(label.font())
         width = label.width() - 2
@@ -69,15 +91,17 @@ class SelectModelDialog(QtWidgets.QDialog, DIALOG):
         self.pushButtonLabelMapV1.setDisabled(True)
         self.pushButtonTFGraph.setDisabled(True)
         try:
-            from bboxee.annotator.tensorflow_v1_frozen import Annotator
             graph = self.labelTFGraph.raw_text
             label_map = self.labelLabelMapV1.raw_text
-            self.annotator = Annotator(graph, label_map)
+            args = (graph, label_map, self.spinBoxThreadsV1.value())
+            self.annotator = self.create_annotator('tensorflow_v1_frozen', args)
             self.selected.emit(self.annotator)
             self.hide()
         except ModuleNotFoundError:
             message = 'Required TensorFlow modules not found.'
             QtWidgets.QMessageBox.critical(self, 'Export', message)
+        except ConnectionRefusedError:
+            self.server_not_found()
         self.pushButtonTFV1.setDisabled(False)
         self.pushButtonLabelMapV1.setDisabled(False)
         self.pushButtonTFGraph.setDisabled(False)
@@ -88,23 +112,60 @@ class SelectModelDialog(QtWidgets.QDialog, DIALOG):
         self.pushButtonLabelMapV2.setDisabled(True)
         self.pushButtonTFModel.setDisabled(True)
         try:
-            import tensorflow as tf
-            if tf.__version__[0] == '1':
-                raise ModuleNotFoundError('')
-            from bboxee.annotator.tensorflow_v2_saved import Annotator
+            if not self.checkBoxModelServer.isChecked():
+                import tensorflow as tf
+                if tf.__version__[0] == '1':
+                    raise ModuleNotFoundError('')
             model = self.labelTFModel.raw_text
             label_map = self.labelLabelMapV2.raw_text
-            self.annotator = Annotator(model, label_map)
+            self.annotator = self.create_annotator('tensorflow_v2_saved', (model, label_map))
             self.selected.emit(self.annotator)
             self.hide()
         except ModuleNotFoundError:
             message = 'Required TensorFlow modules not found.'
             QtWidgets.QMessageBox.critical(self, 'Export', message)
+        except ConnectionRefusedError:
+            self.server_not_found()
         self.pushButtonTFV2.setDisabled(False)
         self.pushButtonLabelMapV2.setDisabled(False)
         self.pushButtonTFModel.setDisabled(False)
 
+    def cpu_runtime_selected(self):
+        """Load an ONNX or TFLite model and label map."""
+        self.pushButtonCPU.setDisabled(True)
+        self.pushButtonLabelMapCPU.setDisabled(True)
+        self.pushButtonCPUModel.setDisabled(True)
+        try:
+            model = self.labelCPUModel.raw_text
+            label_map = self.labelLabelMapCPU.raw_text
+            args = (model, label_map, self.spinBoxThreads.value())
+            self.annotator = self.create_annotator('cpu_runtime', args)
+            self.selected.emit(self.annotator)
+            self.hide()
+        except ModuleNotFoundError:
+            message = 'Required ONNX Runtime or TFLite modules not found.'
+            QtWidgets.QMessageBox.critical(self, 'Export', message)
+        except ValueError as error:
+            # Unsupported model format or unreadable label map
+            QtWidgets.QMessageBox.critical(self, 'Export', str(error))
+        except ConnectionRefusedError:
+            self.server_not_found()
+        self.pushButtonCPU.setDisabled(False)
+        self.pushButtonLabelMapCPU.setDisabled(False)
+        self.pushButtonCPUModel.setDisabled(False)
+
     # Helper functions
+    def get_cpu_model(self):
+        file_name = (QtWidgets.
+                     QFileDialog.
+                     getOpenFileName(self,
+                                     'Select ONNX or TFLite Model',
+                                     self.last_dir, 'Model (*.onnx *.tflite)'))
+        if file_name[0] != '':
+            self.set_label(self.labelCPUModel, file_name[0])
+            self.last_dir = os.path.split(file_name[0])[0]
+            self.pushButtonCPU.setDisabled(False)
+
     def get_inference_graph(self):
         file_name = (QtWidgets.
                      QFileDialog.
@@ -148,3 +209,14 @@ class SelectModelDialog(QtWidgets.QDialog, DIALOG):
             self.set_label(self.labelTFModel, directory)
             self.last_dir = directory
             self.pushButtonTFV2.setDisabled(False)
+
+    def get_label_map_cpu(self):
+        file_name = (QtWidgets.
+                     QFileDialog.
+                     getOpenFileName(self,
+                                     'Select Label Map',
+                                     self.last_dir, 'Label Map (*.pbtxt *.txt)'))
+        if file_name[0] != '':
+            self.set_label(self.labelLabelMapCPU, file_name[0])
+            self.last_dir = os.path.split(file_name[0])[0]
+            self.pushButtonCPUModel.setDisabled(False)
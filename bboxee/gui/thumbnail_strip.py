@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from PIL import Image
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+THUMBNAIL_SIZE = 96
+# Number of thumbnails held in memory, the rest are reloaded from disk
+MEMORY_CACHE_SIZE = 2000
+# Bounds of the thumbnail cache on disk, least recently used files go first
+DISK_CACHE_BYTES = 256 * 1024 ** 2
+DISK_CACHE_AGE = 90 * 24 * 60 * 60
+
+
+def thumbnail_cache_directory():
+    """Persistent directory used to store generated thumbnails."""
+    location = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.GenericCacheLocation)
+    directory = os.path.join(location, 'bboxee', 'thumbnails')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def prune_thumbnail_cache(directory, max_bytes=DISK_CACHE_BYTES, max_age=DISK_CACHE_AGE):
+    """Remove thumbnails not used within max_age seconds and the least
+    recently used ones until the cache is under max_bytes."""
+    entries = []
+    for entry in os.scandir(directory):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    total = sum([e[1] for e in entries])
+    oldest = time.time() - max_age
+    for mtime, size, path in entries:
+        if total <= max_bytes and mtime >= oldest:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def thumbnail_key(file_name, size=THUMBNAIL_SIZE):
+    """Cache key derived from path, file size and modification time."""
+    stat = os.stat(file_name)
+    text = '{}|{}|{}|{}'.format(os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns, size)
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+class ThumbnailSignals(QtCore.QObject):
+    """Signals for ThumbnailTask, QRunnable can not emit signals itself."""
+
+    ready = QtCore.pyqtSignal(str, str, QtGui.QImage)
+
+
+class PruneTask(QtCore.QRunnable):
+    """Trim the thumbnail cache on disk in the background."""
+
+    def __init__(self, directory):
+        """Class init function."""
+        QtCore.QRunnable.__init__(self)
+        self.directory = directory
+
+    def run(self):
+        """The starting point for the worker."""
+        try:
+            prune_thumbnail_cache(self.directory)
+        except OSError:
+            pass
+
+
+class ThumbnailTask(QtCore.QRunnable):
+    """Load a thumbnail from the disk cache or generate it."""
+
+    def __init__(self, directory, name, cache_directory, signals, size=THUMBNAIL_SIZE):
+        """Class init function."""
+        QtCore.QRunnable.__init__(self)
+        self.directory = directory
+        self.name = name
+        self.cache_directory = cache_directory
+        self.signals = signals
+        self.size = size
+
+    def run(self):
+        """The starting point for the worker."""
+        file_name = os.path.join(self.directory, self.name)
+        try:
+            cache_file = os.path.join(self.cache_directory, thumbnail_key(file_name, self.size) + '.jpg')
+            if os.path.exists(cache_file):
+                # Mark as recently used for pruning
+                os.utime(cache_file)
+            else:
+                img = Image.open(file_name)
+                # Let the JPEG decoder do most of the down sampling
+                img.draft('RGB', (self.size * 2, self.size * 2))
+                img = img.convert('RGB')
+                img.thumbnail((self.size, self.size))
+                img.save(cache_file + '.tmp', format='JPEG', quality=85)
+                img.close()
+                os.replace(cache_file + '.tmp', cache_file)
+            image = QtGui.QImage(cache_file)
+        except (OSError, ValueError):
+            image = QtGui.QImage()
+        self.signals.ready.emit(self.directory, self.name, image)
+
+
+class ThumbnailModel(QtCore.QAbstractListModel):
+    """List model that requests thumbnails only for the rows being shown."""
+
+    def __init__(self, parent=None):
+        """Class init function."""
+        QtCore.QAbstractListModel.__init__(self, parent)
+        self.directory = ''
+        self.images = []
+        self.rows = {}
+        self.pixmaps = OrderedDict()
+        self.pending = set()
+        self.cache_directory = thumbnail_cache_directory()
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max(2, QtCore.QThread.idealThreadCount() - 1))
+        self.signals = ThumbnailSignals()
+        self.signals.ready.connect(self.thumbnail_ready)
+        self.pool.start(PruneTask(self.cache_directory))
+
+    def append_images(self, images):
+        """Add images to the end of the list without resetting the view.
+
+        Args:
+            images (list): Image file names
+        """
+        if len(images) == 0:
+            return
+        first = len(self.images)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(images) - 1)
+        for row, name in enumerate(images, first):
+            self.images.append(name)
+            self.rows[name] = row
+        self.endInsertRows()
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        name = self.images[index.row()]
+        if role == QtCore.Qt.DecorationRole:
+            if name in self.pixmaps:
+                self.pixmaps.move_to_end(name)
+                return self.pixmaps[name]
+            if name not in self.pending:
+                self.pending.add(name)
+                task = ThumbnailTask(self.directory, name, self.cache_directory, self.signals)
+                self.pool.start(task)
+        elif role == QtCore.Qt.ToolTipRole:
+            return name
+        return None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.images)
+
+    def set_images(self, directory, images):
+        """Display a new image list.
+
+        Args:
+            directory (str): Directory holding the images
+            images (list): Image file names
+        """
+        self.beginResetModel()
+        if directory != self.directory:
+            self.pool.clear()
+            self.pixmaps.clear()
+            self.pending.clear()
+        self.directory = directory
+        self.images = list(images)
+        self.rows = {name: row for row, name in enumerate(self.images)}
+        self.endResetModel()
+
+    def thumbnail_ready(self, directory, name, image):
+        """(Slot) Store a finished thumbnail and refresh its row."""
+        if directory != self.directory:
+            return
+        self.pending.discard(name)
+        self.pixmaps[name] = QtGui.QPixmap.fromImage(image)
+        if len(self.pixmaps) > MEMORY_CACHE_SIZE:
+            self.pixmaps.popitem(last=False)
+        if name in self.rows:
+            index = self.index(self.rows[name])
+            self.dataChanged.emit(index, index, [QtCore.Qt.DecorationRole])
+
+
+class ThumbnailStrip(QtWidgets.QListView):
+    """Horizontal, virtualized strip of image thumbnails."""
+
+    image_selected = QtCore.pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        """Class init function."""
+        QtWidgets.QListView.__init__(self, parent)
+        self.thumbnail_model = ThumbnailModel(self)
+        self.setModel(self.thumbnail_model)
+        self.setViewMode(QtWidgets.QListView.IconMode)
+        self.setFlow(QtWidgets.QListView.LeftToRight)
+        self.setWrapping(False)
+        self.setMovement(QtWidgets.QListView.Static)
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QtWidgets.QListView.Batched)
+        self.setBatchSize(200)
+        self.setIconSize(QtCore.QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.setGridSize(QtCore.QSize(THUMBNAIL_SIZE + 8, THUMBNAIL_SIZE + 8))
+        self.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.setHorizontalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self.setFixedHeight(THUMBNAIL_SIZE + 8 + self.horizontalScrollBar().sizeHint().height() + 2 * self.frameWidth())
+        self.clicked.connect(self.thumbnail_clicked)
+
+    def set_current(self, row):
+        """Select and scroll to a thumbnail without emitting image_selected."""
+        index = self.thumbnail_model.index(row)
+        if index.isValid():
+            self.setCurrentIndex(index)
+            self.scrollTo(index, QtWidgets.QAbstractItemView.PositionAtCenter)
+
+    def append_images(self, images):
+        self.thumbnail_model.append_images(images)
+
+    def set_images(self, directory, images):
+        self.thumbnail_model.set_images(directory, images)
+
+    def thumbnail_clicked(self, index):
+        """(Slot) Report which image was picked."""
+        self.image_selected.emit(index.row())
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+from bisect import bisect_left, bisect_right, insort
+
+
+def box_labels(images, name):
+    """Label of every box of an image.
+
+    Binary annotation files answer from their index without loading
+    the image entry.
+    """
+    if hasattr(images, 'box_labels'):
+        return images.box_labels(name)
+    return [a['label'] for a in images[name]['annotations']]
+
+
+class ImageIndex():
+    """Incrementally maintained lookup of annotated images.
+
+    Positions refer to the index of an image in the image list the index
+    was built from. Each label maps to a sorted list of positions so
+    filtering and jumping between annotated images do not require a scan
+    of the annotation data.
+    """
+
+    def __init__(self):
+        """Class init function."""
+        self.positions = {}
+        self.image_labels = {}
+        self.labels = {}
+        self.annotated = []
+
+    def build(self, image_list, images):
+        """Rebuild the index.
+
+        Args:
+            image_list (list): Image file names in display order
+            images (dict): The images block of an annotation file
+        """
+        self.positions = {name: position for position, name in enumerate(image_list)}
+        self.image_labels = {}
+        self.labels = {}
+        self.annotated = []
+        for name in image_list:
+            if name not in images:
+                continue
+            labels = set(box_labels(images, name))
+            if labels:
+                position = self.positions[name]
+                self.image_labels[position] = labels
+                self.annotated.append(position)
+                for label in labels:
+                    self.labels.setdefault(label, []).append(position)
+
+    def images_with_label(self, label):
+        """Sorted positions of the images containing a label."""
+        return list(self.labels.get(label, []))
+
+    def next_annotated(self, position):
+        """Position of the first annotated image after position or None."""
+        index = bisect_right(self.annotated, position)
+        if index < len(self.annotated):
+            return self.annotated[index]
+        return None
+
+    def previous_annotated(self, position):
+        """Position of the last annotated image before position or None."""
+        index = bisect_left(self.annotated, position)
+        if index > 0:
+            return self.annotated[index - 1]
+        return None
+
+    def update(self, name, entry):
+        """Update the index after the annotations of an image changed.
+
+        Args:
+            name (str): Image file name
+            entry (dict): Annotation file entry for the image or None
+        """
+        if name not in self.positions:
+            return
+        position = self.positions[name]
+        old = self.image_labels.pop(position, set())
+        new = set()
+        if entry is not None:
+            new = set(a['label'] for a in entry['annotations'])
+        for label in old - new:
+            postings = self.labels[label]
+            del postings[bisect_left(postings, position)]
+            if not postings:
+                del self.labels[label]
+        for label in new - old:
+            insort(self.labels.setdefault(label, []), position)
+        if old and not new:
+            del self.annotated[bisect_left(self.annotated, position)]
+        elif new and not old:
+            insort(self.annotated, position)
+        if new:
+            self.image_labels[position] = new
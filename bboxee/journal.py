@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import json
+import shutil
+import hashlib
+import sqlite3
+from PyQt5 import QtCore
+from bboxee import schema
+from bboxee import binary_bbx
+from bboxee import project_db
+
+
+def journal_directory():
+    """Persistent directory used to store the journals of unsaved projects."""
+    location = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.GenericCacheLocation)
+    directory = os.path.join(location, 'bboxee', 'journals')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def untitled_name(image_directory):
+    """Stand in annotation file name for a project that has not been saved.
+
+    The name is derived from the image directory, so the journal can be
+    found again, and lives outside of it so nothing is written next to
+    the images until the user saves.
+    """
+    key = hashlib.sha1(os.path.abspath(image_directory).encode('utf8')).hexdigest()
+    return os.path.join(journal_directory(), key + '.bbx')
+
+
+def write_atomic(file_name, text):
+    """Write text to a temporary file and move it over the destination.
+
+    Args:
+        file_name (str): Destination file
+        text (str): Contents to write
+    """
+    tmp_name = file_name + '.tmp'
+    file = open(tmp_name, 'w')
+    file.write(text)
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+    os.replace(tmp_name, file_name)
+
+
+class Journal():
+    """Append-only log of the edits made to an annotation file.
+
+    Each line is a JSON record. Image level records carry the complete
+    entry for the image after the edit, so replaying is idempotent and
+    only the last record for an image matters. Saving writes a 'saved'
+    marker; records after the last marker are edits the user has not
+    saved.
+    """
+
+    def __init__(self, bbx_file):
+        """Class init function.
+
+        Args:
+            bbx_file (str): The annotation file the journal belongs to
+        """
+        self.bbx_file = bbx_file
+        self.file_name = bbx_file + '.journal'
+        self.compacting_name = self.file_name + '.compacting'
+        self.file = None
+        self.entries = 0
+
+    def append(self, op, image, entry, row=None):
+        """Record an edit to a single image.
+
+        Args:
+            op (str): Edit type, e.g., create, move, resize, delete, label
+            image (str): Image file name
+            entry (dict): Annotation file entry after the edit or None
+            row (int): Index of the annotation that was edited
+        """
+        self.write({'op': op, 'image': image, 'row': row, 'entry': entry})
+
+    def append_file(self, key, value):
+        """Record a change to a top level key of the annotation file."""
+        self.write({'op': 'file', 'key': key, 'value': value})
+
+    def append_drop(self, key):
+        """Record the removal of a top level key of the annotation file."""
+        self.write({'op': 'drop', 'key': key})
+
+    def clear(self):
+        """Discard all recorded edits."""
+        self.close()
+        for file_name in (self.file_name, self.compacting_name):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        self.entries = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def copy_to(self, journal):
+        """Make the recorded edits the rotated segment of another journal."""
+        self.rotate()
+        journal.clear()
+        if os.path.exists(self.compacting_name):
+            shutil.copyfile(self.compacting_name, journal.compacting_name)
+
+    def discard_rotated(self):
+        """Remove the segment that has been written into the .bbx file."""
+        if os.path.exists(self.compacting_name):
+            os.remove(self.compacting_name)
+
+    def mark_saved(self):
+        """Record that the user saved, all edits so far are kept."""
+        self.write({'op': 'saved'})
+        os.fsync(self.file.fileno())
+
+    def pending(self):
+        """Are there edits on disk that have not been compacted?"""
+        return os.path.exists(self.file_name) or os.path.exists(self.compacting_name)
+
+    def records(self, file_names=None):
+        """Read the recorded edits, oldest first.
+
+        Args:
+            file_names (list): Segments to read, defaults to all of them
+
+        Returns:
+            list: (segment, line, record) tuples
+        """
+        if file_names is None:
+            file_names = (self.compacting_name, self.file_name)
+        records = []
+        for file_name in file_names:
+            if not os.path.exists(file_name):
+                continue
+            file = open(file_name, 'r')
+            for line in file:
+                try:
+                    records.append((file_name, line, json.loads(line)))
+                except json.decoder.JSONDecodeError:
+                    # Partial line written when the application stopped
+                    break
+            file.close()
+        return records
+
+    def replay(self, data, file_names=None):
+        """Apply recorded edits to annotation data.
+
+        Args:
+            data (dict): Annotation file to update in place
+            file_names (list): Segments to replay, defaults to all of them
+
+        Returns:
+            int: Number of edits applied
+        """
+        count = 0
+        for _, _, record in self.records(file_names):
+            if record['op'] == 'saved':
+                continue
+            if record['op'] == 'file':
+                data[record['key']] = record['value']
+            elif record['op'] == 'drop':
+                data.pop(record['key'], None)
+            elif record['entry'] is None:
+                data['images'].pop(record['image'], None)
+            else:
+                data['images'][record['image']] = record['entry']
+            count += 1
+        return count
+
+    def rotate(self):
+        """Start a new segment so edits made while compacting are kept.
+
+        A segment left behind by a failed compaction is merged so no
+        edits are lost.
+        """
+        self.close()
+        if os.path.exists(self.file_name):
+            if os.path.exists(self.compacting_name):
+                src = open(self.file_name, 'r')
+                dst = open(self.compacting_name, 'a')
+                dst.write(src.read())
+                dst.close()
+                src.close()
+                os.remove(self.file_name)
+            else:
+                os.replace(self.file_name, self.compacting_name)
+        self.entries = 0
+
+    def truncate_unsaved(self):
+        """Discard the edits recorded after the last save."""
+        self.rotate()
+        lines = []
+        saved = 0
+        for _, line, record in self.records([self.compacting_name]):
+            lines.append(line)
+            if record['op'] == 'saved':
+                saved = len(lines)
+        if saved > 0:
+            write_atomic(self.compacting_name, ''.join(lines[:saved]))
+        else:
+            self.discard_rotated()
+
+    def unsaved(self):
+        """Number of edits recorded after the last save."""
+        count = 0
+        for _, _, record in self.records():
+            count = 0 if record['op'] == 'saved' else count + 1
+        return count
+
+    def write(self, record):
+        if self.file is None:
+            self.file = open(self.file_name, 'a')
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.entries += 1
+
+
+class Compactor(QtCore.QThread):
+    """Threaded worker to write the full annotation file in the background.
+
+    The file is rebuilt from the last written file and the rotated
+    journal segment, so the data being edited is never read from this
+    thread.
+    """
+
+    saved = QtCore.pyqtSignal(str)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self):
+        """Class init function."""
+        QtCore.QThread.__init__(self)
+        # (base file, journal, destination) tuples
+        self.jobs = []
+
+    def run(self):
+        """The starting point for the thread."""
+        for base_file, journal, file_name in self.jobs:
+            try:
+                if base_file is not None and os.path.exists(base_file):
+                    data = binary_bbx.load(base_file)
+                else:
+                    data = schema.annotation_file()
+                journal.replay(data, [journal.compacting_name])
+                write_atomic(file_name, binary_bbx.dumps(data))
+                self.update_mirrors(file_name, data)
+                journal.discard_rotated()
+                self.saved.emit(file_name)
+            except (OSError, ValueError) as error:
+                self.failed.emit(str(error))
+        self.jobs = []
+
+    def update_mirrors(self, file_name, data):
+        """Bring an existing binary companion and project database in
+        step with the JSON file."""
+        companion = binary_bbx.companion_name(file_name)
+        project = project_db.find_project(file_name)
+        try:
+            if os.path.exists(companion):
+                binary_bbx.write(data, companion, file_name)
+            if project is not None:
+                project_db.update_project(file_name, data)
+        except (OSError, sqlite3.Error):
+            # Stale mirrors are detected and refreshed when loading
+            pass
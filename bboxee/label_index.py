@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import re
+import operator
+import numpy as np
+
+TOKENS = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|(<=|>=|!=|==|<|>|=)|([^\s()<>=!"]+))')
+KEYWORDS = ('AND', 'OR', 'NOT')
+COMPARISONS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+               '=': operator.eq, '==': operator.eq, '!=': operator.ne}
+
+
+def tokenize(query):
+    """Split a query into (kind, value) tokens.
+
+    Kinds are '(', ')', 'op' for comparisons, 'keyword' and 'label'.
+    Adjacent bare words form one label so multi word labels do not
+    need quotes.
+    """
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = TOKENS.match(query, position)
+        if match is None or match.end() == position:
+            raise ValueError('Unexpected character at position {}: {}'.format(position, query[position:]))
+        position = match.end()
+        opening, closing, quoted, comparison, word = match.groups()
+        if opening:
+            tokens.append(('(', opening))
+        elif closing:
+            tokens.append((')', closing))
+        elif quoted is not None:
+            tokens.append(('label', re.sub(r'\\(.)', r'\1', quoted)))
+        elif comparison:
+            tokens.append(('op', comparison))
+        elif word.upper() in KEYWORDS:
+            tokens.append(('keyword', word.upper()))
+        elif len(tokens) > 0 and tokens[-1][0] == 'word':
+            tokens[-1] = ('word', tokens[-1][1] + ' ' + word)
+        else:
+            tokens.append(('word', word))
+    return [('label', value) if kind == 'word' else (kind, value) for kind, value in tokens]
+
+
+class LabelIndex(object):
+    """Inverted index from label to the images that contain it.
+
+    Images are numbered by their AnnotationStore index. Postings are
+    sorted arrays of image numbers, and queries are evaluated as boolean
+    masks over all images, so even complex queries over a whole project
+    take milliseconds.
+
+    Query syntax: labels, optionally in double quotes, combined with
+    AND, OR, NOT and parentheses, plus confidence comparisons such as
+    'confidence < 0.5', which match images with any box in that range.
+    For example: Bobcat AND NOT Human, (Deer OR Elk) AND confidence >= 0.8
+    """
+
+    def __init__(self, store, locations):
+        """Class init function.
+
+        Args:
+            store (AnnotationStore): annotations of every image
+            locations (dict): store image index to (bbx file, image name)
+        """
+        self.store = store
+        self.locations = locations
+        self.images = np.fromiter(sorted(locations), dtype=np.int64, count=len(locations))
+        self.size = len(store.entries)
+        rows = store.rows(self.images)
+        # Image that owns each row, and each row's label and confidence
+        self.owner = np.repeat(self.images, store.count[self.images])
+        self.confidence = store.confidence[rows]
+        codes = store.codes[rows, 0]
+        order = np.lexsort((self.owner, codes))
+        codes = codes[order]
+        owners = self.owner[order]
+        splits = np.flatnonzero(np.diff(codes)) + 1
+        self.postings = {}
+        for group in np.split(np.arange(codes.shape[0]), splits):
+            if group.shape[0] > 0:
+                label = store.categories[0][codes[group[0]]]
+                self.postings[label] = np.unique(owners[group])
+
+    def __contains__(self, label):
+        return label in self.postings
+
+    def labels(self):
+        return sorted(self.postings)
+
+    def images_with_label(self, label):
+        """Sorted image numbers containing label."""
+        return self.postings.get(label, np.zeros(0, dtype=np.int64))
+
+    def search(self, query):
+        """Evaluate a boolean query.
+
+        Args:
+            query (str): the query, see the class documentation
+
+        Returns:
+            list: (bbx file, image name) of the matching images
+
+        Raises:
+            ValueError: if the query can not be parsed
+        """
+        mask = self.evaluate(query)
+        return [self.locations[int(i)] for i in np.flatnonzero(mask) if int(i) in self.locations]
+
+    def evaluate(self, query):
+        """Return a boolean mask over store image indexes for query."""
+        tokens = tokenize(query)
+        if len(tokens) == 0:
+            raise ValueError('Empty query')
+        mask, position = self.parse_or(tokens, 0)
+        if position != len(tokens):
+            raise ValueError('Unexpected {} in query'.format(tokens[position][1]))
+        known = np.zeros(self.size, dtype=bool)
+        known[self.images] = True
+        return mask & known
+
+    def mask(self, images):
+        mask = np.zeros(self.size, dtype=bool)
+        mask[images] = True
+        return mask
+
+    def parse_or(self, tokens, position):
+        mask, position = self.parse_and(tokens, position)
+        while position < len(tokens) and tokens[position] == ('keyword', 'OR'):
+            right, position = self.parse_and(tokens, position + 1)
+            mask = mask | right
+        return mask, position
+
+    def parse_and(self, tokens, position):
+        mask, position = self.parse_not(tokens, position)
+        while position < len(tokens) and tokens[position] == ('keyword', 'AND'):
+            right, position = self.parse_not(tokens, position + 1)
+            mask = mask & right
+        return mask, position
+
+    def parse_not(self, tokens, position):
+        if position < len(tokens) and tokens[position] == ('keyword', 'NOT'):
+            mask, position = self.parse_not(tokens, position + 1)
+            return ~mask, position
+        return self.parse_term(tokens, position)
+
+    def parse_term(self, tokens, position):
+        if position >= len(tokens):
+            raise ValueError('Query ends unexpectedly')
+        kind, value = tokens[position]
+        if kind == '(':
+            mask, position = self.parse_or(tokens, position + 1)
+            if position >= len(tokens) or tokens[position][0] != ')':
+                raise ValueError('Missing closing parenthesis')
+            return mask, position + 1
+        if kind != 'label':
+            raise ValueError('Unexpected {} in query'.format(value))
+        following = tokens[position + 1] if position + 1 < len(tokens) else None
+        if value.lower() == 'confidence' and following is not None and following[0] == 'op':
+            if position + 2 >= len(tokens) or tokens[position + 2][0] != 'label':
+                raise ValueError('Expected a number after confidence {}'.format(following[1]))
+            try:
+                threshold = float(tokens[position + 2][1])
+            except ValueError:
+                raise ValueError('Expected a number, found {}'.format(tokens[position + 2][1]))
+            rows = COMPARISONS[following[1]](self.confidence, threshold)
+            return self.mask(self.owner[rows]), position + 3
+        if following is not None and following[0] == 'op':
+            raise ValueError('Only confidence can be compared, found {} {}'.format(value, following[1]))
+        return self.mask(self.images_with_label(value)), position + 1
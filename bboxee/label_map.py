@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import re
+import threading
+import numpy as np
+
+TOKENS = re.compile(r'''
+    (?P<space>\s+|\#[^\n]*)
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?P<number>[-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<symbol>[{}:;,])
+''', re.VERBOSE)
+
+CACHE = {}
+CACHE_LOCK = threading.Lock()
+
+
+def tokenize(text):
+    """Yield (kind, value) tokens of a protobuf text format label map."""
+    position = 0
+    while position < len(text):
+        match = TOKENS.match(text, position)
+        if match is None:
+            raise ValueError('Unexpected character {!r} at offset {}'.format(text[position], position))
+        position = match.end()
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+        value = match.group(kind)
+        if kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif kind == 'number':
+            value = float(value) if '.' in value or 'e' in value.lower() else int(value)
+        yield kind, value
+
+
+def parse(text):
+    """Parse label map text into a class id to label dictionary.
+
+    display_name is used when present, otherwise name.
+    """
+    label_map = {}
+    item = None
+    expect_value = None
+    for kind, value in tokenize(text):
+        if item is None:
+            if kind == 'name' and value == 'item':
+                continue
+            if kind == 'symbol' and value == '{':
+                item = {}
+                continue
+            raise ValueError('Expected item, found {!r}'.format(value))
+        if kind == 'symbol' and value == '}':
+            if 'id' not in item:
+                raise ValueError('Label map item without an id')
+            label_map[item['id']] = item.get('display_name', item.get('name'))
+            item = None
+        elif kind == 'symbol' and value in ':;,':
+            continue
+        elif expect_value is None:
+            expect_value = value
+        else:
+            item[expect_value] = value
+            expect_value = None
+    if item is not None:
+        raise ValueError('Unterminated label map item')
+    return label_map
+
+
+def read_label_map(file_name):
+    """Class id to label dictionary for a label map file.
+
+    Parsed maps are cached by path and modification time; callers get a
+    copy so they may change it freely.
+    """
+    path = os.path.abspath(file_name)
+    key = (path, os.stat(path).st_mtime_ns)
+    with CACHE_LOCK:
+        label_map = CACHE.get(key)
+    if label_map is None:
+        file = open(path, 'r')
+        label_map = parse(file.read())
+        file.close()
+        with CACHE_LOCK:
+            CACHE[key] = label_map
+    return dict(label_map)
+
+
+def lookup_table(label_map, unknown='unknown'):
+    """Dense class id to label array for vectorized class mapping.
+
+    The last element holds the unknown label; ids outside the table
+    should be mapped to it, see lookup().
+    """
+    size = max([int(k) for k in label_map.keys()] + [0]) + 1
+    table = np.full(size + 1, unknown, dtype=object)
+    for key, value in label_map.items():
+        table[int(key)] = value
+    return table
+
+
+def lookup(table, classes):
+    """Map an array of class numbers to labels with a lookup_table()."""
+    classes = np.asarray(classes).astype(np.int64)
+    classes[(classes < 0) | (classes >= len(table))] = len(table) - 1
+    return table[classes]
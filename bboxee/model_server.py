@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import sys
+import queue
+import secrets
+import importlib
+import threading
+import numpy as np
+from multiprocessing.connection import Listener, Client
+
+ADDRESS = ('localhost', 6107)
+MAX_BATCH = 8
+# Requests are pickled, only the user that started the server may connect
+KEY_DIRECTORY = os.path.join(os.path.expanduser('~'), '.bboxee')
+
+
+def key_file(address):
+    """Name of the file holding the authentication key of a server."""
+    return os.path.join(KEY_DIRECTORY, 'model_server_{}.key'.format(address[1]))
+
+
+def create_key(address):
+    """Generate a random key and store it in a file only the user can read.
+
+    Returns:
+        bytes: The new key
+    """
+    os.makedirs(KEY_DIRECTORY, mode=0o700, exist_ok=True)
+    os.chmod(KEY_DIRECTORY, 0o700)
+    key = secrets.token_bytes(32)
+    file_name = key_file(address)
+    tmp_name = file_name + '.tmp'
+    fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.fchmod(fd, 0o600)
+    except AttributeError:
+        # Not available on Windows, the directory is private to the user
+        pass
+    with os.fdopen(fd, 'wb') as file:
+        file.write(key)
+    os.replace(tmp_name, file_name)
+    return key
+
+
+def read_key(address):
+    """Read the key written by a running server.
+
+    Raises:
+        ConnectionRefusedError: if no server has written a key
+    """
+    try:
+        with open(key_file(address), 'rb') as file:
+            return file.read()
+    except FileNotFoundError:
+        raise ConnectionRefusedError('No model server key at {}'.format(key_file(address)))
+
+
+def pad_detections(array, count):
+    """Pad the detection axis of a boxes, scores or classes array to count."""
+    padding = [(0, 0)] * array.ndim
+    padding[1] = (0, count - array.shape[1])
+    return np.pad(array, padding)
+
+
+class LoadedModel(object):
+    """A warm model shared by every client of the server.
+
+    Requests from all connections go through one queue; the worker
+    merges waiting requests with the same image shape into a single
+    batch before calling the model. The model never gets more than
+    max_batch images at once, larger requests are split.
+    """
+
+    def __init__(self, annotator, max_batch=MAX_BATCH):
+        """Class init function."""
+        self.annotator = annotator
+        self.max_batch = max_batch
+        if annotator.batch_limit > 0:
+            # The model has a fixed batch dimension
+            self.max_batch = min(max_batch, annotator.batch_limit)
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def detect(self, batch):
+        """Queue a batch and wait for its detections."""
+        if len(batch) > self.max_batch:
+            parts = [self.detect(batch[i:i + self.max_batch]) for i in range(0, len(batch), self.max_batch)]
+            # Parts may be padded to different numbers of detections
+            count = max([p[1].shape[1] for p in parts])
+            return tuple(np.concatenate([pad_detections(a, count) for a in arrays]) for arrays in zip(*parts))
+        reply = queue.Queue(maxsize=1)
+        self.requests.put((batch, reply))
+        result = reply.get()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def work(self):
+        waiting = None
+        while True:
+            if waiting is None:
+                waiting = self.requests.get()
+            pending = [waiting]
+            waiting = None
+            size = len(pending[0][0])
+            shape = pending[0][0].shape[1:]
+            while size < self.max_batch:
+                try:
+                    request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request[0].shape[1:] != shape or size + len(request[0]) > self.max_batch:
+                    waiting = request
+                    break
+                pending.append(request)
+                size += len(request[0])
+            try:
+                batch = np.concatenate([r[0] for r in pending])
+                boxes, scores, classes = self.annotator.detect(batch)
+                start = 0
+                for images, reply in pending:
+                    end = start + len(images)
+                    reply.put((boxes[start:end], scores[start:end], classes[start:end]))
+                    start = end
+            except Exception as error:
+                for images, reply in pending:
+                    reply.put(error)
+
+
+class ModelServer(object):
+    """Long lived process that keeps models loaded for several clients.
+
+    Models are keyed by backend and constructor arguments, the first
+    client to ask for a model pays the load time.
+    """
+
+    def __init__(self, address=ADDRESS, max_batch=MAX_BATCH):
+        """Class init function."""
+        self.address = address
+        self.authkey = None
+        self.max_batch = max_batch
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def load(self, backend, args):
+        """Return the key of a loaded model, loading it if needed."""
+        key = '{}:{}'.format(backend, ':'.join([str(a) for a in args]))
+        with self.lock:
+            if key not in self.models:
+                module = importlib.import_module('bboxee.annotator.{}'.format(backend))
+                annotator = module.Annotator(*args)
+                annotator.load_model()
+                self.models[key] = LoadedModel(annotator, self.max_batch)
+        return key
+
+    def handle(self, connection):
+        """Serve one client until it disconnects."""
+        try:
+            while True:
+                message = connection.recv()
+                try:
+                    if message[0] == 'load':
+                        connection.send(('ok', self.load(message[1], message[2])))
+                    elif message[0] == 'detect':
+                        connection.send(('ok', self.models[message[1]].detect(message[2])))
+                    else:
+                        connection.send(('error', 'Unknown request: {}'.format(message[0])))
+                except Exception as error:
+                    connection.send(('error', '{}: {}'.format(type(error).__name__, error)))
+        except (EOFError, ConnectionResetError):
+            pass
+        connection.close()
+
+    def serve_forever(self):
+        self.authkey = create_key(self.address)
+        listener = Listener(self.address, backlog=16, authkey=self.authkey)
+        print('Model server listening on {}:{}'.format(*self.address))
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+
+class ModelClient(object):
+    """Connection to a running model server."""
+
+    def __init__(self, address=ADDRESS):
+        """Class init function, raises ConnectionRefusedError if no server is running."""
+        self.connection = Client(address, authkey=read_key(address))
+
+    def request(self, *message):
+        self.connection.send(message)
+        status, value = self.connection.recv()
+        if status != 'ok':
+            raise RuntimeError(value)
+        return value
+
+    def load(self, backend, args):
+        """Ask the server to load a model, returns its key."""
+        return self.request('load', backend, tuple(args))
+
+    def detect(self, key, batch):
+        """Run a batch of images through a loaded model."""
+        return self.request('detect', key, batch)
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        print('USAGE: python -m bboxee.model_server [PORT]')
+        sys.exit()
+    port = int(sys.argv[1]) if len(sys.argv) == 2 else ADDRESS[1]
+    ModelServer((ADDRESS[0], port)).serve_forever()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import time
+
+# Seconds between progress reports from worker threads
+PROGRESS_INTERVAL = 0.1
+
+
+class ProgressThrottle(object):
+    """Limit how often a worker thread reports progress to the GUI.
+
+    Every queued signal costs a trip through the GUI event loop and often
+    a repaint; reporting at a fixed rate keeps long runs from being bound
+    by the GUI.
+    """
+
+    def __init__(self, interval=PROGRESS_INTERVAL):
+        """Class init function."""
+        self.interval = interval
+        self.last = 0.0
+
+    def reset(self):
+        """Let the next report through immediately."""
+        self.last = 0.0
+
+    def ready(self, force=False):
+        """Return True if enough time has passed to report again."""
+        now = time.monotonic()
+        if force or now - self.last >= self.interval:
+            self.last = now
+            return True
+        return False
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import glob
+import json
+import sqlite3
+from bboxee import binary_bbx
+from bboxee.store import KEYS, BBOX_KEYS
+
+DB_NAME = 'bboxee_project.sqlite'
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, '
+    'folder TEXT NOT NULL, stamp TEXT, mask_name TEXT, mask TEXT, extra TEXT)',
+    'CREATE TABLE IF NOT EXISTS analysts (file_id INTEGER NOT NULL, position INTEGER NOT NULL, name TEXT)',
+    'CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, name TEXT NOT NULL, '
+    'attribution TEXT, license TEXT, license_url TEXT, extra TEXT)',
+    'CREATE TABLE IF NOT EXISTS annotations (id INTEGER PRIMARY KEY, image_id INTEGER NOT NULL, '
+    'label TEXT, confidence REAL, xmin REAL, ymin REAL, xmax REAL, ymax REAL, '
+    'occluded TEXT, truncated TEXT, difficult TEXT, created_by TEXT, updated_by TEXT, schema TEXT, extra TEXT)',
+    'CREATE INDEX IF NOT EXISTS files_folder ON files (folder)',
+    'CREATE INDEX IF NOT EXISTS analysts_file ON analysts (file_id)',
+    'CREATE INDEX IF NOT EXISTS analysts_name ON analysts (name)',
+    'CREATE INDEX IF NOT EXISTS images_file ON images (file_id)',
+    'CREATE INDEX IF NOT EXISTS annotations_image ON annotations (image_id)',
+    'CREATE INDEX IF NOT EXISTS annotations_label ON annotations (label)',
+    'CREATE INDEX IF NOT EXISTS annotations_confidence ON annotations (confidence)',
+    'CREATE INDEX IF NOT EXISTS annotations_created_by ON annotations (created_by)',
+    'CREATE INDEX IF NOT EXISTS annotations_updated_by ON annotations (updated_by)']
+
+# Image entry keys with their own column
+ENTRY_COLUMNS = ('attribution', 'license', 'license_url')
+# Annotation keys with their own column, bbox is split into coordinates
+ANNOTATION_COLUMNS = ('label', 'confidence', 'xmin', 'ymin', 'xmax', 'ymax', 'occluded',
+                      'truncated', 'difficult', 'created_by', 'updated_by', 'schema')
+# Keys kept by each files row
+FILE_KEYS = ('images', 'mask', 'mask_name', 'analysts')
+
+
+def find_project(path):
+    """Return the project directory whose database covers path, or None.
+
+    Args:
+        path (str): annotation file or directory inside the project
+    """
+    directory = os.path.abspath(path)
+    if not os.path.isdir(directory):
+        directory = os.path.dirname(directory)
+    while True:
+        if os.path.exists(os.path.join(directory, DB_NAME)):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def load(bbx_file):
+    """Load an annotation file from its project database when the
+    database mirrors the current file, otherwise from disk."""
+    project = find_project(bbx_file)
+    if project is not None:
+        database = ProjectDatabase(project)
+        try:
+            if database.is_current(bbx_file):
+                return database.read_file(bbx_file)
+        finally:
+            database.close()
+    return binary_bbx.load(bbx_file)
+
+
+def update_project(bbx_file, data):
+    """Mirror a saved annotation file into its project database, if any.
+
+    Returns:
+        bool: True if a project database was updated
+    """
+    project = find_project(bbx_file)
+    if project is None:
+        return False
+    database = ProjectDatabase(project)
+    try:
+        database.update_file(bbx_file, data)
+    finally:
+        database.close()
+    return True
+
+
+def split_extra(record, columns):
+    """Split a dict into column values and the JSON text of the other keys.
+
+    Missing keys become NULL; a value of None that is really present is
+    kept in the extra keys so it is not mistaken for a missing key.
+    """
+    values = []
+    extra = {k: v for k, v in record.items() if k not in columns}
+    for column in columns:
+        value = record.get(column)
+        if column in record and value is None:
+            extra[column] = None
+        values.append(value)
+    return values, (json.dumps(extra) if extra else None)
+
+
+class ProjectDatabase(object):
+    """SQLite mirror of all of the annotation files below a project directory.
+
+    Paths are stored relative to the project directory so the project
+    can be moved. Each connection belongs to the thread that created it.
+    """
+
+    def __init__(self, directory):
+        """Class init function.
+
+        Args:
+            directory (str): top level project directory, the database is created there
+        """
+        self.directory = os.path.abspath(directory)
+        self.file_name = os.path.join(self.directory, DB_NAME)
+        self.connection = sqlite3.connect(self.file_name)
+        # Let the GUI read while a background save writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def absolute(self, path):
+        """Absolute file name of a stored path."""
+        return os.path.join(self.directory, *path.split('/'))
+
+    def close(self):
+        self.connection.close()
+
+    def file_id(self, bbx_file):
+        row = self.connection.execute('SELECT id FROM files WHERE path = ?',
+                                      (self.relative(bbx_file),)).fetchone()
+        return None if row is None else row[0]
+
+    def files(self):
+        """Absolute names of all annotation files in the database."""
+        rows = self.connection.execute('SELECT path FROM files ORDER BY path')
+        return [self.absolute(row[0]) for row in rows]
+
+    def files_with_label(self, label):
+        """Return {file name: number of images} for files containing label."""
+        rows = self.connection.execute(
+            'SELECT f.path, COUNT(DISTINCT i.id) FROM annotations a '
+            'JOIN images i ON i.id = a.image_id JOIN files f ON f.id = i.file_id '
+            'WHERE a.label = ? GROUP BY f.id ORDER BY f.path', (label,))
+        return {self.absolute(path): count for path, count in rows}
+
+    def images_with_label(self, label, minimum_confidence=None):
+        """Return (file name, image name) pairs of images containing label."""
+        query = ('SELECT DISTINCT f.path, i.name FROM annotations a '
+                 'JOIN images i ON i.id = a.image_id JOIN files f ON f.id = i.file_id '
+                 'WHERE a.label = ?')
+        parameters = [label]
+        if minimum_confidence is not None:
+            query += ' AND a.confidence >= ?'
+            parameters.append(minimum_confidence)
+        rows = self.connection.execute(query + ' ORDER BY f.path, i.name', parameters)
+        return [(self.absolute(path), name) for path, name in rows]
+
+    def is_current(self, bbx_file):
+        """Does the database mirror the current contents of bbx_file?"""
+        row = self.connection.execute('SELECT stamp FROM files WHERE path = ?',
+                                      (self.relative(bbx_file),)).fetchone()
+        try:
+            return row is not None and json.loads(row[0]) == binary_bbx.source_stamp(bbx_file)
+        except OSError:
+            return False
+
+    def label_counts(self):
+        """Return {file name: {label: number of boxes}} for every file."""
+        counts = {self.absolute(path): {} for (path,) in self.connection.execute('SELECT path FROM files')}
+        rows = self.connection.execute(
+            'SELECT f.path, a.label, COUNT(*) FROM annotations a '
+            'JOIN images i ON i.id = a.image_id JOIN files f ON f.id = i.file_id '
+            'GROUP BY f.id, a.label')
+        for path, label, count in rows:
+            counts[self.absolute(path)][label] = count
+        return counts
+
+    def read_file(self, bbx_file):
+        """Rebuild an annotation file from the database.
+
+        Returns:
+            dict: the annotation file as it was last mirrored
+        """
+        file_id = self.file_id(bbx_file)
+        if file_id is None:
+            raise KeyError(bbx_file)
+        mask_name, mask, extra = self.connection.execute(
+            'SELECT mask_name, mask, extra FROM files WHERE id = ?', (file_id,)).fetchone()
+        extra = json.loads(extra) if extra else {}
+        data = {}
+        keys = extra.pop('keys', FILE_KEYS)
+        entries = {}
+        images = {}
+        rows = self.connection.execute('SELECT id, name, attribution, license, license_url, extra '
+                                       'FROM images WHERE file_id = ? ORDER BY id', (file_id,))
+        for row in rows:
+            entry = self.rebuild(ENTRY_COLUMNS, row[2:5], row[5])
+            entry['annotations'] = []
+            entries[row[0]] = entry
+            images[row[1]] = entry
+        columns = ', '.join(('a.' + c for c in ANNOTATION_COLUMNS))
+        rows = self.connection.execute('SELECT a.image_id, {}, a.extra FROM annotations a '
+                                       'JOIN images i ON i.id = a.image_id '
+                                       'WHERE i.file_id = ? ORDER BY a.id'.format(columns), (file_id,))
+        for row in rows:
+            values = dict(zip(ANNOTATION_COLUMNS, row[1:-1]))
+            extra_keys = json.loads(row[-1]) if row[-1] else {}
+            annotation = {}
+            for key in KEYS:
+                if key in extra_keys:
+                    annotation[key] = extra_keys.pop(key)
+                elif key == 'bbox':
+                    if values['xmin'] is not None:
+                        annotation['bbox'] = {k: values[k] for k in BBOX_KEYS}
+                elif values[key] is not None:
+                    annotation[key] = values[key]
+            annotation.update(extra_keys)
+            entries[row[0]]['annotations'].append(annotation)
+        analysts = [name for (name,) in self.connection.execute(
+            'SELECT name FROM analysts WHERE file_id = ? ORDER BY position', (file_id,))]
+        values = {'images': images,
+                  'mask': json.loads(mask) if mask is not None else None,
+                  'mask_name': mask_name,
+                  'analysts': analysts}
+        for key in keys:
+            data[key] = values[key] if key in FILE_KEYS else extra[key]
+        return data
+
+    def rebuild(self, columns, values, extra):
+        """Inverse of split_extra()."""
+        record = {c: v for c, v in zip(columns, values) if v is not None}
+        if extra:
+            record.update(json.loads(extra))
+        return record
+
+    def relative(self, bbx_file):
+        """Stored path of an annotation file, relative with / separators."""
+        path = os.path.relpath(os.path.abspath(bbx_file), self.directory)
+        return path.replace(os.path.sep, '/')
+
+    def remove_file(self, bbx_file):
+        """Drop an annotation file from the database."""
+        with self.connection:
+            self.delete_rows(self.file_id(bbx_file))
+
+    def delete_rows(self, file_id):
+        if file_id is None:
+            return
+        self.connection.execute('DELETE FROM annotations WHERE image_id IN '
+                                '(SELECT id FROM images WHERE file_id = ?)', (file_id,))
+        self.connection.execute('DELETE FROM images WHERE file_id = ?', (file_id,))
+        self.connection.execute('DELETE FROM analysts WHERE file_id = ?', (file_id,))
+        self.connection.execute('DELETE FROM files WHERE id = ?', (file_id,))
+
+    def sync(self, progress=None):
+        """Bring the database in line with the annotation files on disk.
+
+        Only files whose size or modification time changed are read.
+
+        Args:
+            progress (callable): called with (files checked, total files)
+
+        Returns:
+            tuple: number of files updated and removed
+        """
+        file_list = glob.glob(os.path.join(self.directory, '**', '*.bbx'), recursive=True)
+        stamps = {self.absolute(path): stamp
+                  for path, stamp in self.connection.execute('SELECT path, stamp FROM files')}
+        updated = 0
+        for count, bbx_file in enumerate(file_list):
+            stamp = binary_bbx.source_stamp(bbx_file)
+            if bbx_file not in stamps or json.loads(stamps[bbx_file]) != stamp:
+                self.update_file(bbx_file, binary_bbx.load(bbx_file))
+                updated += 1
+            if progress is not None:
+                progress(count + 1, len(file_list))
+        removed = set(stamps) - set(file_list)
+        for bbx_file in removed:
+            self.remove_file(bbx_file)
+        return (updated, len(removed))
+
+    def update_file(self, bbx_file, data):
+        """Replace the rows of one annotation file in a single transaction.
+
+        Args:
+            bbx_file (str): annotation file name, its size and time mark the rows as current
+            data (dict): the annotation file contents
+        """
+        path = self.relative(bbx_file)
+        folder = os.path.dirname(path)
+        extra = {k: v for k, v in data.items() if k not in FILE_KEYS}
+        if list(data.keys()) != list(FILE_KEYS):
+            extra['keys'] = list(data.keys())
+        mask = data.get('mask')
+        with self.connection:
+            self.delete_rows(self.file_id(bbx_file))
+            cursor = self.connection.execute(
+                'INSERT INTO files (path, folder, stamp, mask_name, mask, extra) VALUES (?, ?, ?, ?, ?, ?)',
+                (path, folder, json.dumps(binary_bbx.source_stamp(bbx_file)), data.get('mask_name'),
+                 json.dumps(mask) if mask is not None else None, json.dumps(extra) if extra else None))
+            file_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO analysts (file_id, position, name) VALUES (?, ?, ?)',
+                [(file_id, p, name) for p, name in enumerate(data.get('analysts', []))])
+            # Assign image ids here so the annotations can be inserted in bulk
+            image_id = self.connection.execute('SELECT COALESCE(MAX(id), 0) FROM images').fetchone()[0]
+            image_rows = []
+            annotation_rows = []
+            images = data['images']
+            for name in images:
+                image_id += 1
+                entry = images[name]
+                values, entry_extra = split_extra({k: v for k, v in entry.items() if k != 'annotations'},
+                                                  ENTRY_COLUMNS)
+                image_rows.append([image_id, file_id, name] + values + [entry_extra])
+                for annotation in entry['annotations']:
+                    record = dict(annotation)
+                    if 'bbox' in record and list(record['bbox']) == list(BBOX_KEYS):
+                        record.update(record.pop('bbox'))
+                    values, annotation_extra = split_extra(record, ANNOTATION_COLUMNS)
+                    annotation_rows.append([image_id] + values + [annotation_extra])
+            self.connection.executemany(
+                'INSERT INTO images (id, file_id, name, attribution, license, license_url, extra) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', image_rows)
+            self.connection.executemany(
+                'INSERT INTO annotations (image_id, {}, extra) VALUES (?, {}?)'.format(
+                    ', '.join(ANNOTATION_COLUMNS), '?, ' * len(ANNOTATION_COLUMNS)), annotation_rows)
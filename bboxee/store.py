@@ -0,0 +1,635 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+from collections.abc import MutableMapping, MutableSequence
+import numpy as np
+from bboxee import schema
+
+# Key order of an annotation block, used when rebuilding plain dicts
+KEYS = tuple(schema.annotation().keys())
+BBOX_KEYS = tuple(schema.annotation()['bbox'].keys())
+# Column of each coordinate in AnnotationStore.bbox
+COORDINATES = {'xmin': 0, 'ymin': 1, 'xmax': 2, 'ymax': 3}
+# String fields held as categorical codes, column order of AnnotationStore.codes
+CATEGORIES = ('label', 'created_by', 'updated_by', 'schema')
+# Y/N fields packed as bits in AnnotationStore.flags
+FLAGS = {'occluded': 1, 'truncated': 2, 'difficult': 4}
+# Bit of each schema key in AnnotationStore.present
+PRESENT = {key: 1 << i for i, key in enumerate(KEYS)}
+
+
+class Categories(object):
+    """Two way mapping between repeated strings and small integer codes."""
+
+    def __init__(self):
+        """Class init function."""
+        self.values = []
+        self.codes = {}
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+    def array(self):
+        """Return the values as an object array indexable by code."""
+        values = np.empty(len(self.values), dtype=object)
+        values[:] = self.values
+        return values
+
+    def code(self, value):
+        """Return the code for value, adding it if it is new."""
+        try:
+            return self.codes[value]
+        except KeyError:
+            self.codes[value] = len(self.values)
+            self.values.append(value)
+            return self.codes[value]
+
+
+class AnnotationStore(object):
+    """Columnar storage for the annotations of many images.
+
+    Coordinates and confidence live in float arrays, string fields are
+    categorical codes and the occluded/truncated/difficult flags are
+    packed into one byte per box. A bitmask per box records which schema
+    keys the block had, so blocks written by older versions come back
+    without the keys they lacked. Each image owns a contiguous run of
+    rows given by start and count. Replacing an image's annotations with
+    a longer list moves them to the end of the arrays; compact() reclaims
+    the abandoned rows.
+
+    Existing code can keep using the nested dict layout through
+    ImagesView, ImageView, AnnotationList and AnnotationView. Views
+    address rows directly, so an AnnotationView is only valid until the
+    annotations of its image are replaced.
+    """
+
+    def __init__(self, capacity=1024):
+        """Class init function."""
+        self.size = 0
+        self.bbox = np.zeros((capacity, 4), dtype=np.float64)
+        self.confidence = np.ones(capacity, dtype=np.float64)
+        self.codes = np.zeros((capacity, len(CATEGORIES)), dtype=np.int32)
+        self.flags = np.zeros(capacity, dtype=np.uint8)
+        self.present = np.zeros(capacity, dtype=np.uint16)
+        self.categories = [Categories() for _ in CATEGORIES]
+        # Keys outside of the schema and non Y/N flag values, by row
+        self.extra = {}
+        # Image metadata without the annotations; identical metadata is
+        # shared between images and copied before it is changed
+        self.entries = []
+        self.shared = {}
+        self.start = np.zeros(capacity // 4 + 1, dtype=np.int64)
+        self.count = np.zeros(capacity // 4 + 1, dtype=np.int64)
+
+    def __len__(self):
+        """Number of boxes that belong to an image."""
+        return int(self.count[:len(self.entries)].sum())
+
+    @property
+    def nbytes(self):
+        """Approximate size of the columns in bytes."""
+        return (self.bbox.nbytes + self.confidence.nbytes +
+                self.codes.nbytes + self.flags.nbytes + self.present.nbytes +
+                self.start.nbytes + self.count.nbytes)
+
+    def add_image(self, entry):
+        """Add an annotation file entry and return its image index.
+
+        Args:
+            entry (dict): image entry from schema.annotation_file_entry()
+        """
+        index = len(self.entries)
+        if index == self.start.shape[0]:
+            self.start = np.resize(self.start, max(index * 2, 16))
+            self.count = np.resize(self.count, max(index * 2, 16))
+        self.entries.append(self.metadata(entry))
+        self.start[index] = self.size
+        self.count[index] = 0
+        self.set_annotations(index, entry['annotations'])
+        return index
+
+    def add_images(self, images):
+        """Add the 'images' block of an annotation file.
+
+        Args:
+            images (dict): image name to image entry
+
+        Returns:
+            ImagesView: dict-like view of the added images
+        """
+        view = ImagesView(self)
+        for name in images:
+            view.indexes[name] = self.add_image(images[name])
+        return view
+
+    def annotation(self, row):
+        """Rebuild the annotation block stored in row as a plain dict."""
+        annotation = {}
+        extra = self.extra.get(row, {})
+        present = self.present[row]
+        for key in KEYS:
+            if key in extra:
+                annotation[key] = extra[key]
+            elif present & PRESENT[key]:
+                annotation[key] = self.get(row, key)
+        for key in extra:
+            if key not in annotation:
+                annotation[key] = extra[key]
+        return annotation
+
+    def annotations(self, index):
+        """Return the annotations of an image as plain dicts."""
+        return [self.annotation(row) for row in range(*self.span(index))]
+
+    def boxes(self, rows):
+        """Return the xmin, ymin, xmax, ymax columns for rows."""
+        return self.bbox[rows]
+
+    def compact(self):
+        """Drop rows no longer referenced by any image."""
+        images = len(self.entries)
+        rows = self.rows(range(images))
+        remap = {int(old): new for new, old in enumerate(rows) if int(old) in self.extra}
+        self.extra = {remap[old]: self.extra[old] for old in remap}
+        self.bbox = self.bbox[rows].copy()
+        self.confidence = self.confidence[rows].copy()
+        self.codes = self.codes[rows].copy()
+        self.flags = self.flags[rows].copy()
+        self.present = self.present[rows].copy()
+        self.size = rows.shape[0]
+        self.count = self.count[:images].copy()
+        self.start = np.zeros(images, dtype=np.int64)
+        if images > 0:
+            self.start[1:] = np.cumsum(self.count)[:-1]
+
+    def flagged(self, name, rows):
+        """Return a boolean array of the rows with flag name set to Y."""
+        return (self.flags[rows] & FLAGS[name]) != 0
+
+    def get(self, row, key):
+        """Return a single field of the annotation stored in row."""
+        if not self.has(row, key):
+            raise KeyError(key)
+        if key in COORDINATES:
+            return float(self.bbox[row, COORDINATES[key]])
+        if key == 'bbox':
+            return {k: float(self.bbox[row, COORDINATES[k]]) for k in BBOX_KEYS}
+        if key == 'confidence':
+            return float(self.confidence[row])
+        if key in FLAGS:
+            extra = self.extra.get(row, {})
+            if key in extra:
+                return extra[key]
+            return 'Y' if self.flags[row] & FLAGS[key] else 'N'
+        if key in CATEGORIES:
+            column = CATEGORIES.index(key)
+            return self.categories[column][self.codes[row, column]]
+        return self.extra[row][key]
+
+    def group_label_counts(self, indexes, groups, size, exclude=0):
+        """Count the boxes of each label per group of images.
+
+        Args:
+            indexes (np.array): image indexes
+            groups (np.array): group number of each image
+            size (int): number of groups
+            exclude (int): skip images with any of these flag bits set on a box
+
+        Returns:
+            np.array: (groups, labels) counts, columns are label codes
+        """
+        indexes = np.asarray(indexes, dtype=np.int64)
+        keep = (self.image_flags(indexes) & exclude) == 0
+        count = self.count[indexes]
+        rows = self.rows(indexes)
+        owner = np.repeat(groups, count)[np.repeat(keep, count)]
+        codes = self.codes[rows[np.repeat(keep, count)], 0]
+        labels = len(self.categories[0])
+        counts = np.bincount(owner * labels + codes, minlength=size * labels)
+        return counts.reshape(size, labels)
+
+    def has(self, row, key):
+        """Does the annotation stored in row have key?"""
+        if key in COORDINATES:
+            key = 'bbox'
+        if key in PRESENT:
+            return bool(self.present[row] & PRESENT[key])
+        return key in self.extra.get(row, {})
+
+    def image_any(self, indexes, values):
+        """Return, for each image, whether any of its rows is True.
+
+        Args:
+            indexes (list): image indexes
+            values (np.array): one boolean per row of self.rows(indexes)
+        """
+        indexes = np.asarray(indexes, dtype=np.int64)
+        owner = np.repeat(np.arange(indexes.shape[0]), self.count[indexes])
+        result = np.zeros(indexes.shape[0], dtype=bool)
+        np.logical_or.at(result, owner, values)
+        return result
+
+    def image_flags(self, indexes):
+        """Return, for each image, the flags set on any of its boxes."""
+        indexes = np.asarray(indexes, dtype=np.int64)
+        owner = np.repeat(np.arange(indexes.shape[0]), self.count[indexes])
+        result = np.zeros(indexes.shape[0], dtype=np.uint8)
+        np.bitwise_or.at(result, owner, self.flags[self.rows(indexes)])
+        return result
+
+    def label_counts(self, rows):
+        """Return a dict of label to number of boxes for rows."""
+        codes = self.codes[rows, 0]
+        counts = np.bincount(codes, minlength=len(self.categories[0]))
+        labels = self.categories[0]
+        return {labels[c]: int(counts[c]) for c in np.unique(codes)}
+
+    def labels(self, rows):
+        """Return the labels of rows as an object array."""
+        return self.categories[0].array()[self.codes[rows, 0]]
+
+    def metadata(self, entry):
+        """Return the shared metadata dict for an image entry."""
+        metadata = {k: v for k, v in entry.items() if k != 'annotations'}
+        try:
+            key = tuple(metadata.items())
+            return self.shared.setdefault(key, metadata)
+        except TypeError:
+            # Unhashable values, keep a private copy
+            return metadata
+
+    def reserve(self, rows):
+        """Make room for at least rows more annotations."""
+        needed = self.size + rows
+        capacity = self.confidence.shape[0]
+        if needed <= capacity:
+            return
+        capacity = max(capacity, 1024)
+        while capacity < needed:
+            capacity *= 2
+        self.bbox = np.resize(self.bbox, (capacity, 4))
+        self.confidence = np.resize(self.confidence, capacity)
+        self.codes = np.resize(self.codes, (capacity, len(CATEGORIES)))
+        self.flags = np.resize(self.flags, capacity)
+        self.present = np.resize(self.present, capacity)
+
+    def rows(self, indexes):
+        """Return the row numbers of all annotations of the given images."""
+        indexes = np.asarray(indexes, dtype=np.int64)
+        start = self.start[indexes]
+        count = self.count[indexes]
+        total = int(count.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64)
+        # Offset of each image's first row within the result
+        first = np.cumsum(count) - count
+        return np.repeat(start - first, count) + np.arange(total)
+
+    def set(self, row, key, value):
+        """Write a single field of the annotation stored in row."""
+        extra = self.extra.get(row)
+        if extra is not None and key in extra:
+            del extra[key]
+        if key in COORDINATES:
+            self.bbox[row, COORDINATES[key]] = value
+        elif key == 'bbox':
+            for k in value:
+                self.bbox[row, COORDINATES[k]] = value[k]
+        elif key == 'confidence':
+            self.confidence[row] = value
+        elif key in FLAGS and value in ('Y', 'N'):
+            if value == 'Y':
+                self.flags[row] |= FLAGS[key]
+            else:
+                self.flags[row] &= ~FLAGS[key] & 0xFF
+        elif key in CATEGORIES:
+            column = CATEGORIES.index(key)
+            self.codes[row, column] = self.categories[column].code(value)
+        else:
+            self.extra.setdefault(row, {})[key] = value
+        if row in self.extra and len(self.extra[row]) == 0:
+            del self.extra[row]
+        if key in COORDINATES:
+            key = 'bbox'
+        if key in PRESENT:
+            self.present[row] |= PRESENT[key]
+
+    def remove(self, row, key):
+        """Remove a field from the annotation stored in row."""
+        if not self.has(row, key) or key in COORDINATES:
+            raise KeyError(key)
+        extra = self.extra.get(row, {})
+        extra.pop(key, None)
+        if row in self.extra and len(extra) == 0:
+            del self.extra[row]
+        if key in PRESENT:
+            self.set(row, key, schema.annotation()[key])
+            self.present[row] &= ~PRESENT[key] & 0xFFFF
+            if key == 'confidence':
+                self.confidence[row] = np.nan
+
+    def set_annotations(self, index, annotations):
+        """Replace the annotations of an image.
+
+        Args:
+            index (int): image index returned by add_image()
+            annotations (list): annotation blocks or AnnotationViews
+        """
+        # Copy first, the new list may be a view of the rows being replaced
+        annotations = [dict(a) for a in annotations]
+        if len(annotations) > self.count[index]:
+            self.reserve(len(annotations))
+            self.start[index] = self.size
+            self.size += len(annotations)
+        start = int(self.start[index])
+        self.count[index] = len(annotations)
+        for row, annotation in enumerate(annotations, start):
+            self.write(row, annotation)
+
+    def span(self, index):
+        """Return the first row and the end row of an image."""
+        start = int(self.start[index])
+        return (start, start + int(self.count[index]))
+
+    def write(self, row, annotation):
+        """Store an annotation block in row.
+
+        Keys the block lacks get the schema defaults in the columns, so
+        labels and flags can be counted, but are not written back.
+        Missing confidence is NaN and matches no comparison.
+        """
+        self.extra.pop(row, None)
+        self.bbox[row] = 0.0
+        self.codes[row] = 0
+        self.flags[row] = 0
+        defaults = schema.annotation()
+        for key in KEYS:
+            if key not in annotation:
+                self.set(row, key, defaults[key])
+        self.present[row] = 0
+        for key in annotation:
+            self.set(row, key, annotation[key])
+        if 'confidence' not in annotation:
+            self.confidence[row] = np.nan
+
+
+def bbox_array(annotations):
+    """Return an (n, 4) xmin, ymin, xmax, ymax array for annotations.
+
+    Args:
+        annotations (list): annotation blocks or an AnnotationList
+    """
+    if isinstance(annotations, AnnotationList):
+        return annotations.boxes()
+    boxes = np.zeros((len(annotations), 4), dtype=np.float64)
+    for i, annotation in enumerate(annotations):
+        bbox = annotation['bbox']
+        boxes[i] = (bbox['xmin'], bbox['ymin'], bbox['xmax'], bbox['ymax'])
+    return boxes
+
+
+def iou_matrix(a, b):
+    """Return the intersection over union of every pair of boxes.
+
+    Args:
+        a (np.array): (n, 4) xmin, ymin, xmax, ymax array
+        b (np.array): (m, 4) xmin, ymin, xmax, ymax array
+
+    Returns:
+        np.array: (n, m) IoU matrix
+    """
+    xmin = np.maximum(a[:, None, 0], b[None, :, 0])
+    ymin = np.maximum(a[:, None, 1], b[None, :, 1])
+    xmax = np.minimum(a[:, None, 2], b[None, :, 2])
+    ymax = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.maximum(xmax - xmin, 0) * np.maximum(ymax - ymin, 0)
+    a_area = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    b_area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = a_area[:, None] + b_area[None, :] - intersection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union > 0, intersection / union, 0.0)
+
+
+class AnnotationView(MutableMapping):
+    """Dict-like view of one annotation block in an AnnotationStore."""
+
+    def __init__(self, store, row):
+        """Class init function."""
+        self.store = store
+        self.row = row
+
+    def __delitem__(self, key):
+        self.store.remove(self.row, key)
+
+    def __getitem__(self, key):
+        if key == 'bbox' and self.store.has(self.row, key):
+            return BBoxView(self.store, self.row)
+        try:
+            return self.store.get(self.row, key)
+        except KeyError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.store.annotation(self.row))
+
+    def __len__(self):
+        return len(self.store.annotation(self.row))
+
+    def __repr__(self):
+        return repr(self.store.annotation(self.row))
+
+    def __setitem__(self, key, value):
+        self.store.set(self.row, key, value)
+
+    def to_dict(self):
+        """Return the annotation block as a plain dict."""
+        return self.store.annotation(self.row)
+
+
+class BBoxView(MutableMapping):
+    """Dict-like view of the bbox block of an annotation."""
+
+    def __init__(self, store, row):
+        """Class init function."""
+        self.store = store
+        self.row = row
+
+    def __delitem__(self, key):
+        raise TypeError('bbox coordinates can not be removed')
+
+    def __getitem__(self, key):
+        return float(self.store.bbox[self.row, COORDINATES[key]])
+
+    def __iter__(self):
+        return iter(BBOX_KEYS)
+
+    def __len__(self):
+        return len(BBOX_KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __setitem__(self, key, value):
+        self.store.bbox[self.row, COORDINATES[key]] = value
+
+
+class AnnotationList(MutableSequence):
+    """List-like view of the annotations of one image.
+
+    Reads go straight to the store; changing the list rewrites the
+    image's annotations.
+    """
+
+    def __init__(self, store, index):
+        """Class init function."""
+        self.store = store
+        self.index = index
+
+    def __delitem__(self, i):
+        annotations = self.to_list()
+        del annotations[i]
+        self.store.set_annotations(self.index, annotations)
+
+    def __getitem__(self, i):
+        start, end = self.store.span(self.index)
+        if isinstance(i, slice):
+            return [AnnotationView(self.store, row) for row in range(start, end)[i]]
+        return AnnotationView(self.store, range(start, end)[i])
+
+    def __len__(self):
+        return int(self.store.count[self.index])
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+    def __setitem__(self, i, value):
+        annotations = self.to_list()
+        annotations[i] = value
+        self.store.set_annotations(self.index, annotations)
+
+    def boxes(self):
+        """Return the boxes of this image as an (n, 4) array."""
+        return self.store.bbox[slice(*self.store.span(self.index))]
+
+    def insert(self, i, value):
+        annotations = self.to_list()
+        annotations.insert(i, value)
+        self.store.set_annotations(self.index, annotations)
+
+    def to_list(self):
+        """Return the annotations as a list of plain dicts."""
+        return self.store.annotations(self.index)
+
+
+class ImageView(MutableMapping):
+    """Dict-like view of an annotation file entry in an AnnotationStore."""
+
+    def __init__(self, store, index):
+        """Class init function."""
+        self.store = store
+        self.index = index
+
+    def __delitem__(self, key):
+        if key == 'annotations':
+            raise TypeError('annotations can not be removed, set an empty list')
+        entry = dict(self.store.entries[self.index])
+        del entry[key]
+        self.store.entries[self.index] = entry
+
+    def __getitem__(self, key):
+        if key == 'annotations':
+            return AnnotationList(self.store, self.index)
+        return self.store.entries[self.index][key]
+
+    def __iter__(self):
+        yield from self.store.entries[self.index]
+        yield 'annotations'
+
+    def __len__(self):
+        return len(self.store.entries[self.index]) + 1
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __setitem__(self, key, value):
+        if key == 'annotations':
+            self.store.set_annotations(self.index, value)
+        else:
+            entry = dict(self.store.entries[self.index])
+            entry[key] = value
+            self.store.entries[self.index] = entry
+
+    def to_dict(self):
+        """Return the entry as plain dicts, ready for json.dump()."""
+        entry = dict(self.store.entries[self.index])
+        entry['annotations'] = self.store.annotations(self.index)
+        return entry
+
+
+class ImagesView(MutableMapping):
+    """Dict-like view of the 'images' block of an annotation file."""
+
+    def __init__(self, store):
+        """Class init function."""
+        self.store = store
+        self.indexes = {}
+
+    def __delitem__(self, name):
+        index = self.indexes.pop(name)
+        self.store.count[index] = 0
+
+    def __getitem__(self, name):
+        return ImageView(self.store, self.indexes[name])
+
+    def __iter__(self):
+        return iter(self.indexes)
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __setitem__(self, name, entry):
+        if name in self.indexes:
+            index = self.indexes[name]
+            self.store.entries[index] = self.store.metadata(entry)
+            self.store.set_annotations(index, entry['annotations'])
+        else:
+            self.indexes[name] = self.store.add_image(entry)
+
+    def image_indexes(self):
+        """Return the store indexes of these images, in iteration order."""
+        return np.fromiter(self.indexes.values(), dtype=np.int64, count=len(self.indexes))
+
+    def rows(self):
+        """Return the store rows of every annotation in these images."""
+        return self.store.rows(self.image_indexes())
+
+    def to_dict(self):
+        """Return the images as plain dicts, ready for json.dump()."""
+        return {name: ImageView(self.store, self.indexes[name]).to_dict() for name in self.indexes}
@@ -25,7 +25,9 @@
 import os
 import sys
 import json
+import queue
 import ntpath
+import threading
 import numpy as np
 from PIL import Image
 from tqdm import tqdm
@@ -33,6 +35,11 @@ from tqdm import tqdm
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 import tensorflow.compat.v1 as tf  # noqa: E402
 
+# The label map parser is shared with BBoxEE, import the module directly
+# so the bboxee package and its GUI dependencies are not needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bboxee'))
+from label_map import read_label_map  # noqa: E402
+
 # Usage check
 if len(sys.argv) != 5:
     print('USAGE: python3 annotate_frozen.py TOP_FOLDER MODEL LABEL_MAP CONFIDENCE')
@@ -43,7 +50,11 @@ PATH = sys.argv[1]
 MODEL = sys.argv[2]
 LABEL_MAP = sys.argv[3]
 THRESHOLD = float(sys.argv[4])
-
+# Images decoded in parallel and run through the model together
+DECODE_WORKERS = 4
+BATCH_SIZE = 8
+# Bounded so decoded frames do not pile up in memory
+QUEUE_SIZE = 2 * BATCH_SIZE
 
 # Helper functions so bboxee.schema does not have to be in pythonpath
 def annotation_file():
@@ -79,51 +90,117 @@ def annotation_block():
             'schema': '1.0.0'}
 
 
-def build_label_map(file_name):
-    # see if we can use this to eliminated the need for
-    # label_map_util dependency
-    a = open(file_name, 'r')
-    string = a.read()
-    a.close()
-    lines = string.split("\n")
-    parsed = ''
-    comma = ''
-    for line in lines:
-        if line == '':
-            pass
-        elif line.find('item') != -1:
-            parsed += '{'
-        elif line.find('}') != -1:
-            comma = ''
-            parsed += '},'
-        else:
-            parts = line.replace('\\', '').replace('\'', '"').split(':')
-            parsed += '{} "{}":{}'.format(comma, parts[0].lstrip(), parts[1])
-            comma = ','
-
-    string = "[{}]".format(parsed[0:-1])
-    j = json.loads(string)
-    label_map = {}
-    for entry in j:
-        if 'display_name' in entry:
-            label_map[entry['id']] = entry['display_name']
-        else:
-            label_map[entry['id']] = entry['name']
-    return label_map
+class Folder(object):
+    """Annotations collected for one folder while its images are in flight."""
 
+    def __init__(self, path, images):
+        self.path = path
+        self.images = images
+        self.remaining = len(images)
+        self.bbx_data = annotation_file()
+        self.bbx_data['analysts'].append('Machine Generated')
 
-# Find all of the folders containing images
-folders = []
-walk_data = os.walk(PATH)
-for dirpath, dirs, files in walk_data:
-    f = (lambda x: os.path.splitext(x)[1].lower() in FORMATS)
-    image_list = list(filter(f, files))
-    if len(image_list) > 0:
-        folders.append((dirpath, image_list))
 
-# Parse label map
-label_map = build_label_map(LABEL_MAP)
+def discover(folder_queue, path_queue):
+    """Walk the top folder and queue each image as soon as its folder is listed."""
+    for dirpath, dirs, files in os.walk(PATH):
+        f = (lambda x: os.path.splitext(x)[1].lower() in FORMATS)
+        image_list = sorted(filter(f, files))
+        if len(image_list) > 0:
+            folder = Folder(dirpath, image_list)
+            folder_queue.put(folder)
+            for img in image_list:
+                path_queue.put((folder, img))
+    for _ in range(DECODE_WORKERS):
+        path_queue.put(None)
+
+
+def decode(path_queue, frame_queue):
+    """Decode images, slow storage only blocks this worker."""
+    while True:
+        task = path_queue.get()
+        if task is None:
+            frame_queue.put(None)
+            break
+        folder, img = task
+        try:
+            image = Image.open(os.path.join(folder.path, img))
+            image_np = np.array(image)
+            image.close()
+        except (OSError, ValueError) as error:
+            print('Skipping [{}]: {}'.format(os.path.join(folder.path, img), error))
+            image_np = None
+        frame_queue.put((folder, img, image_np))
+
+
+def write(write_queue):
+    """Dump finished folders while inference continues on the next ones."""
+    while True:
+        folder = write_queue.get()
+        if folder is None:
+            break
+        bbx_file_name = '{}{}{}.bbx'.format(folder.path, os.path.sep, ntpath.split(folder.path)[1])
+        # Decode workers finish images out of order, keep the file stable
+        images = folder.bbx_data['images']
+        folder.bbx_data['images'] = {name: images[name] for name in sorted(images)}
+        bbxfile = open(bbx_file_name, 'w')
+        json.dump(folder.bbx_data, bbxfile)
+        bbxfile.close()
+
 
+def build_entry(boxes, scores, classes):
+    """Annotation file entry for the detections above the threshold."""
+    entry = annotation_file_entry()
+    for i in np.flatnonzero(scores >= THRESHOLD):
+        annotation = annotation_block()
+        annotation['created_by'] = 'machine'
+        annotation['confidence'] = float(scores[i])
+        bbox = boxes[i]
+        annotation['bbox']['xmin'] = float(bbox[1])
+        annotation['bbox']['xmax'] = float(bbox[3])
+        annotation['bbox']['ymin'] = float(bbox[0])
+        annotation['bbox']['ymax'] = float(bbox[2])
+        label = 'unknown'
+        if classes[i] in label_map:
+            label = label_map[classes[i]]
+        annotation['label'] = label
+        entry['annotations'].append(annotation)
+    return entry
+
+
+def next_batch(frame_queue, held, active):
+    """Collect up to BATCH_SIZE decoded frames of the same shape.
+
+    Returns the batch, the images that failed to decode, the frame held
+    back for the next batch and the number of decode workers that
+    finished while collecting.
+    """
+    batch = []
+    failed = []
+    finished = 0
+    if held is not None:
+        batch.append(held)
+        held = None
+    while len(batch) < BATCH_SIZE and finished < active:
+        try:
+            # Block only until the first frame arrives
+            item = frame_queue.get(block=len(batch) == 0 and len(failed) == 0)
+        except queue.Empty:
+            break
+        if item is None:
+            finished += 1
+        elif item[2] is None:
+            failed.append(item)
+        elif len(batch) > 0 and item[2].shape != batch[0][2].shape:
+            held = item
+            break
+        else:
+            batch.append(item)
+    return batch, failed, held, finished
+
+
+# Parse label map
+label_map = read_label_map(LABEL_MAP)
 
 # Create the detection graph and read in model
 detection_graph = tf.Graph()
@@ -132,62 +209,56 @@ with tf.io.gfile.GFile(MODEL, 'rb') as fid:
     serialized_graph = fid.read()
     graph_def.ParseFromString(serialized_graph)
 
-with detection_graph.as_default():
-    # Import graph
-    tf.import_graph_def(graph_def, name='')
-
-    # Begin processing loop
-    with tf.Session(graph=detection_graph) as sess:
-        image_tensor = (detection_graph.get_tensor_by_name('image_tensor:0'))
-        d_boxes = (detection_graph.get_tensor_by_name('detection_boxes:0'))
-        d_scores = (detection_graph.get_tensor_by_name('detection_scores:0'))
-        d_classes = (detection_graph.get_tensor_by_name('detection_classes:0'))
-        num_detections = (detection_graph.get_tensor_by_name('num_detections:0'))
-
-        # Loop through all of the folder with images and process each image
-        for index, (folder, images) in enumerate(folders):
-            print('Processing folder [{}] ({} of {})'.format(folder, str(index + 1), str(len(folders))))
-            bbx_file_name = '{}{}{}.bbx'.format(folder, os.path.sep, ntpath.split(folder)[1])
-            bbx_data = annotation_file()
-            bbx_data['analysts'].append('Machine Generated')
-
-            # Pass each image through model
-            for i in tqdm(range(len(images))):
-                img = images[i]
-                file_name = os.path.join(folder, img)
-                image = Image.open(file_name)
-                image_np = np.array(image)
-                image_np_expanded = np.expand_dims(image_np, axis=0)
-                image.close()
-                fd = {image_tensor: image_np_expanded}
-                (boxes, scores, classes, num) = sess.run([d_boxes,
-                                                         d_scores,
-                                                         d_classes,
-                                                         num_detections],
-                                                         feed_dict=fd)
-                boxes = np.squeeze(boxes)
-                scores = np.squeeze(scores)
-                classes = np.squeeze(classes)
-                entry = annotation_file_entry()
-                for i in range(len(scores)):
-                    if scores[i] >= THRESHOLD:
-                        annotation = annotation_block()
-                        annotation['created_by'] = 'machine'
-                        annotation['confidence'] = float(scores[i])
-                        bbox = boxes[i]
-                        annotation['bbox']['xmin'] = float(bbox[1])
-                        annotation['bbox']['xmax'] = float(bbox[3])
-                        annotation['bbox']['ymin'] = float(bbox[0])
-                        annotation['bbox']['ymax'] = float(bbox[2])
-                        label = 'unknown'
-                        if classes[i] in label_map:
-                            label = label_map[classes[i]]
-                        annotation['label'] = label
-                        entry['annotations'].append(annotation)
-                if len(entry['annotations']) > 0:
-                    bbx_data['images'][img] = entry
-
-            # Dump annotations
-            bbxfile = open(bbx_file_name, 'w')
-            json.dump(bbx_data, bbxfile)
-            bbxfile.close()
+# Start the pipeline: discovery -> decode workers -> inference -> writer
+folder_queue = queue.Queue()
+path_queue = queue.Queue(maxsize=QUEUE_SIZE * DECODE_WORKERS)
+frame_queue = queue.Queue(maxsize=QUEUE_SIZE)
+write_queue = queue.Queue(maxsize=QUEUE_SIZE)
+threads = [threading.Thread(target=discover, args=(folder_queue, path_queue), daemon=True)]
+for _ in range(DECODE_WORKERS):
+    threads.append(threading.Thread(target=decode, args=(path_queue, frame_queue), daemon=True))
+writer = threading.Thread(target=write, args=(write_queue,))
+for thread in threads + [writer]:
+    thread.start()
+
+try:
+    with detection_graph.as_default():
+        # Import graph
+        tf.import_graph_def(graph_def, name='')
+
+        # Begin processing loop
+        with tf.Session(graph=detection_graph) as sess:
+            image_tensor = (detection_graph.get_tensor_by_name('image_tensor:0'))
+            d_boxes = (detection_graph.get_tensor_by_name('detection_boxes:0'))
+            d_scores = (detection_graph.get_tensor_by_name('detection_scores:0'))
+            d_classes = (detection_graph.get_tensor_by_name('detection_classes:0'))
+
+            progress = tqdm(total=0, unit='image')
+            active = DECODE_WORKERS
+            held = None
+            while active > 0 or held is not None:
+                batch, failed, held, finished = next_batch(frame_queue, held, active)
+                active -= finished
+                # Grow the progress total as folders are discovered
+                while not folder_queue.empty():
+                    folder = folder_queue.get()
+                    progress.total += len(folder.images)
+                    progress.refresh()
+                if len(batch) > 0:
+                    fd = {image_tensor: np.stack([item[2] for item in batch])}
+                    (boxes, scores, classes) = sess.run([d_boxes, d_scores, d_classes], feed_dict=fd)
+                    for index, (folder, img, _) in enumerate(batch):
+                        entry = build_entry(boxes[index], scores[index], classes[index])
+                        if len(entry['annotations']) > 0:
+                            folder.bbx_data['images'][img] = entry
+                # Images that failed to decode were reported by the decoder
+                for folder, img, _ in batch + failed:
+                    folder.remaining -= 1
+                    if folder.remaining == 0:
+                        write_queue.put(folder)
+                progress.update(len(batch) + len(failed))
+            progress.close()
+finally:
+    # The writer is not a daemon, always let it finish and exit
+    write_queue.put(None)
+    writer.join()
@@ -33,17 +33,28 @@ from tqdm import tqdm
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 import tensorflow as tf  # noqa: E402
 
+# The label map parser and prefilter are shared with BBoxEE, import the
+# modules directly so the bboxee package and its GUI dependencies are not needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bboxee'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bboxee', 'annotator'))
+from label_map import read_label_map  # noqa: E402
+from prefilter import BackgroundPrefilter  # noqa: E402
+
 # Usage check
-if len(sys.argv) != 5:
-    print('USAGE: python3 annotate_saved.py TOP_FOLDER MODEL LABEL_MAP CONFIDENCE')
+if len(sys.argv) not in (5, 6):
+    print('USAGE: python3 annotate_saved.py TOP_FOLDER MODEL LABEL_MAP CONFIDENCE [PREFILTER]')
     print('EXAMPLE: python3 annotate_saved.py ../demo ../models/saved/ ../models/label_map.pbtxt 0.8')
+    print('EXAMPLE: python3 annotate_saved.py ../demo ../models/saved/ ../models/label_map.pbtxt 0.8 background')
     sys.exit()
 FORMATS = [".jpg", ".jpeg", ".png"]
 PATH = sys.argv[1]
 MODEL = sys.argv[2]
 LABEL_MAP = sys.argv[3]
 THRESHOLD = float(sys.argv[4])
-
+PREFILTER = sys.argv[5] if len(sys.argv) == 6 else 'none'
+if PREFILTER not in ('none', 'background'):
+    print('PREFILTER must be one of: none, background')
+    sys.exit()
 
 # Helper functions so bboxee.schema does not have to be in pythonpath
 def annotation_file():
@@ -79,50 +90,17 @@ def annotation_block():
             'schema': '1.0.0'}
 
 
-def build_label_map(file_name):
-    # see if we can use this to eliminated the need for
-    # label_map_util dependency
-    a = open(file_name, 'r')
-    string = a.read()
-    a.close()
-    lines = string.split("\n")
-    parsed = ''
-    comma = ''
-    for line in lines:
-        if line == '':
-            pass
-        elif line.find('item') != -1:
-            parsed += '{'
-        elif line.find('}') != -1:
-            comma = ''
-            parsed += '},'
-        else:
-            parts = line.replace('\\', '').replace('\'', '"').split(':')
-            parsed += '{} "{}":{}'.format(comma, parts[0].lstrip(), parts[1])
-            comma = ','
-
-    string = "[{}]".format(parsed[0:-1])
-    j = json.loads(string)
-    label_map = {}
-    for entry in j:
-        if 'display_name' in entry:
-            label_map[entry['id']] = entry['display_name']
-        else:
-            label_map[entry['id']] = entry['name']
-    return label_map
-
-
 # Find all of the folders containing images
 folders = []
 walk_data = os.walk(PATH)
 for dirpath, dirs, files in walk_data:
     f = (lambda x: os.path.splitext(x)[1].lower() in FORMATS)
-    image_list = list(filter(f, files))
+    image_list = sorted(filter(f, files))
     if len(image_list) > 0:
         folders.append((dirpath, image_list))
 
 # Parse label map
-label_map = build_label_map(LABEL_MAP)
+label_map = read_label_map(LABEL_MAP)
 
 # Load model
 model = tf.saved_model.load(MODEL)
@@ -133,12 +111,19 @@ for index, (folder, images) in enumerate(folders):
     bbx_file_name = '{}{}{}.bbx'.format(folder, os.path.sep, ntpath.split(folder)[1])
     bbx_data = annotation_file()
     bbx_data['analysts'].append('Machine Generated')
+    prefilter = None
+    if PREFILTER == 'background':
+        prefilter = BackgroundPrefilter()
+        bbx_data['prefiltered'] = []
 
     # Pass each image through model
     for i in tqdm(range(len(images))):
         img = images[i]
         file_name = os.path.join(folder, img)
-        image = Image.open(file_name)
+        if prefilter is not None and prefilter.is_empty(file_name):
+            # Record the skip so the filter can be checked later
+            bbx_data['prefiltered'].append(img)
+            continue
         image = Image.open(file_name)
         # the array based representation of the image will be
         # used later in order to prepare the result image with
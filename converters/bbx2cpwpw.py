@@ -25,15 +25,10 @@
 import os
 import sys
 import json
-import glob
-import pyodbc
 import datetime
 from PIL import Image
 from tqdm import tqdm
-
-if 'Microsoft Access Driver (*.mdb, *.accdb)' not in pyodbc.drivers():
-    print('No Microsoft Access Driver found.')
-    sys.exit(0)
+from cpwpw_db import open_backend, ImportEngine
 
 print('----------------------------------------------------------------------------')
 print('DO NOT RUN THIS SCRIPT ON YOUR MAIN DATABASE WITHOUT CREATING A BACKUP FIRST!')
@@ -41,13 +36,20 @@ print('-------------------------------------------------------------------------
 print()
 print()
 print('Example database path: c:\\database\\import-test.accdb')
+print('An SQLite copy of the database (.sqlite, .db) can be used for testing.')
 print()
 # Ask for database file and open
 database = input("Enter the path and file name of your database: ")
 try:
-    conn = pyodbc.connect('DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=' + database)
-    cur = conn.cursor()
-except pyodbc.Error:
+    backend = open_backend(database)
+    cur = backend.cursor
+except ImportError:
+    print('pyodbc is required for Access databases.')
+    sys.exit(0)
+except RuntimeError as error:
+    print(error)
+    sys.exit(0)
+except Exception:
     print('Unable to open database.')
     sys.exit(0)
 
@@ -122,50 +124,33 @@ if VISITID not in visit_id_list:
     sys.exit(0)
 
 # Get all image files
-files = glob.glob(IMAGE_PATH + '*')
 image_format = [".jpg", ".jpeg", ".png"]
-f = (lambda x: os.path.splitext(x)[1].lower() in image_format)
-image_list = list(filter(f, files))
-image_list = [os.path.basename(x) for x in image_list]
-image_list = sorted(image_list)
+image_list = sorted([e.name for e in os.scandir(IMAGE_PATH) if e.is_file() and os.path.splitext(e.name)[1].lower() in image_format])
+
 
-# Import data
-counter = 1
-for name in tqdm(image_list):
-    file_name = os.path.join(IMAGE_PATH, name)
-    img = Image.open(file_name)
-    exif = img.getexif()
-    img.close()
-    created = exif.get(36867)
-    if created is None:
-        timestamp = None
-    else:
-        timestamp = datetime.datetime.fromisoformat(created.replace(':', '-', 2))
-    cur.execute('INSERT INTO Photos (ImageNum, FileName, ImageDate, FilePath, VisitID) VALUES (?, ?, ?, ?, ?)', (counter, name, timestamp, IMAGE_PATH, VISITID))
-    conn.commit()
-    image_rec_id = float(cur.execute('SELECT @@Identity').fetchone()[0])
-    counter += 1
+def records():
+    """(ImageNum, FileName, ImageDate, annotations) for each image."""
+    for counter, name in enumerate(image_list, 1):
+        file_name = os.path.join(IMAGE_PATH, name)
+        img = Image.open(file_name)
+        exif = img.getexif()
+        img.close()
+        created = exif.get(36867)
+        if created is None:
+            timestamp = None
+        else:
+            timestamp = datetime.datetime.fromisoformat(created.replace(':', '-', 2))
+        annotations = None
+        if name in DATA['images']:
+            annotations = DATA['images'][name]['annotations']
+        yield (counter, name, timestamp, annotations)
 
-    if name in DATA['images']:
-        detections = {}
-        anno = DATA['images'][name]['annotations']
-        for a in anno:
-            bbox = a['bbox']
-            XLen = (bbox['xmax'] - bbox['xmin'])
-            YLen = (bbox['ymax'] - bbox['ymin'])
-            TagX = bbox['xmin'] + (XLen / 2.0)
-            TagY = bbox['ymin'] + (YLen / 2.0)
-            for obs in OBSID.keys():
-                cur.execute('INSERT INTO PhotoTags (TagX, TagY, XLen, YLen, ImageID, ObsID) values (?, ?, ?, ?, ?, ?)', (TagX, TagY, XLen, YLen, image_rec_id, OBSID[obs]))
-            if a['label'] not in detections:
-                detections[a['label']] = 1.0
-            else:
-                detections[a['label']] += 1.0
 
-        for d in detections.keys():
-            for obs in OBSID.keys():
-                cur.execute('INSERT INTO Detections (SpeciesID, Individuals, ObsID, ImageID) values (?, ?, ?, ?)', (SPECIES[d.lower()], detections[d], OBSID[obs], image_rec_id))
-    else:
-        for obs in OBSID.keys():
-            cur.execute('INSERT INTO Detections (SpeciesID, Individuals, ObsID, ImageID) values (?, ?, ?, ?)', (SPECIES['none'], 0.0, OBSID[obs], image_rec_id))
-    conn.commit()
+# Import data, one transaction per chunk of photos
+engine = ImportEngine(backend, VISITID, IMAGE_PATH, [OBSID[obs] for obs in OBSID], SPECIES)
+progress = tqdm(total=len(image_list))
+try:
+    engine.run(records(), progress.update)
+except backend.error as error:
+    print('Import failed, the current chunk was rolled back: {}'.format(error))
+progress.close()
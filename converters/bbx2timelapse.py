@@ -27,51 +27,63 @@ import json
 import ntpath
 import os
 import sys
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
 
-# Usage check
-if len(sys.argv) != 2:
-    print('USAGE: python3 bbx2timelapse.py ROOT_FOLDER')
-    print('EXAMPLE: python3 bbx2timelapse.py c:\\project\data')
-    sys.exit()
-base_path = sys.argv[1]
 
-# Find all of the .bbx files
-bbx_list = glob.glob(base_path + os.path.sep + '**/*.bbx', recursive=True)
-
-timelapse = {"images": [], "detection_categories": {}}
-categories = []
-
-# Open each .bbx file
-for bbx in bbx_list:
+def read_bbx(bbx, base_path):
+    """Convert the annotations in one .bbx file to megadetector like
+    entries, labels are resolved to categories by the caller."""
     base = ntpath.split(bbx)[0].replace(base_path + os.path.sep, '')
     base += os.path.sep
     base = base.replace('/', '\\')  # If processed on linux udpate sep
     file = open(bbx, 'r')
     data = json.load(file)
     file.close()
-    # Get all of the annotations in the .bbx file and convert them to
-    # a megadetector like json output for timelapse
+    entries = []
     for image in data['images']:
-        entry = {'file': base + image, 'detections': []}
+        detections = []
         for a in data['images'][image]['annotations']:
-            if a['label'] not in categories:
-                categories.append(a['label'])
-            detection = {'category': '', 'conf': 1.0, 'bbox': []}
-            if 'confidence' in a:
-                detection['conf'] = a['confidence']
-            detection['category'] = str(categories.index(a['label']) + 1)
-            detection['bbox'].append(a['bbox']['xmin'])
-            detection['bbox'].append(a['bbox']['ymin'])
-            detection['bbox'].append(a['bbox']['xmax'] - a['bbox']['xmin'])
-            detection['bbox'].append(a['bbox']['ymax'] - a['bbox']['ymin'])
-            entry['detections'].append(detection)
-        timelapse['images'].append(entry)
+            bbox = a['bbox']
+            detections.append((a['label'],
+                               a.get('confidence', 1.0),
+                               [bbox['xmin'], bbox['ymin'], bbox['xmax'] - bbox['xmin'], bbox['ymax'] - bbox['ymin']]))
+        entries.append((base + image, detections))
+    return entries
+
 
-# Build the detection category list
-for index, cat in enumerate(categories):
-    timelapse['detection_categories'][str(index + 1)] = cat
+if __name__ == '__main__':
+    # Usage check
+    if len(sys.argv) != 2:
+        print('USAGE: python3 bbx2timelapse.py ROOT_FOLDER')
+        print('EXAMPLE: python3 bbx2timelapse.py c:\\project\data')
+        sys.exit()
+    base_path = sys.argv[1]
 
-# Save the data
-file = open('timelapse.json', 'w')
-json.dump(timelapse, file, indent=4)
-file.close()
+    # Find all of the .bbx files
+    bbx_list = glob.glob(base_path + os.path.sep + '**/*.bbx', recursive=True)
+
+    # Category numbers in order of first appearance
+    categories = {}
+
+    # Parse the .bbx files in parallel and stream the converted images out
+    # in file order, so the output matches a serial run
+    file = open('timelapse.json', 'w')
+    file.write('{\n    "images": [')
+    separator = '\n'
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(read_bbx, bbx_list, [base_path] * len(bbx_list), chunksize=8)
+        for entries in results:
+            for name, detections in entries:
+                entry = {'file': name, 'detections': []}
+                for label, conf, bbox in detections:
+                    if label not in categories:
+                        categories[label] = str(len(categories) + 1)
+                    entry['detections'].append({'category': categories[label], 'conf': conf, 'bbox': bbox})
+                file.write(separator + textwrap.indent(json.dumps(entry, indent=4), ' ' * 8))
+                separator = ',\n'
+    file.write('\n    ],\n    "detection_categories": ')
+    detection_categories = {number: label for label, number in categories.items()}
+    file.write(textwrap.indent(json.dumps(detection_categories, indent=4), ' ' * 4).lstrip())
+    file.write('\n}')
+    file.close()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import sqlite3
+
+CHUNK_SIZE = 500
+
+
+class AccessBackend(object):
+    """Photo Warehouse Access database through pyodbc.
+
+    Backends expose connection, cursor and the error class of their
+    driver, so ImportEngine runs unchanged against Access or SQLite.
+    """
+
+    DRIVER = 'Microsoft Access Driver (*.mdb, *.accdb)'
+
+    def __init__(self, database):
+        import pyodbc
+        if self.DRIVER not in pyodbc.drivers():
+            raise RuntimeError('No Microsoft Access Driver found.')
+        self.error = pyodbc.Error
+        self.connection = pyodbc.connect('DRIVER={' + self.DRIVER + '};DBQ=' + database)
+        self.cursor = self.connection.cursor()
+        # Access sends one statement per row unless told otherwise,
+        # ImportEngine turns this off again if the driver rejects it
+        self.cursor.fast_executemany = True
+
+
+class SQLiteBackend(object):
+    """SQLite stand-in for the Photo Warehouse database."""
+
+    def __init__(self, database):
+        self.error = sqlite3.Error
+        # The import may be written from a worker thread
+        self.connection = sqlite3.connect(database, check_same_thread=False)
+        self.cursor = self.connection.cursor()
+
+
+def open_backend(database):
+    """Pick the backend from the database file extension."""
+    if database.lower().endswith(('.sqlite', '.sqlite3', '.db')):
+        return SQLiteBackend(database)
+    return AccessBackend(database)
+
+
+def create_schema(backend):
+    """Create the Photo Warehouse tables used by the importer, for an
+    empty SQLite stand-in database."""
+    statements = [
+        'CREATE TABLE IF NOT EXISTS Species (SpeciesID INTEGER PRIMARY KEY, CommonName TEXT)',
+        'CREATE TABLE IF NOT EXISTS Observers (ObserverID INTEGER PRIMARY KEY, LastName TEXT, FirstName TEXT)',
+        'CREATE TABLE IF NOT EXISTS StudyAreas (StudyAreaID INTEGER PRIMARY KEY, StudyAreaName TEXT)',
+        'CREATE TABLE IF NOT EXISTS CameraLocations (LocationID INTEGER PRIMARY KEY, StudyAreaID INTEGER, LocationName TEXT)',
+        'CREATE TABLE IF NOT EXISTS Visits (VisitID INTEGER PRIMARY KEY, LocationID INTEGER, VisitDate TEXT, VisitTypeID INTEGER)',
+        'CREATE TABLE IF NOT EXISTS Photos (ImageID INTEGER PRIMARY KEY, ImageNum INTEGER, FileName TEXT, ImageDate TIMESTAMP, FilePath TEXT, VisitID INTEGER)',
+        'CREATE TABLE IF NOT EXISTS PhotoTags (TagID INTEGER PRIMARY KEY, TagX REAL, TagY REAL, XLen REAL, YLen REAL, ImageID INTEGER, ObsID INTEGER)',
+        'CREATE TABLE IF NOT EXISTS Detections (DetectionID INTEGER PRIMARY KEY, SpeciesID INTEGER, Individuals REAL, ObsID INTEGER, ImageID INTEGER)']
+    for statement in statements:
+        backend.cursor.execute(statement)
+    backend.connection.commit()
+
+
+class ImportEngine(object):
+    """Insert photos, tags and detections a chunk at a time.
+
+    Each chunk is one transaction: the photos go in with executemany,
+    their keys come back with a single select on the visit, path and
+    image number range, and the tags and detections follow with one
+    executemany each.
+    """
+
+    def __init__(self, backend, visit_id, image_path, observers, species, chunk_size=CHUNK_SIZE):
+        """Class init function.
+
+        Args:
+            backend (object): AccessBackend or SQLiteBackend
+            visit_id (str): VisitID the photos belong to
+            image_path (str): FilePath stored with each photo
+            observers (list): ObsIDs every tag and detection is recorded for
+            species (dict): Lower case common name to SpeciesID
+            chunk_size (int): Photos per transaction
+        """
+        self.backend = backend
+        self.visit_id = visit_id
+        self.image_path = image_path
+        self.observers = observers
+        self.species = species
+        self.chunk_size = chunk_size
+
+    def imported(self):
+        """Names of the photos already committed for this visit and path,
+        used to resume an interrupted import."""
+        cursor = self.backend.cursor
+        cursor.execute('SELECT FileName FROM Photos WHERE VisitID = ? AND FilePath = ?', (self.visit_id, self.image_path))
+        return set([rec[0] for rec in cursor.fetchall()])
+
+    def photo_ids(self, first, last):
+        """Map ImageNum to ImageID for the photos of this import in a range."""
+        cursor = self.backend.cursor
+        cursor.execute('SELECT ImageNum, ImageID FROM Photos WHERE VisitID = ? AND FilePath = ? AND ImageNum BETWEEN ? AND ? ORDER BY ImageID',
+                       (self.visit_id, self.image_path, first, last))
+        return {int(rec[0]): float(rec[1]) for rec in cursor.fetchall()}
+
+    def import_chunk(self, chunk):
+        """Insert one chunk of (ImageNum, FileName, ImageDate, annotations)."""
+        cursor = self.backend.cursor
+        try:
+            photos = [(num, name, timestamp, self.image_path, self.visit_id) for num, name, timestamp, _ in chunk]
+            cursor.executemany('INSERT INTO Photos (ImageNum, FileName, ImageDate, FilePath, VisitID) VALUES (?, ?, ?, ?, ?)', photos)
+            numbers = [record[0] for record in chunk]
+            ids = self.photo_ids(min(numbers), max(numbers))
+            tags = []
+            detections = []
+            for num, name, timestamp, annotations in chunk:
+                image_rec_id = ids[num]
+                if annotations is None:
+                    for obs in self.observers:
+                        detections.append((self.species['none'], 0.0, obs, image_rec_id))
+                    continue
+                counts = {}
+                for a in annotations:
+                    bbox = a['bbox']
+                    XLen = (bbox['xmax'] - bbox['xmin'])
+                    YLen = (bbox['ymax'] - bbox['ymin'])
+                    TagX = bbox['xmin'] + (XLen / 2.0)
+                    TagY = bbox['ymin'] + (YLen / 2.0)
+                    for obs in self.observers:
+                        tags.append((TagX, TagY, XLen, YLen, image_rec_id, obs))
+                    counts[a['label']] = counts.get(a['label'], 0.0) + 1.0
+                for label in counts:
+                    for obs in self.observers:
+                        detections.append((self.species[label.lower()], counts[label], obs, image_rec_id))
+            if len(tags) > 0:
+                cursor.executemany('INSERT INTO PhotoTags (TagX, TagY, XLen, YLen, ImageID, ObsID) values (?, ?, ?, ?, ?, ?)', tags)
+            if len(detections) > 0:
+                cursor.executemany('INSERT INTO Detections (SpeciesID, Individuals, ObsID, ImageID) values (?, ?, ?, ?)', detections)
+            self.backend.connection.commit()
+        except Exception as error:
+            # Nothing of a failed chunk is kept, whatever the cause
+            self.backend.connection.rollback()
+            if isinstance(error, self.backend.error) and getattr(self.backend.cursor, 'fast_executemany', False):
+                # Some Access drivers reject parameter arrays, insert the
+                # chunk again one statement per row
+                self.backend.cursor.fast_executemany = False
+                self.import_chunk(chunk)
+            else:
+                raise
+
+    def run(self, records, progress=None):
+        """Import (ImageNum, FileName, ImageDate, annotations) records,
+        annotations is None for images without a .bbx entry.
+
+        Args:
+            records (iterable): Records, ImageNum must be unique within the import
+            progress (callable): Called with the number of photos in each finished chunk
+        """
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == self.chunk_size:
+                self.import_chunk(chunk)
+                if progress is not None:
+                    progress(len(chunk))
+                chunk = []
+        if len(chunk) > 0:
+            self.import_chunk(chunk)
+            if progress is not None:
+                progress(len(chunk))
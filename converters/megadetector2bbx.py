@@ -22,17 +22,26 @@
 # along with this software.  If not, see <http://www.gnu.org/licenses/>.
 #
 # --------------------------------------------------------------------------
+import os
+import sys
 import json
 import ntpath
-import sys
+import tempfile
+import collections
 
 # Usage check
-if len(sys.argv) != 3:
-    print('USAGE: python3 megadetector2bbx.py JSON_FILE CONFIDENCE')
+if len(sys.argv) not in (3, 4):
+    print('USAGE: python3 megadetector2bbx.py JSON_FILE CONFIDENCE [OUTPUT_ROOT]')
     print('EXAMPLE: python3 megadetector2bbx.py MDv4_1Output.json 0.8')
+    print('EXAMPLE: python3 megadetector2bbx.py MDv4_1Output.json 0.8 /data/camera_traps')
     sys.exit()
 FILE_NAME = sys.argv[1]
 CONF = float(sys.argv[2])
+# The bbx for folder a/b is written to OUTPUT_ROOT/a/b/b.bbx
+OUTPUT_ROOT = sys.argv[3] if len(sys.argv) == 4 else '.'
+CHUNK_SIZE = 1024 * 1024
+# Folder spill files kept open at once
+OPEN_FILES = 256
 
 
 # Helper functions so bboxee.schema does not have to be in pythonpath
@@ -69,64 +78,181 @@ def annotation_block():
             'schema': '1.0.0'}
 
 
-# Load the data
-file = open(FILE_NAME, 'r')
-data_in = json.load(file)
-file.close()
+class JsonStream(object):
+    """Incremental reader for a JSON object too large to load at once.
 
-# Find all of the base paths
-s = set()
-for image in data_in['images']:
-    s.add(ntpath.split(image['file'])[0])
-paths = list(s)
+    Top level values are decoded one at a time; the members of one array
+    can be streamed without holding the whole array in memory.
+    """
 
-# Display the list of paths and ask user which one to use
-for index, path in enumerate(paths):
-    print('{} {}'.format(str(index).ljust(5), path))
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
 
-index = 0
-if len(paths) > 1:
-    try:
-        index = int(input('Create bbx file for which path (0 - {}): '.format(len(paths) - 1)))
-    except ValueError:
-        print('"Invalid number...aborting')
-        sys.exit()
+    def fill(self):
+        """Read the next chunk, dropping what has been consumed."""
+        if self.eof:
+            return False
+        chunk = self.file.read(CHUNK_SIZE)
+        if chunk == '':
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
 
-if index < 0 or index > len(paths):
-    print('Index out of range...aborting')
-    sys.exit()
+    def peek(self):
+        """Next non whitespace character, '' at the end of the file."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                break
+        return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, characters):
+        character = self.peek()
+        if character == '' or character not in characters:
+            raise ValueError('Expected {} at offset {}'.format(characters, self.pos))
+        self.pos += 1
+        return character
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+                # A value ending at the buffer edge may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def members(self):
+        """Yield (key, stream) for each member of the top level object,
+        the caller must consume the value before asking for the next."""
+        self.expect('{')
+        if self.peek() == '}':
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                break
+
+    def items(self):
+        """Yield the members of an array one at a time."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                break
+
+
+def folder_path(base):
+    """Output folder for a MegaDetector base path, None if it leads outside OUTPUT_ROOT."""
+    drive, path = ntpath.splitdrive(base)
+    parts = [p for p in path.replace('\\', '/').split('/') if p not in ('', '.')]
+    directory = os.path.normpath(os.path.join(OUTPUT_ROOT, *parts))
+    root = os.path.abspath(OUTPUT_ROOT)
+    if os.path.commonpath([root, os.path.abspath(directory)]) != root:
+        return None
+    return directory
+
+
+class Spill(object):
+    """Per folder files holding converted entries until the end of the pass."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.folders = {}
+        self.handles = collections.OrderedDict()
+
+    def append(self, base, file_name, annotations):
+        if base not in self.folders:
+            self.folders[base] = os.path.join(self.directory, '{}.jsonl'.format(len(self.folders)))
+        handle = self.handles.pop(base, None)
+        if handle is None:
+            handle = open(self.folders[base], 'a')
+            if len(self.handles) >= OPEN_FILES:
+                self.handles.popitem(last=False)[1].close()
+        self.handles[base] = handle
+        handle.write(json.dumps([file_name, annotations]) + '\n')
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+
+
+decoder = json.JSONDecoder()
+labels = {}
+image_count = 0
+with tempfile.TemporaryDirectory() as spill_directory:
+    spill = Spill(spill_directory)
+
+    # Stream the images and route each one to its folder
+    file = open(FILE_NAME, 'r')
+    stream = JsonStream(file)
+    for key in stream.members():
+        if key == 'images':
+            for image in stream.items():
+                image_count += 1
+                base, file_name = ntpath.split(image['file'])
+                annotations = []
+                for detection in image.get('detections') or []:
+                    if detection['conf'] >= CONF:
+                        annotation = annotation_block()
+                        annotation['created_by'] = 'machine'
+                        annotation['confidence'] = detection['conf']
+                        # Categories may follow the images, resolved when writing
+                        annotation['label'] = detection['category']
+                        annotation['bbox']['xmin'] = detection['bbox'][0]
+                        annotation['bbox']['xmax'] = detection['bbox'][0] + detection['bbox'][2]
+                        annotation['bbox']['ymin'] = detection['bbox'][1]
+                        annotation['bbox']['ymax'] = detection['bbox'][1] + detection['bbox'][3]
+                        annotations.append(annotation)
+                if len(annotations) > 0:
+                    spill.append(base, file_name, annotations)
+        elif key == 'detection_categories':
+            labels = stream.value()
+        else:
+            stream.value()
+    file.close()
+    spill.close()
+    print('{} images read'.format(image_count))
+
+    # Write one bbx file per folder
+    for base, spill_name in spill.folders.items():
+        bbx = annotation_file()
+        bbx['analysts'].append('MegaDetetector')
+        file = open(spill_name, 'r')
+        for line in file:
+            file_name, annotations = json.loads(line)
+            for annotation in annotations:
+                annotation['label'] = labels[annotation['label']]
+            bbx['images'][file_name] = annotation_file_entry()
+            bbx['images'][file_name]['annotations'] = annotations
+        file.close()
 
-base_path = paths[index]
-
-# initialize the bbx object
-bbx = annotation_file()
-bbx['analysts'].append('MegaDetetector')
-labels = data_in['detection_categories']
-
-# Look through the images and convert bboxes to bbx format
-for image in data_in['images']:
-    base, file = ntpath.split(image['file'])
-    if base == base_path:
-        annotations = []
-        for detection in image['detections']:
-            if detection['conf'] >= CONF:
-                annotation = annotation_block()
-                annotation['created_by'] = 'machine'
-                annotation['confidence'] = detection['conf']
-                annotation['label'] = labels[detection['category']]
-                annotation['bbox']['xmin'] = detection['bbox'][0]
-                annotation['bbox']['xmax'] = detection['bbox'][0] + detection['bbox'][2]
-                annotation['bbox']['ymin'] = detection['bbox'][1]
-                annotation['bbox']['ymax'] = detection['bbox'][1] + detection['bbox'][3]
-                annotations.append(annotation)
-        if len(annotations) > 0:
-            bbx['images'][file] = annotation_file_entry()
-            bbx['images'][file]['annotations'] = annotations
-
-# Save the bbx file
-file_name = '{}.bbx'.format(ntpath.split(base_path)[1])
-file = open(file_name, 'w')
-json.dump(bbx, file, indent=4)
-file.close()
-print('{} has been created.'.format(file_name))
-print('Move the bbx file to {}.'.format(base_path))
+        directory = folder_path(base)
+        if directory is None:
+            print('Skipping {}, it is outside of {}'.format(base, OUTPUT_ROOT))
+            continue
+        os.makedirs(directory, exist_ok=True)
+        leaf = ntpath.split(base)[1] or 'images'
+        bbx_file_name = os.path.join(directory, '{}.bbx'.format(leaf))
+        file = open(bbx_file_name, 'w')
+        json.dump(bbx, file, indent=4)
+        file.close()
+        print('{} has been created.'.format(bbx_file_name))
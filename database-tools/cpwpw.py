@@ -24,52 +24,27 @@
 # --------------------------------------------------------------------------
 import os
 import sys
-import json
-import glob
-import pyodbc
+import queue
 import datetime
+import threading
 import numpy as np
 from PIL import Image
 from tqdm import tqdm
 import tensorflow as tf
 
+# The batched import engine is shared with the bbx2cpwpw converter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'converters'))
+from cpwpw_db import open_backend, ImportEngine  # noqa: E402
 
-def build_label_map(file_name):
-    # see if we can use this to eliminated the need for
-    # label_map_util dependency
-    a = open(file_name, 'r')
-    string = a.read()
-    a.close()
-    lines = string.split("\n")
-    parsed = ''
-    comma = ''
-    for line in lines:
-        if line == '':
-            pass
-        elif line.find('item') != -1:
-            parsed += '{'
-        elif line.find('}') != -1:
-            comma = ''
-            parsed += '},'
-        else:
-            parts = line.replace('\\', '').replace('\'', '"').split(':')
-            parsed += '{} "{}":{}'.format(comma, parts[0].lstrip(), parts[1])
-            comma = ','
-
-    string = "[{}]".format(parsed[0:-1])
-    j = json.loads(string)
-    label_map = {}
-    for entry in j:
-        if 'display_name' in entry:
-            label_map[entry['id']] = entry['display_name']
-        else:
-            label_map[entry['id']] = entry['name']
-    return label_map
+# The label map parser is shared with BBoxEE, import the module directly
+# so the bboxee package and its GUI dependencies are not needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bboxee'))
+from label_map import read_label_map  # noqa: E402
 
+# Images decoded ahead of the model and results waiting for the writer
+READ_WORKERS = 4
+QUEUE_SIZE = 16
 
-if 'Microsoft Access Driver (*.mdb, *.accdb)' not in pyodbc.drivers():
-    print('No Microsoft Access Driver found.')
-    sys.exit(0)
 
 print('----------------------------------------------------------------------------')
 print('DO NOT RUN THIS SCRIPT ON YOUR MAIN DATABASE WITHOUT CREATING A BACKUP FIRST!')
@@ -81,9 +56,15 @@ print()
 # Ask for database file and open
 database = input("Enter the path and file name of your database: ")
 try:
-    conn = pyodbc.connect('DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=' + database)
-    cur = conn.cursor()
-except pyodbc.Error:
+    backend = open_backend(database)
+    cur = backend.cursor
+except ImportError:
+    print('pyodbc is required for Access databases.')
+    sys.exit(0)
+except RuntimeError as error:
+    print(error)
+    sys.exit(0)
+except Exception:
     print('Unable to open database.')
     sys.exit(0)
 
@@ -99,7 +80,7 @@ if "none" not in SPECIES:
 # Ask for labelmap file
 label_map_file = input('Enter the path and file name of your label map: ')
 label_map_file = os.path.abspath(label_map_file)
-LABEL_MAP = build_label_map(label_map_file)
+LABEL_MAP = read_label_map(label_map_file)
 
 # Check species labels match
 print('Verifing species names...')
@@ -164,64 +145,126 @@ if VISITID not in visit_id_list:
     sys.exit(0)
 
 # Get all image files
-files = glob.glob(os.path.join(IMAGE_PATH, '*'))
 image_format = [".jpg", ".jpeg", ".png"]
-f = (lambda x: os.path.splitext(x)[1].lower() in image_format)
-image_list = list(filter(f, files))
-image_list = [os.path.basename(x) for x in image_list]
-image_list = sorted(image_list)
-
-# Import data
-counter = 1
-for name in tqdm(image_list):
-    file_name = os.path.join(IMAGE_PATH, name)
-    img = Image.open(file_name)
-    image_np = np.array(img)
-    exif = img.getexif()
-    img.close()
-    created = exif.get(36867)
-    if created is None:
-        timestamp = None
-    else:
-        timestamp = datetime.datetime.fromisoformat(created.replace(':', '-', 2))
-    cur.execute('INSERT INTO Photos (ImageNum, FileName, ImageDate, FilePath, VisitID) VALUES (?, ?, ?, ?, ?)', (counter, name, timestamp, IMAGE_PATH, VISITID))
-    conn.commit()
-    image_rec_id = float(cur.execute('SELECT @@Identity').fetchone()[0])
-    counter += 1
-
-    # Expand dimensions since the model expects images
-    # to have shape: [1, None, None, 3]
-    image_np_expanded = np.expand_dims(image_np, axis=0)
-    # Actual detection.
-    dets = MODEL(image_np_expanded)
-    scores = dets['detection_scores'][0].numpy()
-    boxes = dets['detection_boxes'][0].numpy()
-    classes = dets['detection_classes'][0].numpy()
-    detection = False
-    detections = {}
-    for index, score in enumerate(scores):
-        if score >= THRESHOLD:
-            detection = True
+image_list = []
+with os.scandir(IMAGE_PATH) as entries:
+    for entry in entries:
+        if os.path.splitext(entry.name)[1].lower() in image_format and entry.is_file():
+            image_list.append(entry.name)
+image_list.sort()
+
+
+def read_images(name_queue, frame_queue):
+    """Decode images and read their capture time ahead of the model."""
+    while True:
+        task = name_queue.get()
+        if task is None:
+            frame_queue.put(None)
+            break
+        counter, name = task
+        try:
+            img = Image.open(os.path.join(IMAGE_PATH, name))
+            image_np = np.array(img)
+            exif = img.getexif()
+            img.close()
+        except (OSError, ValueError) as error:
+            print('Skipping [{}]: {}'.format(name, error))
+            continue
+        created = exif.get(36867)
+        if created is None:
+            timestamp = None
+        else:
+            timestamp = datetime.datetime.fromisoformat(created.replace(':', '-', 2))
+        frame_queue.put((counter, name, timestamp, image_np))
+
+
+def feed(names, name_queue):
+    for task in names:
+        name_queue.put(task)
+    for _ in range(READ_WORKERS):
+        name_queue.put(None)
+
+
+def drain(record_queue):
+    """Records for the database writer until the end marker."""
+    while True:
+        record = record_queue.get()
+        if record is None:
+            break
+        yield record
+
+
+def write_records(engine, record_queue, progress, errors):
+    """Single database writer, one transaction per chunk of photos."""
+    try:
+        engine.run(drain(record_queue), progress.update)
+    except Exception as error:
+        errors.append(error)
+        # Keep draining so inference is not blocked on a full queue
+        for record in drain(record_queue):
+            pass
+
+
+# ImageNum follows the sorted image list, so a resumed import keeps its numbering
+engine = ImportEngine(backend, VISITID, IMAGE_PATH, [OBSID], SPECIES)
+done = engine.imported()
+names = [(counter, name) for counter, name in enumerate(image_list, 1) if name not in done]
+if len(done) > 0:
+    print('{} images already imported for this visit, resuming.'.format(len(image_list) - len(names)))
+
+name_queue = queue.Queue(maxsize=QUEUE_SIZE)
+frame_queue = queue.Queue(maxsize=QUEUE_SIZE)
+record_queue = queue.Queue(maxsize=QUEUE_SIZE * 4)
+progress = tqdm(total=len(names))
+errors = []
+threads = [threading.Thread(target=feed, args=(names, name_queue), daemon=True)]
+for _ in range(READ_WORKERS):
+    threads.append(threading.Thread(target=read_images, args=(name_queue, frame_queue), daemon=True))
+writer = threading.Thread(target=write_records, args=(engine, record_queue, progress, errors))
+for thread in threads + [writer]:
+    thread.start()
+
+# Run the model on decoded images as they arrive
+active = READ_WORKERS
+unknown_classes = set()
+try:
+    while active > 0:
+        item = frame_queue.get()
+        if item is None:
+            active -= 1
+            continue
+        counter, name, timestamp, image_np = item
+        # Expand dimensions since the model expects images
+        # to have shape: [1, None, None, 3]
+        image_np_expanded = np.expand_dims(image_np, axis=0)
+        # Actual detection.
+        dets = MODEL(image_np_expanded)
+        scores = dets['detection_scores'][0].numpy()
+        boxes = dets['detection_boxes'][0].numpy()
+        classes = dets['detection_classes'][0].numpy()
+        annotations = []
+        for index in np.flatnonzero(scores >= THRESHOLD):
+            class_id = int(classes[index])
+            if class_id not in LABEL_MAP:
+                # No species to record it under, report each class once
+                if class_id not in unknown_classes:
+                    unknown_classes.add(class_id)
+                    print('Skipping detections of class {}, it is not in the label map'.format(class_id))
+                continue
             bbox = boxes[index]
-            xmin = float(bbox[1])
-            xmax = float(bbox[3])
-            ymin = float(bbox[0])
-            ymax = float(bbox[2])
-            class_number = int(classes[index])
-            label = LABEL_MAP[class_number]
-            XLen = xmax - xmin
-            YLen = ymax - ymin
-            TagX = xmin + (XLen / 2.0)
-            TagY = ymin + (YLen / 2.0)
-            cur.execute('INSERT INTO PhotoTags (TagX, TagY, XLen, YLen, ImageID, ObsID) values (?, ?, ?, ?, ?, ?)', (TagX, TagY, XLen, YLen, image_rec_id, OBSID))
-            if label not in detections:
-                detections[label] = 1.0
-            else:
-                detections[label] += 1.0
-
-    if detection:
-        for d in detections.keys():
-            cur.execute('INSERT INTO Detections (SpeciesID, Individuals, ObsID, ImageID) values (?, ?, ?, ?)', (SPECIES[d.lower()], detections[d], OBSID, image_rec_id))
-    else:
-        cur.execute('INSERT INTO Detections (SpeciesID, Individuals, ObsID, ImageID) values (?, ?, ?, ?)', (SPECIES['none'], 0.0, OBSID, image_rec_id))
-    conn.commit()
+            annotations.append({'label': LABEL_MAP[class_id],
+                                'bbox': {'xmin': float(bbox[1]),
+                                         'xmax': float(bbox[3]),
+                                         'ymin': float(bbox[0]),
+                                         'ymax': float(bbox[2])}})
+        # Images without detections are recorded as 'None'
+        record_queue.put((counter, name, timestamp, annotations if len(annotations) > 0 else None))
+        if len(errors) > 0:
+            break
+finally:
+    # Let the writer commit what has been queued, even after an error
+    record_queue.put(None)
+    writer.join()
+    progress.close()
+if len(errors) > 0:
+    print('Import stopped, rerun to resume from the last committed image: {}'.format(errors[0]))
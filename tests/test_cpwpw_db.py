@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import sys
+import datetime
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'converters'))
+from cpwpw_db import SQLiteBackend, ImportEngine, create_schema  # noqa: E402
+
+
+def annotation(label, xmin, ymin, xmax, ymax):
+    return {'label': label, 'bbox': {'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax}}
+
+
+class ImportEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = SQLiteBackend(':memory:')
+        create_schema(self.backend)
+        self.species = {'none': 1, 'deer': 2, 'fox': 3}
+        self.engine = ImportEngine(self.backend, '7', '/images/', [11, 12], self.species, chunk_size=2)
+        self.records = [
+            (1, 'a.jpg', datetime.datetime(2021, 5, 1, 12, 0, 0),
+             [annotation('Deer', 0.1, 0.2, 0.3, 0.6), annotation('Deer', 0.5, 0.5, 0.7, 0.9),
+              annotation('Fox', 0.0, 0.0, 0.2, 0.2)]),
+            (2, 'b.jpg', None, None),
+            (3, 'c.jpg', datetime.datetime(2021, 5, 1, 12, 0, 5), [annotation('Fox', 0.2, 0.2, 0.4, 0.6)])]
+
+    def rows(self, statement):
+        return self.backend.cursor.execute(statement).fetchall()
+
+    def test_photos(self):
+        progress = []
+        self.engine.run(self.records, progress.append)
+        photos = self.rows('SELECT ImageNum, FileName, FilePath, VisitID FROM Photos ORDER BY ImageNum')
+        self.assertEqual(photos, [(1, 'a.jpg', '/images/', 7), (2, 'b.jpg', '/images/', 7), (3, 'c.jpg', '/images/', 7)])
+        self.assertEqual(progress, [2, 1])
+        self.assertEqual(self.engine.imported(), {'a.jpg', 'b.jpg', 'c.jpg'})
+
+    def test_tags(self):
+        self.engine.run(self.records)
+        ids = dict(self.rows('SELECT FileName, ImageID FROM Photos'))
+        tags = self.rows('SELECT TagX, TagY, XLen, YLen, ImageID, ObsID FROM PhotoTags WHERE ImageID = {}'.format(ids['c.jpg']))
+        self.assertEqual(len(tags), 2)
+        for tag_x, tag_y, x_len, y_len, image_id, obs in tags:
+            self.assertAlmostEqual(tag_x, 0.3)
+            self.assertAlmostEqual(tag_y, 0.4)
+            self.assertAlmostEqual(x_len, 0.2)
+            self.assertAlmostEqual(y_len, 0.4)
+        self.assertEqual(sorted([tag[5] for tag in tags]), [11, 12])
+        # One tag per box and observer
+        self.assertEqual(self.rows('SELECT COUNT(*) FROM PhotoTags')[0][0], 8)
+
+    def test_detections(self):
+        self.engine.run(self.records)
+        ids = dict(self.rows('SELECT FileName, ImageID FROM Photos'))
+        detections = self.rows('SELECT ImageID, SpeciesID, Individuals, ObsID FROM Detections ORDER BY ImageID, SpeciesID, ObsID')
+        self.assertEqual(detections, [(ids['a.jpg'], 2, 2.0, 11), (ids['a.jpg'], 2, 2.0, 12),
+                                      (ids['a.jpg'], 3, 1.0, 11), (ids['a.jpg'], 3, 1.0, 12),
+                                      (ids['b.jpg'], 1, 0.0, 11), (ids['b.jpg'], 1, 0.0, 12),
+                                      (ids['c.jpg'], 3, 1.0, 11), (ids['c.jpg'], 3, 1.0, 12)])
+
+    def test_failed_chunk_rolls_back(self):
+        records = self.records + [(4, 'd.jpg', None, [annotation('Bear', 0.1, 0.1, 0.2, 0.2)])]
+        with self.assertRaises(KeyError):
+            self.engine.run(records)
+        # The first chunk was committed, the failing one left nothing behind
+        self.assertEqual(self.engine.imported(), {'a.jpg', 'b.jpg'})
+
+
+if __name__ == '__main__':
+    unittest.main()
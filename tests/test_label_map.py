@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import tempfile
+import unittest
+
+from bboxee.label_map import parse, read_label_map
+
+
+class LabelMapTest(unittest.TestCase):
+
+    def test_display_name(self):
+        text = """
+        # MegaDetector classes
+        item {
+            id: 1
+            name: 'animal'
+        }
+        item { id: 2 name: "person" display_name: "Person" }
+        """
+        self.assertEqual(parse(text), {1: 'animal', 2: 'Person'})
+
+    def test_brace_in_string(self):
+        text = """
+        item {
+            id: 1
+            name: "deer {young}"
+        }
+        item {
+            id: 2
+            name: 'fox'
+        }
+        """
+        self.assertEqual(parse(text), {1: 'deer {young}', 2: 'fox'})
+
+    def test_hash_in_string(self):
+        text = """
+        item {
+            id: 1
+            name: "trap #4 \\"north\\""  # camera location
+        }
+        """
+        self.assertEqual(parse(text), {1: 'trap #4 "north"'})
+
+    def test_unterminated_item(self):
+        self.assertRaises(ValueError, parse, 'item { id: 1 name: "deer"')
+
+    def test_read_label_map(self):
+        file = tempfile.NamedTemporaryFile('w', suffix='.pbtxt', delete=False)
+        file.write('item { id: 3 name: "bear" }\n')
+        file.close()
+        try:
+            label_map = read_label_map(file.name)
+            label_map[3] = 'changed'
+            self.assertEqual(read_label_map(file.name), {3: 'bear'})
+        finally:
+            os.remove(file.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+
+from bboxee.annotator.prefilter import BackgroundPrefilter
+
+
+class BackgroundPrefilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.rng = np.random.default_rng(0)
+        self.scene = np.tile(np.linspace(60, 140, 640), (480, 1))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def frame(self, name, animal=False):
+        pixels = self.scene + self.rng.normal(0, 2, self.scene.shape)
+        if animal:
+            pixels[200:320, 300:460] = 230
+        file_name = os.path.join(self.directory, name)
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).convert('RGB').save(file_name)
+        return file_name
+
+    def test_empty_frames(self):
+        prefilter = BackgroundPrefilter()
+        flags = [prefilter.is_empty(self.frame('{}.jpg'.format(i))) for i in range(6)]
+        # The first frames build the background
+        self.assertEqual(flags, [False, False, True, True, True, True])
+
+    def test_stationary_animal(self):
+        prefilter = BackgroundPrefilter()
+        for i in range(3):
+            prefilter.is_empty(self.frame('empty_{}.jpg'.format(i)))
+        # An animal standing still for longer than the history
+        flags = [prefilter.is_empty(self.frame('animal_{}.jpg'.format(i), True)) for i in range(10)]
+        self.assertEqual(flags, [False] * 10)
+        # The background is still the empty scene once it leaves
+        self.assertTrue(prefilter.is_empty(self.frame('after.jpg')))
+
+    def test_reset(self):
+        prefilter = BackgroundPrefilter()
+        for i in range(3):
+            prefilter.is_empty(self.frame('{}.jpg'.format(i)))
+        prefilter.reset()
+        self.assertFalse(prefilter.is_empty(self.frame('next.jpg')))
+
+
+if __name__ == '__main__':
+    unittest.main()
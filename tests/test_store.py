@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import os
+import json
+import unittest
+
+from bboxee.store import AnnotationStore
+
+DEMO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'demo')
+
+
+class AnnotationStoreTest(unittest.TestCase):
+
+    def test_demo_round_trip(self):
+        for folder in ('2020-01-01', '2020-01-02'):
+            file = open(os.path.join(DEMO, folder, 'demo.bbx'), 'r')
+            data = json.load(file)
+            file.close()
+            images = AnnotationStore().add_images(data['images'])
+            self.assertEqual(images.to_dict(), data['images'])
+
+    def test_missing_keys(self):
+        block = {'bbox': {'xmin': 0.1, 'xmax': 0.5, 'ymin': 0.2, 'ymax': 0.6},
+                 'label': 'Deer'}
+        images = AnnotationStore().add_images({'a.jpg': {'annotations': [block]}})
+        annotation = images['a.jpg']['annotations'][0]
+        self.assertNotIn('confidence', annotation)
+        self.assertEqual(annotation.to_dict(), block)
+        annotation['confidence'] = 0.4
+        self.assertEqual(annotation['confidence'], 0.4)
+        del annotation['confidence']
+        self.assertEqual(annotation.to_dict(), block)
+
+    def test_missing_confidence_query(self):
+        blocks = [{'label': 'Deer'}, {'label': 'Deer', 'confidence': 0.3}]
+        store = AnnotationStore()
+        store.add_images({'a.jpg': {'annotations': blocks}})
+        self.assertEqual(list(store.confidence[:2] < 0.5), [False, True])
+        self.assertEqual(list(store.confidence[:2] >= 0.5), [False, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
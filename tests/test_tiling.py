@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# Bounding Box Editor and Exporter (BBoxEE)
+# Author: Peter Ersts (ersts@amnh.org)
+#
+# --------------------------------------------------------------------------
+#
+# This file is part of Animal Detection Network's (Andenet)
+# Bounding Box Editor and Exporter (BBoxEE)
+#
+# BBoxEE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BBoxEE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# --------------------------------------------------------------------------
+import unittest
+import numpy as np
+
+from bboxee.annotator.tiling import non_max_suppression
+
+
+class NonMaxSuppressionTest(unittest.TestCase):
+
+    def test_chain(self):
+        # b overlaps a and c, a and c do not overlap; greedy keeps a and c
+        boxes = np.array([[0.0, 0.0, 0.2, 0.2],
+                          [0.0, 0.05, 0.2, 0.25],
+                          [0.0, 0.1, 0.2, 0.3]])
+        scores = np.array([0.9, 0.8, 0.7])
+        classes = np.ones(3)
+        keep = non_max_suppression(boxes, scores, classes, 0.4)
+        self.assertEqual(keep.tolist(), [0, 2])
+
+    def test_classes(self):
+        boxes = np.array([[0.1, 0.1, 0.5, 0.5], [0.1, 0.1, 0.5, 0.5], [0.1, 0.1, 0.5, 0.5]])
+        scores = np.array([0.5, 0.9, 0.7])
+        classes = np.array([1, 1, 2])
+        keep = non_max_suppression(boxes, scores, classes, 0.5)
+        self.assertEqual(keep.tolist(), [1, 2])
+
+    def test_empty(self):
+        keep = non_max_suppression(np.zeros((0, 4)), np.zeros(0), np.zeros(0))
+        self.assertEqual(len(keep), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()